@@ -1,7 +1,17 @@
+from types import MappingProxyType
+
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from initFiles import initFiles
-import logging
+from utils.file_manager import precargar, recuperar, flush_stats, bloqueo_stats
+from utils.bloqueos import estadisticas_cuentas
+from utils.idempotencia import almacen as idempotencia
+from utils import asincrono
+from utils.auth import autenticar, estadisticas_tokens
+from utils import admision
+from utils.logger import configurar_logging, get_logger
+from models.Cliente import Cliente
 
 # Importar rutas
 from routes.auth import auth_bp
@@ -12,19 +22,39 @@ from routes.dashboard import dashboard_bp
 from routes.payments import payments_bp
 
 
-app = Flask(__name__)
+class JSONBanco(DefaultJSONProvider):
+    """Serializa también las vistas de solo lectura del caché (MappingProxyType)"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, MappingProxyType):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
+
+
+class BancoFlask(Flask):
+    """Flask con soporte de vistas async sin asgiref (ver utils/asincrono.py y asgi.py)"""
+
+    json_provider_class = JSONBanco
+
+    def async_to_sync(self, func):
+        return asincrono.a_sincrono(func)
+
+
+app = BancoFlask(__name__)
 # Desactivar strict_slashes para que /api/accounts y /api/accounts/ funcionen igual
 app.url_map.strict_slashes = False
-# Configurar logging global para ver errores en consola
-logging.basicConfig(level=logging.DEBUG)
+# Configurar logging (perfil y niveles por módulo desde variables de entorno)
+configurar_logging()
+log = get_logger('app')
 
 # Configurar CORS para permitir peticiones desde el frontend
 CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000", "http://localhost:3001", "http://localhost:3002", "http://localhost:3003"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "Cache-Control", "Pragma"],
-        "expose_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Cache-Control", "Pragma", "Idempotency-Key"],
+        "expose_headers": ["Content-Type", "Authorization", "Idempotent-Replayed", "Retry-After"],
         "supports_credentials": True,
         "max_age": 3600
     }
@@ -33,14 +63,29 @@ CORS(app, resources={
 # Manejo global de errores para capturar cualquier excepción no controlada
 @app.errorhandler(Exception)
 def handle_exception(e):
-    import traceback
-    logging.error("\n==== EXCEPCIÓN GLOBAL ====")
-    logging.error(traceback.format_exc())
+    log.exception('excepcion_global')
     return jsonify({"message": f"Error interno del servidor: {str(e)}"}), 500
 
 # Ejecutar init files (crea carpetas y archivos JSON)
 initFiles()
 
+# Reaplicar las operaciones del WAL posteriores al último snapshot (tras un corte)
+recuperar()
+
+# Cargar clientes y cuentas en memoria y construir los índices de búsqueda
+precargar()
+
+# Separar los passwords de los perfiles si clientes.json todavía los guarda
+Cliente.migrar_credenciales()
+
+# Resolver el usuario del token una vez por petición (g.user_id) antes de cualquier ruta
+app.before_request(autenticar)
+
+# Control de admisión por grupo de rutas (429/503 con Retry-After); va después de
+# autenticar porque los límites son por usuario
+app.before_request(admision.admitir)
+app.teardown_request(admision.liberar)
+
 # Registrar blueprints (rutas)
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(accounts_bp, url_prefix='/api/accounts')
@@ -67,7 +112,17 @@ def home():
 
 @app.route("/api/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok", "message": "Servidor funcionando correctamente"})
+    return jsonify({
+        "status": "ok",
+        "message": "Servidor funcionando correctamente",
+        "flush": flush_stats(),
+        "bloqueos": estadisticas_cuentas(),
+        "procesos": bloqueo_stats(),
+        "idempotencia": idempotencia.estadisticas(),
+        "tokens": estadisticas_tokens(),
+        "admision": admision.estadisticas(),
+        "ejecutor": asincrono.estadisticas()
+    })
 
 if __name__ == "__main__":
     print("\n🚀 Iniciando servidor en http://localhost:5001")
@@ -0,0 +1,170 @@
+"""
+Modo ASGI del backend
+
+Uso (uvicorn está en requirements.txt):
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Las vistas `async def` (p. ej. las del dashboard) corren en el event loop y hacen
+su I/O con `await en_hilo(...)` (utils/asincrono.py); sus before_request
+(autenticación, admisión) y las vistas síncronas corren en el mismo ejecutor acotado. Una conexión abierta sin petición en curso
+no ocupa ningún hilo. El modo WSGI (`python app.py`, gunicorn) sigue disponible.
+"""
+
+import io
+import sys
+import inspect
+import contextvars
+
+from flask import g
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from app import app as flask_app
+from utils import asincrono, admision
+from utils.logger import get_logger
+
+log = get_logger('asgi')
+
+
+def _environ(scope, cuerpo):
+    """Arma el environ WSGI de una petición HTTP ASGI"""
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'REMOTE_PORT': str(cliente[1]),
+        'CONTENT_LENGTH': str(len(cuerpo)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for nombre, valor in scope.get('headers', []):
+        nombre = nombre.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nombre == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = valor
+            continue
+        if nombre == 'CONTENT_LENGTH':
+            continue
+        clave = f'HTTP_{nombre}'
+        environ[clave] = f"{environ[clave]},{valor}" if clave in environ else valor
+    return environ
+
+
+def _vista_async(environ):
+    """Retorna la vista si la ruta corresponde a una `async def`, si no None"""
+    if environ['REQUEST_METHOD'] == 'OPTIONS':
+        return None  # las respuestas automáticas de OPTIONS (CORS) son síncronas
+    try:
+        endpoint, _ = flask_app.url_map.bind_to_environ(environ).match()
+    except (HTTPException, RequestRedirect):
+        return None
+    vista = flask_app.view_functions.get(endpoint)
+    return vista if inspect.iscoroutinefunction(vista) else None
+
+
+async def _despachar_async(environ, vista):
+    """Ejecuta una vista async en el event loop con el mismo ciclo que Flask.full_dispatch_request"""
+    ctx = flask_app.request_context(environ)
+    ctx.push()
+    error = None
+    try:
+        try:
+            # Los before_request leen archivos (tokens, admisión): corren en el ejecutor
+            # con el contexto de la petición, no bloquean el event loop
+            g.vista_async = True
+            rv = await asincrono.en_hilo(contextvars.copy_context().run, flask_app.preprocess_request)
+            if rv is None:
+                # El cupo de admisión se espera aquí, sin ocupar un hilo del ejecutor
+                rv = await admision.admitir_async()
+            if rv is None:
+                rv = await vista(**ctx.request.view_args)
+        except Exception as e:
+            rv = flask_app.handle_user_exception(e)
+        respuesta = flask_app.finalize_request(rv)
+    except Exception as e:
+        error = e
+        respuesta = flask_app.handle_exception(e)
+    finally:
+        ctx.pop(error)
+    return respuesta.status, respuesta.headers.to_wsgi_list(), respuesta.get_data()
+
+
+def _despachar_wsgi(environ):
+    """Ejecuta la petición por la app WSGI (en un hilo del ejecutor)"""
+    inicio = {}
+
+    def start_response(status, headers, exc_info=None):
+        inicio['status'], inicio['headers'] = status, headers
+
+    resultado = flask_app.wsgi_app(environ, start_response)
+    try:
+        cuerpo = b''.join(resultado)
+    finally:
+        if hasattr(resultado, 'close'):
+            resultado.close()
+    return inicio['status'], inicio['headers'], cuerpo
+
+
+async def _http(scope, receive, send):
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            return
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body'):
+            break
+    environ = _environ(scope, b''.join(partes))
+
+    vista = _vista_async(environ)
+    if vista is not None:
+        status, headers, cuerpo = await _despachar_async(environ, vista)
+    else:
+        status, headers, cuerpo = await asincrono.en_hilo(_despachar_wsgi, environ)
+
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+    })
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            log.info('asgi_iniciado', hilos=asincrono.HILOS)
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            asincrono.cerrar()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Aplicación ASGI"""
+    if scope['type'] == 'http':
+        await _http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    else:
+        raise RuntimeError(f"Tipo de conexión no soportado: {scope['type']}")
+
+
+if __name__ == "__main__":
+    import uvicorn
+    print("\n🚀 Iniciando servidor ASGI en http://localhost:5001")
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -5,6 +5,7 @@ DATA_FOLDER = "data"
 
 REQUIRED_FILES = {
     "clientes.json": [],
+    "credenciales.json": [],
     "cuentas.json": [],
     "transacciones.json": []
 }
@@ -0,0 +1,122 @@
+"""
+Comandos de mantenimiento del backend
+
+Uso:
+    python manage.py convert-ledger
+    python manage.py convert-format --formato compacto
+    python manage.py migrate-sqlite
+    python manage.py checkpoint
+    python manage.py archive-ledger [--comprimir]
+    python manage.py accrue-interest [--periodo YYYY-MM]
+    python manage.py rebuild-rollups
+"""
+
+import argparse
+
+from utils.file_manager import (
+    DATA_FOLDER, SQLITE_PATH, convertir_a_jsonl, convertir_formato, archivar,
+    checkpoint as guardar_snapshot
+)
+from utils.formatos import FORMATOS
+
+
+def convert_ledger(args):
+    """Convierte transacciones.json de arreglo JSON a ledger JSON Lines (solo una vez)"""
+    total = convertir_a_jsonl(args.archivo)
+    if total is None:
+        print(f"{args.archivo} ya está en formato ledger (o no existe)")
+    else:
+        print(f"✅ {args.archivo} convertido: {total} registros")
+
+
+def convert_format(args):
+    """Reescribe los archivos de datos en el formato indicado (el formato se detecta al leer)"""
+    for filename in args.archivos:
+        total = convertir_formato(filename, args.formato)
+        if total is None:
+            print(f"{filename} ya está en formato {args.formato} (o no existe)")
+        else:
+            print(f"✅ {filename} convertido a {args.formato}: {total} registros")
+
+
+def migrate_sqlite(args):
+    """Importa data/*.json a la base SQLite (usar luego con BANCO_STORAGE=sqlite)"""
+    from utils.sqlite_backend import migrar_desde_json
+    resultado = migrar_desde_json(args.origen, tam_lote=args.lote)
+    for filename, total in resultado.items():
+        print(f"✅ {filename}: {total} registros importados")
+    print(f"Base de datos: {SQLITE_PATH}")
+
+
+def checkpoint(args):
+    """Guarda un snapshot del estado y vacía el write-ahead log"""
+    guardar_snapshot()
+    print("✅ Snapshot guardado")
+
+
+def archive_ledger(args):
+    """Mueve los meses cerrados del ledger a particiones mensuales selladas"""
+    resultado = archivar(args.archivo, antes_de=args.antes_de, comprimir=args.comprimir)
+    if not resultado:
+        print("No hay meses cerrados para archivar")
+    for mes, total in resultado.items():
+        print(f"✅ {mes}: {total} registros en la partición")
+
+
+def accrue_interest(args):
+    """Acredita el interés mensual a todas las cuentas de ahorro (se puede repetir sin duplicar)"""
+    from models.Transaccion import Transaccion
+    resumen = Transaccion.acreditar_intereses(args.periodo)
+    print(f"✅ {resumen['periodo']}: {resumen['cuentas']} cuentas, {resumen['total_interes']} en intereses")
+    if resumen['omitidas']:
+        print(f"   {resumen['omitidas']} cuentas ya tenían acreditado el período")
+
+
+def rebuild_rollups(args):
+    """Recalcula desde el ledger los resúmenes que usa el dashboard"""
+    from utils.resumenes import reconstruir
+    total = reconstruir()
+    print(f"✅ Resúmenes reconstruidos: {total['registros']} registros, "
+          f"{total['clientes']} clientes, {total['cuentas']} cuentas")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento del backend bancario")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p = subparsers.add_parser('convert-ledger', help="Convierte el historial a JSON Lines (append-only)")
+    p.add_argument('--archivo', default='transacciones.json')
+    p.set_defaults(func=convert_ledger)
+
+    p = subparsers.add_parser('convert-format', help="Cambia el formato en disco de los archivos de datos")
+    p.add_argument('--formato', required=True, choices=FORMATOS)
+    p.add_argument('--archivos', nargs='+', default=['clientes.json', 'credenciales.json', 'cuentas.json', 'transacciones.json'])
+    p.set_defaults(func=convert_format)
+
+    p = subparsers.add_parser('migrate-sqlite', help="Importa los archivos JSON a SQLite")
+    p.add_argument('--origen', default=DATA_FOLDER, help="Carpeta con los archivos JSON")
+    p.add_argument('--lote', type=int, default=1000, help="Registros por INSERT en lote")
+    p.set_defaults(func=migrate_sqlite)
+
+    p = subparsers.add_parser('checkpoint', help="Guarda un snapshot y vacía el WAL")
+    p.set_defaults(func=checkpoint)
+
+    p = subparsers.add_parser('archive-ledger', help="Archiva los meses cerrados en particiones de solo lectura")
+    p.add_argument('--archivo', default='transacciones.json')
+    p.add_argument('--antes-de', dest='antes_de', help="Archivar los meses anteriores a YYYY-MM (default: mes actual)")
+    p.add_argument('--comprimir', action='store_true', help="Comprimir las particiones con gzip")
+    p.set_defaults(func=archive_ledger)
+
+    p = subparsers.add_parser('accrue-interest', help="Cierre de mes: intereses de todas las cuentas de ahorro")
+    p.add_argument('--periodo', help="Período YYYY-MM (default: mes actual)")
+    p.set_defaults(func=accrue_interest)
+
+    p = subparsers.add_parser('rebuild-rollups', help="Recalcula los resúmenes del dashboard desde el ledger")
+    p.set_defaults(func=rebuild_rollups)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
 from datetime import datetime
 from utils.file_manager import (
-    read_json, add_item, find_by_field, get_next_id
+    read_json, write_json, find_by_id, find_by_field, get_next_id,
+    aplicar_lote, bloqueo_escritura
 )
 from utils.auth import hash_password
 
+# Los hashes de password viven aparte (credenciales.json), solo los lee el login;
+# clientes.json guarda únicamente el perfil público.
+CREDENCIALES = 'credenciales.json'
+
 class Cliente:
     def __init__(self, nombre, apellido, dni, direccion, telefono, email, password):
         self.nombre = nombre
@@ -25,7 +30,7 @@ class Cliente:
         if find_by_field('clientes.json', 'dni', dni):
             return None, "El DNI ya está registrado"
         
-        # Crear cliente
+        # Crear cliente (perfil público) y su credencial en una sola escritura
         cliente_data = {
             'id_cliente': get_next_id('clientes.json', 'id_cliente'),
             'nombre': nombre,
@@ -34,15 +39,22 @@ class Cliente:
             'direccion': direccion,
             'telefono': telefono,
             'email': email,
-            'password': hash_password(password),
             'fecha_registro': datetime.now().isoformat()
         }
+        credencial = {
+            'id_cliente': cliente_data['id_cliente'],
+            'email': email,
+            'password': hash_password(password)
+        }
         
-        add_item('clientes.json', cliente_data)
+        aplicar_lote(agregados=[('clientes.json', [cliente_data]), (CREDENCIALES, [credencial])])
         
-        # Remover password antes de retornar
-        cliente_data_safe = {k: v for k, v in cliente_data.items() if k != 'password'}
-        return cliente_data_safe, None
+        return cliente_data, None
+    
+    @staticmethod
+    def obtener_credencial(email):
+        """Obtiene la credencial (id_cliente y hash del password) de un email"""
+        return find_by_field(CREDENCIALES, 'email', email)
     
     @staticmethod
     def obtener_cliente_por_email(email):
@@ -51,16 +63,39 @@ class Cliente:
     
     @staticmethod
     def obtener_cliente_por_id(id_cliente):
-        """Obtiene un cliente por su ID"""
-        clientes = read_json('clientes.json')
-        for cliente in clientes:
-            if cliente['id_cliente'] == id_cliente:
-                # Remover password antes de retornar
-                return {k: v for k, v in cliente.items() if k != 'password'}
-        return None
+        """Obtiene el perfil de un cliente por su ID.
+
+        Es una vista de solo lectura que se reutiliza entre peticiones hasta que el
+        perfil cambia (ver find_by_id): no se copia el registro en cada lectura.
+        """
+        return find_by_id('clientes.json', id_cliente, 'id_cliente', solo_lectura=True)
     
     @staticmethod
     def obtener_todos_clientes():
-        """Obtiene todos los clientes (sin passwords)"""
-        clientes = read_json('clientes.json')
-        return [{k: v for k, v in c.items() if k != 'password'} for c in clientes]
+        """Obtiene todos los clientes (los perfiles no incluyen passwords)"""
+        return read_json('clientes.json')
+    
+    @staticmethod
+    def migrar_credenciales():
+        """Mueve los passwords que aún estén en clientes.json a credenciales.json.
+
+        Primero se guardan las credenciales y después se limpian los perfiles, así
+        un corte a mitad de camino solo obliga a repetir la migración. Retorna la
+        cantidad de clientes migrados.
+        """
+        with bloqueo_escritura():
+            clientes = read_json('clientes.json')
+            pendientes = [c for c in clientes if 'password' in c]
+            if not pendientes:
+                return 0
+            
+            existentes = {c['id_cliente'] for c in read_json(CREDENCIALES)}
+            nuevas = [
+                {'id_cliente': c['id_cliente'], 'email': c['email'], 'password': c['password']}
+                for c in pendientes if c['id_cliente'] not in existentes
+            ]
+            if nuevas:
+                aplicar_lote(agregados=[(CREDENCIALES, nuevas)])
+            
+            write_json('clientes.json', [{k: v for k, v in c.items() if k != 'password'} for c in clientes])
+            return len(pendientes)
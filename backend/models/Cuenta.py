@@ -1,10 +1,14 @@
 from datetime import datetime
+from array import array
 import random
 from abc import ABC, abstractmethod
 from utils.file_manager import (
-    read_json, add_item, find_by_id, get_next_id, update_item, write_json
+    read_json, add_item, find_by_id, find_all_by_field, get_next_id, update_item, ConflictoVersion
 )
 
+# Error de una escritura condicionada (If-Match / versión) cuando la cuenta ya cambió
+ERROR_PRECONDICION = "La cuenta cambió desde que se consultó"
+
 class Cuenta(ABC):
     """Clase abstracta base para todas las cuentas bancarias"""
     
@@ -67,7 +71,9 @@ class Cuenta(ABC):
                 'estado': 'activa',
                 'tasa_interes': float(tasa_interes),
                 'limite_retiros': int(limite_retiros),
-                'retiros_realizados': 0
+                'retiros_realizados': 0,
+                'periodo_retiros': CuentaAhorro.periodo_actual(),
+                'version': 1
             }
         else:  # corriente
             limite_descubierto = kwargs.get('limite_descubierto', 0.00)
@@ -79,7 +85,8 @@ class Cuenta(ABC):
                 'saldo': float(saldo_inicial),
                 'fecha_apertura': datetime.now().isoformat(),
                 'estado': 'activa',
-                'limite_descubierto': float(limite_descubierto)
+                'limite_descubierto': float(limite_descubierto),
+                'version': 1
             }
         
         add_item('cuentas.json', cuenta_data)
@@ -87,44 +94,44 @@ class Cuenta(ABC):
     
     @staticmethod
     def obtener_cuentas_por_cliente(id_cliente):
-        """Obtiene todas las cuentas de un cliente"""
-        cuentas = read_json('cuentas.json')
-        return [c for c in cuentas if c['id_cliente'] == id_cliente]
+        """Obtiene todas las cuentas de un cliente (copias, como obtener_cuenta_por_numero)"""
+        return find_all_by_field('cuentas.json', 'id_cliente', id_cliente)
     
     @staticmethod
     def obtener_cuenta_por_numero(numero_cuenta):
-        """Obtiene una cuenta por su número"""
-        cuentas = read_json('cuentas.json')
-        for cuenta in cuentas:
-            if cuenta['numero_cuenta'] == numero_cuenta:
-                return cuenta
-        return None
+        """Obtiene una cuenta por su número.
+
+        Retorna una copia: el saldo y la versión leídos no cambian aunque otra
+        escritura actualice el caché (ver las escrituras condicionadas por versión).
+        """
+        return find_by_id('cuentas.json', numero_cuenta, 'numero_cuenta')
     
     @staticmethod
     def obtener_cuenta_por_id(id_cuenta):
-        """Obtiene una cuenta por su ID"""
-        cuentas = read_json('cuentas.json')
-        for cuenta in cuentas:
-            if cuenta['id_cuenta'] == id_cuenta:
-                return cuenta
-        return None
+        """Obtiene una cuenta por su ID (una copia, como obtener_cuenta_por_numero)"""
+        return find_by_id('cuentas.json', id_cuenta, 'id_cuenta')
+    
+    @staticmethod
+    def version(cuenta_data):
+        """Versión de la cuenta: aumenta con cada escritura (0 si nunca se actualizó)"""
+        return cuenta_data.get('version', 0)
     
     @staticmethod
-    def actualizar_saldo(numero_cuenta, nuevo_saldo):
-        """Actualiza el saldo de una cuenta"""
-        cuenta = Cuenta.obtener_cuenta_por_numero(numero_cuenta)
+    def actualizar_saldo(numero_cuenta, nuevo_saldo, version=None):
+        """Actualiza el saldo de una cuenta.
+
+        Con `version` (la que leyó el llamador) solo se actualiza si la cuenta sigue
+        en esa versión; si cambió, retorna el error ERROR_PRECONDICION.
+        """
+        try:
+            cuenta = update_item('cuentas.json', numero_cuenta, {'saldo': float(nuevo_saldo)},
+                                 'numero_cuenta', version=version)
+        except ConflictoVersion:
+            return None, ERROR_PRECONDICION
         if not cuenta:
             return None, "Cuenta no encontrada"
         
-        cuentas = read_json('cuentas.json')
-        for i, c in enumerate(cuentas):
-            if c['numero_cuenta'] == numero_cuenta:
-                cuentas[i]['saldo'] = float(nuevo_saldo)
-                from utils.file_manager import write_json
-                write_json('cuentas.json', cuentas)
-                return cuentas[i], None
-        
-        return None, "Error al actualizar saldo"
+        return cuenta, None
     
     @staticmethod
     def obtener_todas_cuentas():
@@ -135,11 +142,26 @@ class Cuenta(ABC):
 class CuentaAhorro(Cuenta):
     """Clase para cuentas de ahorro con tasa de interés y límite de retiros"""
     
-    def __init__(self, id_cuenta, id_cliente, numero_cuenta, saldo=0.00, tasa_interes=3.5, limite_retiros=5):
+    def __init__(self, id_cuenta, id_cliente, numero_cuenta, saldo=0.00, tasa_interes=3.5, limite_retiros=5,
+                 retiros_realizados=0, periodo_retiros=None):
         super().__init__(id_cuenta, id_cliente, numero_cuenta, saldo)
         self.tasa_interes = tasa_interes
         self.limite_retiros = limite_retiros
-        self.retiros_realizados = 0
+        # El contador de retiros vale para un período (mes, YYYY-MM): al cambiar de
+        # período vence solo, sin reiniciar las cuentas una por una
+        self.retiros_realizados = retiros_realizados
+        self.periodo_retiros = periodo_retiros
+    
+    @staticmethod
+    def periodo_actual():
+        """Período del límite de retiros: el mes calendario en curso (YYYY-MM)"""
+        return datetime.now().strftime('%Y-%m')
+    
+    def retiros_del_periodo(self, periodo=None):
+        """Retiros realizados en el período actual (un contador de un período anterior vale 0)"""
+        if self.periodo_retiros != (periodo or CuentaAhorro.periodo_actual()):
+            return 0
+        return self.retiros_realizados
     
     def depositar(self, monto):
         """Realiza un depósito en la cuenta de ahorro"""
@@ -154,14 +176,18 @@ class CuentaAhorro(Cuenta):
         if monto <= 0:
             return False, "El monto debe ser mayor a 0"
         
-        if self.retiros_realizados >= self.limite_retiros:
+        # El contador de un período anterior vence aquí, en el primer retiro del nuevo
+        periodo = CuentaAhorro.periodo_actual()
+        retiros = self.retiros_del_periodo(periodo)
+        if retiros >= self.limite_retiros:
             return False, f"Ha alcanzado el límite de {self.limite_retiros} retiros para este período"
         
         if self.saldo < monto:
             return False, "Saldo insuficiente"
         
         self.saldo -= monto
-        self.retiros_realizados += 1
+        self.retiros_realizados = retiros + 1
+        self.periodo_retiros = periodo
         return True, f"Retiro de {monto} realizado exitosamente"
     
     def calcular_interes(self):
@@ -170,9 +196,18 @@ class CuentaAhorro(Cuenta):
         self.saldo += interes
         return interes
     
+    @staticmethod
+    def calcular_intereses(saldos, tasas):
+        """Interés mensual de varias cuentas a la vez (misma fórmula que calcular_interes).
+
+        Recibe arreglos paralelos de saldos y tasas y retorna el arreglo de intereses.
+        """
+        return array('d', (saldo * (tasa / 100) / 12 for saldo, tasa in zip(saldos, tasas)))
+    
     def reiniciar_limite_retiros(self):
-        """Reinicia el contador de retiros (debe llamarse mensualmente)"""
+        """Reinicia el contador de retiros del período actual (al cambiar de mes se reinicia solo)"""
         self.retiros_realizados = 0
+        self.periodo_retiros = CuentaAhorro.periodo_actual()
 
 
 class CuentaCorriente(Cuenta):
@@ -1,8 +1,20 @@
+import heapq
+from array import array
 from datetime import datetime
 from utils.file_manager import (
-    read_json, add_item, get_next_id, write_json
+    aplicar_lote, find_by_posting, iter_by_posting, stream_json, particiones, reserve_ids
 )
-from models.Cuenta import Cuenta, CuentaAhorro, CuentaCorriente
+from models.Cuenta import Cuenta, CuentaAhorro, CuentaCorriente, ERROR_PRECONDICION
+from utils.logger import get_logger
+from utils.bloqueos import optimista
+
+log = get_logger('models.transaccion')
+
+# Operaciones máximas por lote (POST /api/transactions/batch)
+LOTE_MAX = 10000
+
+# La cuenta ya recibió el interés del período (manual o por el cierre de mes)
+ERROR_INTERES_ACREDITADO = "El interés de este período ya fue acreditado"
 
 class Transaccion:
     def __init__(self, id_cuenta_origen, tipo, monto, id_cuenta_destino=None, descripcion=""):
@@ -22,7 +34,9 @@ class Transaccion:
                 numero_cuenta=cuenta_data['numero_cuenta'],
                 saldo=cuenta_data['saldo'],
                 tasa_interes=cuenta_data.get('tasa_interes', 3.5),
-                limite_retiros=cuenta_data.get('limite_retiros', 5)
+                limite_retiros=cuenta_data.get('limite_retiros', 5),
+                retiros_realizados=cuenta_data.get('retiros_realizados', 0),
+                periodo_retiros=cuenta_data.get('periodo_retiros')
             )
         elif cuenta_data['tipo_cuenta'] == 'corriente':
             return CuentaCorriente(
@@ -35,24 +49,29 @@ class Transaccion:
         return None
     
     @staticmethod
-    def _guardar_cuenta(cuenta_obj, cuenta_data_original):
-        """Guarda los cambios de un objeto cuenta en el archivo JSON"""
-        cuentas = read_json('cuentas.json')
-        for i, c in enumerate(cuentas):
-            if c['numero_cuenta'] == cuenta_obj.numero_cuenta:
-                # Mantener campos específicos del tipo de cuenta
-                cuentas[i]['saldo'] = cuenta_obj.saldo
-                
-                if isinstance(cuenta_obj, CuentaAhorro):
-                    cuentas[i]['retiros_realizados'] = cuenta_obj.retiros_realizados
-                
-                write_json('cuentas.json', cuentas)
-                return cuentas[i]
-        return None
+    def _guardar_cuentas(cuentas, registros=()):
+        """Guarda las cuentas modificadas y sus registros del ledger en una sola escritura.
+
+        `cuentas` es [(objeto cuenta, datos leídos)]: cada una se guarda solo si sigue
+        en la versión que se leyó (si no, ConflictoVersion y no se guarda nada).
+        """
+        aplicar_lote(
+            actualizaciones=[(
+                'cuentas.json', 'numero_cuenta',
+                {obj.numero_cuenta: Transaccion._cambios_cuenta(obj) for obj, _ in cuentas},
+                {obj.numero_cuenta: Cuenta.version(data) for obj, data in cuentas},
+            )],
+            agregados=[('transacciones.json', list(registros))] if registros else []
+        )
     
     @staticmethod
-    def crear_transaccion(numero_cuenta_origen, tipo, monto, numero_cuenta_destino=None, descripcion=""):
-        """Crea una nueva transacción usando las clases de cuenta"""
+    def crear_transaccion(numero_cuenta_origen, tipo, monto, numero_cuenta_destino=None, descripcion="",
+                          version_origen=None):
+        """Crea una nueva transacción usando las clases de cuenta.
+
+        Con `version_origen` (If-Match) solo se aplica si la cuenta origen sigue en
+        esa versión; si no, retorna el error ERROR_PRECONDICION.
+        """
         # Validar tipo de transacción
         if tipo not in ['deposito', 'retiro', 'transferencia']:
             return None, "Tipo de transacción inválido"
@@ -61,10 +80,27 @@ class Transaccion:
         if monto <= 0:
             return None, "El monto debe ser mayor a 0"
         
+        # Leer, validar y guardar los saldos sin bloqueos: se guardan con la versión
+        # leída, y si otra operación cambió una cuenta en el medio se repite desde
+        # la lectura (con reintentos agotados, con las cuentas bloqueadas)
+        destino = numero_cuenta_destino if tipo == 'transferencia' else None
+        return optimista(
+            lambda: Transaccion._aplicar_transaccion(
+                numero_cuenta_origen, tipo, monto, numero_cuenta_destino, descripcion, version_origen
+            ),
+            numero_cuenta_origen, destino
+        )
+    
+    @staticmethod
+    def _aplicar_transaccion(numero_cuenta_origen, tipo, monto, numero_cuenta_destino, descripcion,
+                             version_origen=None):
+        """Aplica una transacción ya validada (ConflictoVersion si una cuenta cambió al guardar)"""
         # Obtener cuenta origen
         cuenta_origen_data = Cuenta.obtener_cuenta_por_numero(numero_cuenta_origen)
         if not cuenta_origen_data:
             return None, "Cuenta origen no encontrada"
+        if version_origen is not None and Cuenta.version(cuenta_origen_data) != version_origen:
+            return None, ERROR_PRECONDICION
         
         # Cargar objeto cuenta origen
         cuenta_origen = Transaccion._cargar_cuenta_objeto(cuenta_origen_data)
@@ -77,14 +113,14 @@ class Transaccion:
             if not exito:
                 return None, mensaje
             
-            Transaccion._guardar_cuenta(cuenta_origen, cuenta_origen_data)
+            cuentas = [(cuenta_origen, cuenta_origen_data)]
         
         elif tipo == 'retiro':
             exito, mensaje = cuenta_origen.retirar(monto)
             if not exito:
                 return None, mensaje
             
-            Transaccion._guardar_cuenta(cuenta_origen, cuenta_origen_data)
+            cuentas = [(cuenta_origen, cuenta_origen_data)]
         
         elif tipo == 'transferencia':
             if not numero_cuenta_destino:
@@ -111,18 +147,41 @@ class Transaccion:
                 cuenta_origen.depositar(monto)
                 return None, f"Error al depositar en cuenta destino: {mensaje_deposito}"
             
-            # Guardar ambas cuentas
-            Transaccion._guardar_cuenta(cuenta_origen, cuenta_origen_data)
-            Transaccion._guardar_cuenta(cuenta_destino, cuenta_destino_data)
+            cuentas = [(cuenta_origen, cuenta_origen_data), (cuenta_destino, cuenta_destino_data)]
         
-        # Crear registro de transacción
+        # Crear registro de transacción (las transferencias llevan uno por cuenta)
         fecha_hora = datetime.now().isoformat()
+        cantidad = 2 if tipo == 'transferencia' else 1
+        primer_id = reserve_ids('transacciones.json', cantidad, 'id_transaccion')
+        registros = Transaccion._registros(
+            primer_id, tipo, monto, numero_cuenta_origen, numero_cuenta_destino, descripcion, fecha_hora
+        )
+        
+        # Guardar las cuentas y el ledger juntos (si una cuenta cambió, ConflictoVersion)
+        Transaccion._guardar_cuentas(cuentas, registros)
         
-        # Para transferencias, crear dos registros (uno para cada cuenta)
-        if tipo == 'transferencia':
+        log.debug('transaccion_creada', tipo=tipo, monto=float(monto),
+                  origen=numero_cuenta_origen, destino=numero_cuenta_destino)
+        return registros[0], None
+    
+    @staticmethod
+    def _registros(primer_id, tipo, monto, numero_cuenta_origen, numero_cuenta_destino, descripcion, fecha_hora):
+        """Registros del ledger de una transacción: dos para una transferencia (débito y crédito)"""
+        if tipo != 'transferencia':
+            return [{
+                'id_transaccion': primer_id,
+                'numero_cuenta_origen': numero_cuenta_origen,
+                'numero_cuenta_destino': numero_cuenta_destino,
+                'tipo_transaccion': tipo,
+                'monto': float(monto),
+                'fecha_hora': fecha_hora,
+                'descripcion': descripcion,
+                'estado': 'completada'
+            }]
+        return [
             # Registro para cuenta origen (débito)
-            transaccion_origen = {
-                'id_transaccion': get_next_id('transacciones.json', 'id_transaccion'),
+            {
+                'id_transaccion': primer_id,
                 'numero_cuenta_origen': numero_cuenta_origen,
                 'numero_cuenta_destino': numero_cuenta_destino,
                 'tipo_transaccion': 'transferencia_enviada',
@@ -130,12 +189,10 @@ class Transaccion:
                 'fecha_hora': fecha_hora,
                 'descripcion': descripcion or f'Transferencia a {numero_cuenta_destino}',
                 'estado': 'completada'
-            }
-            add_item('transacciones.json', transaccion_origen)
-            
+            },
             # Registro para cuenta destino (crédito)
-            transaccion_destino = {
-                'id_transaccion': get_next_id('transacciones.json', 'id_transaccion'),
+            {
+                'id_transaccion': primer_id + 1,
                 'numero_cuenta_origen': numero_cuenta_destino,
                 'numero_cuenta_destino': numero_cuenta_origen,
                 'tipo_transaccion': 'transferencia_recibida',
@@ -143,52 +200,306 @@ class Transaccion:
                 'fecha_hora': fecha_hora,
                 'descripcion': descripcion or f'Transferencia de {numero_cuenta_origen}',
                 'estado': 'completada'
-            }
-            add_item('transacciones.json', transaccion_destino)
+            },
+        ]
+    
+    @staticmethod
+    def _cambios_cuenta(cuenta_obj):
+        """Campos de una cuenta que cambian con una transacción"""
+        cambios = {'saldo': cuenta_obj.saldo}
+        # Mantener campos específicos del tipo de cuenta
+        if isinstance(cuenta_obj, CuentaAhorro):
+            cambios['retiros_realizados'] = cuenta_obj.retiros_realizados
+            cambios['periodo_retiros'] = cuenta_obj.periodo_retiros
+        return cambios
+    
+    @staticmethod
+    def _operacion_lote(operacion):
+        """Normaliza una operación del lote: (tipo, origen, destino, monto, descripcion) o un error"""
+        if not isinstance(operacion, dict):
+            return None, "Operación inválida"
+        tipo = operacion.get('tipo')
+        origen = operacion.get('numero_cuenta') or operacion.get('cuenta_origen')
+        destino = operacion.get('cuenta_destino') if tipo == 'transferencia' else None
+        if tipo not in ['deposito', 'retiro', 'transferencia']:
+            return None, "Tipo de transacción inválido"
+        if not origen:
+            return None, "Número de cuenta requerido"
+        if tipo == 'transferencia' and not destino:
+            return None, "Se requiere cuenta destino para transferencia"
+        try:
+            monto = float(operacion.get('monto'))
+        except (TypeError, ValueError):
+            return None, "Monto inválido"
+        if not monto > 0:
+            return None, "El monto debe ser mayor a 0"
+        return (tipo, origen, destino, monto, operacion.get('descripcion', '')), None
+    
+    @staticmethod
+    def procesar_lote(operaciones, todo_o_nada=True, id_cliente=None):
+        """Aplica un lote de depósitos, retiros y transferencias en una sola escritura.
+
+        Cada operación se valida con las reglas de CuentaAhorro/CuentaCorriente sobre
+        los saldos que dejan las anteriores del lote. Con todo_o_nada, un error
+        descarta el lote completo; si no, solo se omiten las operaciones con error.
+        Si se indica id_cliente, la cuenta origen de cada operación debe ser suya.
+
+        Retorna (resultados, aplicadas): un resultado por operación con
+        'estado' ('aplicada', 'rechazada' o 'revertida'), 'error' y 'transaccion'.
+        """
+        if len(operaciones) > LOTE_MAX:
+            raise ValueError(f"El lote admite hasta {LOTE_MAX} operaciones")
+        
+        normalizadas = [Transaccion._operacion_lote(op) for op in operaciones]
+        numeros = {n for op, _ in normalizadas if op for n in op[1:3] if n}
+        
+        def intento():
+            # Cada cuenta se carga una vez; las operaciones se aplican sobre los objetos
+            cuentas = {}
+            for numero in numeros:
+                cuenta_data = Cuenta.obtener_cuenta_por_numero(numero)
+                if cuenta_data:
+                    cuentas[numero] = (Transaccion._cargar_cuenta_objeto(cuenta_data), cuenta_data)
             
-            return transaccion_origen, None
-        else:
-            # Para depósitos y retiros, un solo registro
-            transaccion_data = {
-                'id_transaccion': get_next_id('transacciones.json', 'id_transaccion'),
-                'numero_cuenta_origen': numero_cuenta_origen,
-                'numero_cuenta_destino': numero_cuenta_destino,
-                'tipo_transaccion': tipo,
-                'monto': float(monto),
-                'fecha_hora': fecha_hora,
-                'descripcion': descripcion,
-                'estado': 'completada'
-            }
+            resultados, aceptadas = [], []
+            for indice, (op, error) in enumerate(normalizadas):
+                if not error:
+                    error = Transaccion._aplicar_en_lote(cuentas, op, id_cliente)
+                resultados.append({
+                    'indice': indice,
+                    'estado': 'rechazada' if error else 'aplicada',
+                    'error': error,
+                    'transaccion': None,
+                })
+                if not error:
+                    aceptadas.append((indice, op))
+            
+            if todo_o_nada and len(aceptadas) < len(operaciones):
+                for indice, _ in aceptadas:
+                    resultados[indice].update(estado='revertida', error='Lote revertido por otra operación')
+                return resultados, [], [], set()
+            if not aceptadas:
+                return resultados, [], [], set()
+            
+            # Registros del ledger con IDs consecutivos reservados de una vez
+            fecha_hora = datetime.now().isoformat()
+            siguiente = reserve_ids(
+                'transacciones.json',
+                sum(2 if op[0] == 'transferencia' else 1 for _, op in aceptadas),
+                'id_transaccion'
+            )
+            registros = []
+            for indice, (tipo, origen, destino, monto, descripcion) in aceptadas:
+                nuevos = Transaccion._registros(siguiente, tipo, monto, origen, destino, descripcion, fecha_hora)
+                siguiente += len(nuevos)
+                registros.extend(nuevos)
+                resultados[indice]['transaccion'] = nuevos[0]
             
-            add_item('transacciones.json', transaccion_data)
-            return transaccion_data, None
+            tocadas = {n for _, op in aceptadas for n in op[1:3] if n}
+            aplicar_lote(
+                actualizaciones=[(
+                    'cuentas.json', 'numero_cuenta',
+                    {numero: Transaccion._cambios_cuenta(cuentas[numero][0]) for numero in sorted(tocadas)},
+                    {numero: Cuenta.version(cuentas[numero][1]) for numero in tocadas},
+                )],
+                agregados=[('transacciones.json', registros)]
+            )
+            return resultados, aceptadas, registros, tocadas
+        
+        # Un lote toca muchas cuentas: se aplica directamente con las cuentas bloqueadas
+        # (reintentos=0); las versiones lo protegen de las operaciones optimistas en curso
+        resultados, aceptadas, registros, tocadas = optimista(intento, *numeros, reintentos=0)
+        if not aceptadas:
+            return resultados, 0
+        log.info('lote_aplicado', operaciones=len(operaciones), aplicadas=len(aceptadas),
+                 registros=len(registros), cuentas=len(tocadas))
+        return resultados, len(aceptadas)
+    
+    @staticmethod
+    def _aplicar_en_lote(cuentas, op, id_cliente):
+        """Aplica una operación sobre los objetos cuenta del lote. Retorna el error o None"""
+        tipo, origen, destino, monto, _ = op
+        if origen not in cuentas:
+            return "Cuenta origen no encontrada"
+        cuenta_origen, origen_data = cuentas[origen]
+        if cuenta_origen is None:
+            return "Error al cargar cuenta origen"
+        if id_cliente is not None and origen_data['id_cliente'] != id_cliente:
+            return "No autorizado para usar esta cuenta"
+        
+        if tipo == 'deposito':
+            exito, mensaje = cuenta_origen.depositar(monto)
+            return None if exito else mensaje
+        if tipo == 'retiro':
+            exito, mensaje = cuenta_origen.retirar(monto)
+            return None if exito else mensaje
+        
+        if destino not in cuentas:
+            return "Cuenta destino no encontrada"
+        cuenta_destino = cuentas[destino][0]
+        if cuenta_destino is None:
+            return "Error al cargar cuenta destino"
+        previo = dict(vars(cuenta_origen))
+        exito, mensaje = cuenta_origen.retirar(monto)
+        if not exito:
+            return mensaje
+        exito_deposito, mensaje_deposito = cuenta_destino.depositar(monto)
+        if not exito_deposito:
+            # Revertir retiro (también el contador y período de retiros de una cuenta de ahorro)
+            vars(cuenta_origen).update(previo)
+            return f"Error al depositar en cuenta destino: {mensaje_deposito}"
+        return None
+    
+    @staticmethod
+    def acreditar_intereses(periodo=None):
+        """Cierre de mes: acredita el interés mensual a todas las cuentas de ahorro.
+
+        Los intereses se calculan en una pasada sobre los arreglos de saldos y tasas
+        y todos los saldos y registros del ledger se guardan en una sola escritura
+        (aplicar_lote). Cada cuenta queda marcada con `interes_periodo`: las ya
+        marcadas se omiten, así el proceso se puede repetir o reanudar tras un corte
+        sin acreditar dos veces el mismo período (YYYY-MM, default el mes actual).
+        """
+        periodo = periodo or datetime.now().strftime('%Y-%m')
+        datetime.strptime(periodo, '%Y-%m')  # ValueError si el formato es inválido
+        
+        numeros = [c['numero_cuenta'] for c in Cuenta.obtener_todas_cuentas()
+                   if c['tipo_cuenta'] == 'ahorro' and c.get('interes_periodo') != periodo]
+        
+        def intento():
+            # Releer con las cuentas bloqueadas: otra operación pudo cambiar los saldos
+            # (una cuenta abierta en el medio queda para la próxima ejecución)
+            bloqueadas = set(numeros)
+            ahorro = [c for c in Cuenta.obtener_todas_cuentas() if c['tipo_cuenta'] == 'ahorro']
+            pendientes = [dict(c) for c in ahorro
+                          if c['numero_cuenta'] in bloqueadas and c.get('interes_periodo') != periodo]
+            omitidas = sum(1 for c in ahorro if c.get('interes_periodo') == periodo)
+            if not pendientes:
+                return {'periodo': periodo, 'cuentas': 0, 'omitidas': omitidas, 'total_interes': 0.0}
+            
+            saldos = array('d', (c['saldo'] for c in pendientes))
+            tasas = array('d', (c.get('tasa_interes', 3.5) for c in pendientes))
+            intereses = CuentaAhorro.calcular_intereses(saldos, tasas)
+            
+            # Solo los intereses positivos generan registro en el ledger
+            acreditados = [i for i, interes in enumerate(intereses) if interes > 0]
+            fecha_hora = datetime.now().isoformat()
+            siguiente = reserve_ids('transacciones.json', len(acreditados), 'id_transaccion') if acreditados else 0
+            registros = []
+            for i in acreditados:
+                registros.append({
+                    'id_transaccion': siguiente,
+                    'numero_cuenta_origen': pendientes[i]['numero_cuenta'],
+                    'numero_cuenta_destino': None,
+                    'tipo_transaccion': 'interes',
+                    'monto': float(intereses[i]),
+                    'fecha_hora': fecha_hora,
+                    'descripcion': f'Interés mensual {periodo}',
+                    'estado': 'completada'
+                })
+                siguiente += 1
+            
+            aplicar_lote(
+                actualizaciones=[(
+                    'cuentas.json', 'numero_cuenta',
+                    {c['numero_cuenta']: {'saldo': saldos[i] + intereses[i], 'interes_periodo': periodo}
+                     for i, c in enumerate(pendientes)},
+                    {c['numero_cuenta']: Cuenta.version(c) for c in pendientes},
+                )],
+                agregados=[('transacciones.json', registros)] if registros else []
+            )
+            
+            total = sum(intereses)
+            log.info('intereses_acreditados', periodo=periodo, cuentas=len(pendientes),
+                     registros=len(registros), total=round(total, 2))
+            return {'periodo': periodo, 'cuentas': len(pendientes), 'omitidas': omitidas, 'total_interes': round(total, 2)}
+        
+        # Con las cuentas bloqueadas desde el principio (reintentos=0), como un lote
+        return optimista(intento, *numeros, reintentos=0)
+    
+    @staticmethod
+    def acreditar_interes(cuenta_data, periodo=None):
+        """Acredita el interés mensual a una cuenta de ahorro ya leída (una vez por período).
+
+        Igual que acreditar_intereses para una sola cuenta: saldo, marca
+        `interes_periodo` y registro del ledger van en una única escritura con la
+        versión leída (ConflictoVersion si la cuenta cambió). Retorna
+        ({'interes', 'nuevo_saldo', 'transaccion'}, None) o (None, error) si la cuenta
+        ya recibió el interés del período.
+        """
+        periodo = periodo or CuentaAhorro.periodo_actual()
+        if cuenta_data.get('interes_periodo') == periodo:
+            return None, ERROR_INTERES_ACREDITADO
+        
+        cuenta_ahorro = Transaccion._cargar_cuenta_objeto(cuenta_data)
+        interes = cuenta_ahorro.calcular_interes()
+        
+        registros = []
+        if interes > 0:
+            registros.append({
+                'id_transaccion': reserve_ids('transacciones.json', 1, 'id_transaccion'),
+                'numero_cuenta_origen': cuenta_data['numero_cuenta'],
+                'numero_cuenta_destino': None,
+                'tipo_transaccion': 'interes',
+                'monto': float(interes),
+                'fecha_hora': datetime.now().isoformat(),
+                'descripcion': f'Interés mensual {periodo}',
+                'estado': 'completada'
+            })
+        
+        aplicar_lote(
+            actualizaciones=[(
+                'cuentas.json', 'numero_cuenta',
+                {cuenta_data['numero_cuenta']: {'saldo': cuenta_ahorro.saldo, 'interes_periodo': periodo}},
+                {cuenta_data['numero_cuenta']: Cuenta.version(cuenta_data)},
+            )],
+            agregados=[('transacciones.json', registros)] if registros else []
+        )
+        return {
+            'interes': interes,
+            'nuevo_saldo': cuenta_ahorro.saldo,
+            'transaccion': registros[0] if registros else None
+        }, None
     
     @staticmethod
     def obtener_transacciones_por_cuenta(numero_cuenta):
         """Obtiene todas las transacciones de una cuenta"""
-        transacciones = read_json('transacciones.json')
-        return [
-            t for t in transacciones 
-            if t['numero_cuenta_origen'] == numero_cuenta or 
-               t.get('numero_cuenta_destino') == numero_cuenta
-        ]
+        return find_by_posting('transacciones.json', [numero_cuenta])
     
     @staticmethod
-    def obtener_transacciones_por_cliente(id_cliente):
-        """Obtiene todas las transacciones de un cliente"""
+    def iterar_transacciones_por_cliente(id_cliente):
+        """Recorre las transacciones de un cliente una por una (memoria acotada)"""
         # Obtener cuentas del cliente
         cuentas = Cuenta.obtener_cuentas_por_cliente(id_cliente)
         numeros_cuenta = [c['numero_cuenta'] for c in cuentas]
         
-        # Obtener transacciones
-        transacciones = read_json('transacciones.json')
-        return [
-            t for t in transacciones 
-            if t['numero_cuenta_origen'] in numeros_cuenta or 
-               t.get('numero_cuenta_destino') in numeros_cuenta
-        ]
+        # Mezclar las listas de postings de cada cuenta (sin recorrer todo el ledger)
+        return iter_by_posting('transacciones.json', numeros_cuenta)
+    
+    @staticmethod
+    def obtener_transacciones_recientes_por_cliente(id_cliente, limite=5):
+        """Últimas transacciones de un cliente, abriendo solo las particiones más nuevas necesarias"""
+        cuentas = Cuenta.obtener_cuentas_por_cliente(id_cliente)
+        numeros_cuenta = [c['numero_cuenta'] for c in cuentas]
+        
+        recientes = []
+        for particion in reversed(particiones('transacciones.json')):
+            recientes = heapq.nlargest(
+                limite,
+                recientes + find_by_posting('transacciones.json', numeros_cuenta, particion),
+                key=lambda t: t['fecha_hora']
+            )
+            # Las particiones anteriores solo tienen meses más viejos
+            if len(recientes) >= limite:
+                break
+        return recientes
+    
+    @staticmethod
+    def obtener_transacciones_por_cliente(id_cliente):
+        """Obtiene todas las transacciones de un cliente"""
+        return list(Transaccion.iterar_transacciones_por_cliente(id_cliente))
     
     @staticmethod
     def obtener_todas_transacciones():
-        """Obtiene todas las transacciones del sistema"""
-        return read_json('transacciones.json')
+        """Obtiene todas las transacciones del sistema (todas las particiones)"""
+        return list(stream_json('transacciones.json'))
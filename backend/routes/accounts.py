@@ -1,28 +1,26 @@
 from flask import Blueprint, request, jsonify
 from models.Cuenta import Cuenta
 from models.Cliente import Cliente
-from utils.auth import decode_token
+from utils.auth import usuario_actual
+from utils.logger import get_logger
+
+log = get_logger('routes.accounts')
 
 accounts_bp = Blueprint('accounts', __name__)
 
-def get_user_id_from_token():
-    """Obtiene el ID del usuario desde el token"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return None
-    
-    try:
-        token = auth_header.split(" ")[1]
-        payload = decode_token(token)
-        return payload['user_id'] if payload else None
-    except:
-        return None
+def respuesta_cuenta(cuenta):
+    """Respuesta de una cuenta con su versión como ETag (If-None-Match responde 304)"""
+    respuesta = jsonify({
+        'account': cuenta
+    })
+    respuesta.set_etag(str(Cuenta.version(cuenta)))
+    return respuesta.make_conditional(request)
 
 @accounts_bp.route('/', methods=['GET'])
 def get_accounts():
     """Obtiene todas las cuentas del usuario autenticado"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -39,29 +37,21 @@ def get_accounts():
 @accounts_bp.route('/', methods=['POST'])
 def create_account():
     """Crea una nueva cuenta bancaria"""
+    user_id = None
     try:
-        print("=" * 60)
-        print("🔵 CREAR CUENTA - Inicio")
-        
-        user_id = get_user_id_from_token()
-        print(f"🔵 User ID: {user_id}")
-        
+        user_id = usuario_actual()
         if not user_id:
-            print("❌ No autenticado")
             return jsonify({'message': 'No autenticado'}), 401
         
         data = request.get_json()
-        print(f"🔵 Datos recibidos: {data}")
         
         # Validar tipo de cuenta
         tipo_cuenta = data.get('tipo_cuenta', 'ahorro')
         if tipo_cuenta not in ['ahorro', 'corriente']:
-            print(f"❌ Tipo de cuenta inválido: {tipo_cuenta}")
             return jsonify({'message': 'Tipo de cuenta inválido. Use "ahorro" o "corriente"'}), 400
         
         # Obtener saldo inicial
         saldo_inicial = float(data.get('saldo_inicial', 0))
-        print(f"🔵 Tipo: {tipo_cuenta}, Saldo inicial: {saldo_inicial}")
         
         # Parámetros específicos según tipo de cuenta
         kwargs = {}
@@ -71,17 +61,14 @@ def create_account():
         elif tipo_cuenta == 'corriente':
             kwargs['limite_descubierto'] = float(data.get('limite_descubierto', 0.00))
         
-        print(f"🔵 Kwargs: {kwargs}")
-        
         # Crear cuenta
         cuenta, error = Cuenta.crear_cuenta(user_id, tipo_cuenta, saldo_inicial, **kwargs)
         
         if error:
-            print(f"❌ Error al crear: {error}")
+            log.info('cuenta_rechazada', user_id=user_id, tipo=tipo_cuenta, error=error)
             return jsonify({'message': error}), 400
         
-        print(f"✅ Cuenta creada: {cuenta['numero_cuenta']}")
-        print("=" * 60)
+        log.info('cuenta_creada', user_id=user_id, tipo=tipo_cuenta, numero_cuenta=cuenta['numero_cuenta'])
         
         return jsonify({
             'message': 'Cuenta creada exitosamente',
@@ -89,17 +76,14 @@ def create_account():
         }), 201
     
     except Exception as e:
-        print(f"❌ EXCEPCIÓN: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        print("=" * 60)
+        log.exception('error_crear_cuenta', user_id=user_id)
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @accounts_bp.route('/<numero_cuenta>', methods=['GET'])
 def get_account_by_number(numero_cuenta):
     """Obtiene información detallada de una cuenta"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -112,9 +96,7 @@ def get_account_by_number(numero_cuenta):
         if cuenta['id_cliente'] != user_id:
             return jsonify({'message': 'No autorizado'}), 403
         
-        return jsonify({
-            'account': cuenta
-        }), 200
+        return respuesta_cuenta(cuenta)
     
     except Exception as e:
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
@@ -123,13 +105,11 @@ def get_account_by_number(numero_cuenta):
 def get_account_by_id(id_cuenta):
     """Obtiene información detallada de una cuenta por ID"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
-        from utils.file_manager import read_json
-        cuentas = read_json('cuentas.json')
-        cuenta = next((c for c in cuentas if c['id_cuenta'] == id_cuenta), None)
+        cuenta = Cuenta.obtener_cuenta_por_id(id_cuenta)
         
         if not cuenta:
             return jsonify({'message': 'Cuenta no encontrada'}), 404
@@ -138,9 +118,7 @@ def get_account_by_id(id_cuenta):
         if cuenta['id_cliente'] != user_id:
             return jsonify({'message': 'No autorizado'}), 403
         
-        return jsonify({
-            'account': cuenta
-        }), 200
+        return respuesta_cuenta(cuenta)
     
     except Exception as e:
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
@@ -149,7 +127,7 @@ def get_account_by_id(id_cuenta):
 def get_accounts_stats():
     """Obtiene estadísticas de las cuentas del usuario"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, g
 from models.Cliente import Cliente
-from utils.auth import hash_password, verify_password, generate_token
+from utils.auth import verify_password, generate_token, usuario_actual
+from utils.logger import get_logger
+
+log = get_logger('routes.auth')
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -8,22 +11,14 @@ auth_bp = Blueprint('auth', __name__)
 def register():
     """Registro de nuevo usuario"""
     try:
-        print("=" * 50)
-        print("🔵 RECIBIDA PETICIÓN DE REGISTRO")
-        print("=" * 50)
-        
         data = request.get_json()
-        print(f"📦 Datos recibidos: {data}")
         
         # Validar campos requeridos
         required_fields = ['nombre', 'apellido', 'dni', 'email', 'password']
         for field in required_fields:
             if field not in data or not data[field]:
-                print(f"❌ Campo faltante: {field}")
                 return jsonify({'message': f'El campo {field} es requerido'}), 400
         
-        print("✅ Todos los campos requeridos presentes")
-        
         # Crear cliente
         cliente, error = Cliente.crear_cliente(
             nombre=data['nombre'],
@@ -36,14 +31,13 @@ def register():
         )
         
         if error:
-            print(f"❌ Error al crear cliente: {error}")
+            log.info('registro_rechazado', error=error)
             return jsonify({'message': error}), 400
         
-        print(f"✅ Cliente creado: {cliente['id_cliente']}")
+        log.info('cliente_registrado', id_cliente=cliente['id_cliente'])
         
         # Generar token
         token = generate_token(cliente['id_cliente'], cliente['email'])
-        print(f"✅ Token generado")
         
         return jsonify({
             'message': 'Usuario registrado exitosamente',
@@ -52,9 +46,7 @@ def register():
         }), 201
     
     except Exception as e:
-        print(f"❌ EXCEPCIÓN: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception('error_registro')
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @auth_bp.route('/login', methods=['POST'])
@@ -62,40 +54,34 @@ def login():
     """Inicio de sesión"""
     try:
         data = request.get_json()
-        print("\n" + "=" * 60)
-        print("🔵 LOGIN - Datos recibidos:", data)
         
         # Validar campos
         if not data.get('email') or not data.get('password'):
-            print("❌ Campos faltantes")
             return jsonify({'message': 'Email y contraseña son requeridos'}), 400
         
-        # Buscar cliente
-        cliente = Cliente.obtener_cliente_por_email(data['email'])
-        if not cliente:
-            print(f"❌ Usuario no encontrado: {data['email']}")
+        # Buscar credencial
+        credencial = Cliente.obtener_credencial(data['email'])
+        if not credencial:
+            log.info('login_fallido', motivo='usuario_no_encontrado')
             return jsonify({'message': 'Credenciales inválidas'}), 401
         
-        print(f"✅ Usuario encontrado: {cliente['email']}")
-        print(f"🔑 Password enviado: {data['password']}")
-        print(f"🔑 Password hash almacenado: {cliente['password']}")
-        print(f"🔑 Password hash calculado: {hash_password(data['password'])}")
-        
         # Verificar contraseña
-        if not verify_password(data['password'], cliente['password']):
-            print("❌ Contraseña incorrecta")
+        if not verify_password(data['password'], credencial['password']):
+            log.info('login_fallido', motivo='password_incorrecto', id_cliente=credencial['id_cliente'])
+            return jsonify({'message': 'Credenciales inválidas'}), 401
+        
+        # Perfil público del cliente
+        cliente = Cliente.obtener_cliente_por_id(credencial['id_cliente'])
+        if not cliente:
             return jsonify({'message': 'Credenciales inválidas'}), 401
         
         # Generar token
         token = generate_token(cliente['id_cliente'], cliente['email'])
         
-        # Remover password del cliente
-        cliente_safe = {k: v for k, v in cliente.items() if k != 'password'}
-        
         return jsonify({
             'message': 'Inicio de sesión exitoso',
             'token': token,
-            'user': cliente_safe
+            'user': cliente
         }), 200
     
     except Exception as e:
@@ -105,24 +91,13 @@ def login():
 def get_current_user():
     """Obtiene información del usuario actual (requiere token)"""
     try:
-        # Obtener token del header
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return jsonify({'message': 'Token no proporcionado'}), 401
-        
-        try:
-            token = auth_header.split(" ")[1]
-        except IndexError:
-            return jsonify({'message': 'Formato de token inválido'}), 401
-        
-        # Decodificar token
-        from utils.auth import decode_token
-        payload = decode_token(token)
-        if not payload:
-            return jsonify({'message': 'Token inválido o expirado'}), 401
+        # Usuario resuelto por el middleware de autenticación (utils/auth.autenticar)
+        user_id = usuario_actual()
+        if not user_id:
+            return jsonify({'message': g.error_auth}), 401
         
         # Obtener cliente
-        cliente = Cliente.obtener_cliente_por_id(payload['user_id'])
+        cliente = Cliente.obtener_cliente_por_id(user_id)
         if not cliente:
             return jsonify({'message': 'Usuario no encontrado'}), 404
         
@@ -2,64 +2,39 @@ from flask import Blueprint, request, jsonify
 from models.Cuenta import Cuenta
 from models.Transaccion import Transaccion
 from models.Cliente import Cliente
-from utils.auth import decode_token
+from utils.auth import usuario_actual
 from datetime import datetime, timedelta
-from collections import defaultdict
+from utils import resumenes
+from utils.logger import get_logger
+from utils.asincrono import en_hilo
 
-dashboard_bp = Blueprint('dashboard', __name__)
+log = get_logger('routes.dashboard')
 
-def get_user_id_from_token():
-    """Obtiene el ID del usuario desde el token"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return None
-    
-    try:
-        token = auth_header.split(" ")[1]
-        payload = decode_token(token)
-        return payload['user_id'] if payload else None
-    except:
-        return None
+dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/stats', methods=['GET'])
-def get_dashboard_stats():
+async def get_dashboard_stats():
     """Obtiene estadísticas generales del dashboard"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
-        # Obtener cuentas
-        cuentas = Cuenta.obtener_cuentas_por_cliente(user_id)
-        
-        # Obtener transacciones
-        transacciones = Transaccion.obtener_transacciones_por_cliente(user_id)
+        # Obtener cuentas (el I/O corre fuera del event loop)
+        cuentas = await en_hilo(Cuenta.obtener_cuentas_por_cliente, user_id)
         
         # Calcular balance total
         total_balance = sum(float(c.get('saldo', 0)) for c in cuentas)
         
-        # Calcular ingresos y gastos del mes actual
-        now = datetime.now()
-        primer_dia_mes = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        ingresos_mes = 0
-        gastos_mes = 0
-        
-        for t in transacciones:
-            try:
-                fecha_trans = datetime.fromisoformat(t['fecha_hora'].replace('Z', '+00:00'))
-                if fecha_trans >= primer_dia_mes:
-                    monto = float(t['monto'])
-                    if t['tipo_transaccion'] == 'deposito':
-                        ingresos_mes += monto
-                    elif t['tipo_transaccion'] in ['retiro', 'transferencia']:
-                        gastos_mes += monto
-            except:
-                continue
-        
-        # Transacciones recientes (últimas 5)
-        transacciones_ordenadas = sorted(transacciones, key=lambda x: x['fecha_hora'], reverse=True)
-        transacciones_recientes = transacciones_ordenadas[:5]
+        # Calcular ingresos y gastos del mes actual con los resúmenes mensuales
+        # materializados (utils/resumenes.py), sin recorrer el historial
+        mes_actual = datetime.now().strftime('%Y-%m')
+        totales = await en_hilo(resumenes.totales_cliente, user_id, 'mes', mes_actual)
+        ingresos_mes = totales.get('deposito', [0, 0])[1] / 100
+        gastos_mes = sum(totales.get(tipo, [0, 0])[1] for tipo in ['retiro', 'transferencia']) / 100
+        
+        # Últimas 5 transacciones (sin cargar todo el historial)
+        transacciones_recientes = await en_hilo(Transaccion.obtener_transacciones_recientes_por_cliente, user_id, 5)
         
         return jsonify({
             'total_balance': round(total_balance, 2),
@@ -74,19 +49,16 @@ def get_dashboard_stats():
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @dashboard_bp.route('/analytics', methods=['GET'])
-def get_analytics():
+async def get_analytics():
     """Obtiene análisis detallado de transacciones para gráficas"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
         # Obtener parámetro de período (week, month, quarter, year)
         period = request.args.get('period', 'month')
         
-        # Obtener transacciones
-        transacciones = Transaccion.obtener_transacciones_por_cliente(user_id)
-        
         # Calcular fecha inicial según el período
         now = datetime.now()
         if period == 'week':
@@ -100,39 +72,33 @@ def get_analytics():
         else:
             fecha_inicio = now - timedelta(days=30)
         
-        # Filtrar transacciones por período
-        transacciones_periodo = []
-        for t in transacciones:
-            try:
-                fecha_trans = datetime.fromisoformat(t['fecha_hora'].replace('Z', '+00:00'))
-                if fecha_trans >= fecha_inicio:
-                    transacciones_periodo.append(t)
-            except:
-                continue
-        
-        # Análisis por tipo de transacción
-        depositos = sum(float(t['monto']) for t in transacciones_periodo if t['tipo_transaccion'] == 'deposito')
-        retiros = sum(float(t['monto']) for t in transacciones_periodo if t['tipo_transaccion'] == 'retiro')
-        transferencias = sum(float(t['monto']) for t in transacciones_periodo if t['tipo_transaccion'] == 'transferencia')
-        
-        # Análisis por categoría (basado en descripción)
-        categorias = defaultdict(float)
-        for t in transacciones_periodo:
-            descripcion = t.get('descripcion', '').lower()
-            if any(word in descripcion for word in ['compra', 'shopping', 'tienda']):
-                categorias['Compras'] += float(t['monto'])
-            elif any(word in descripcion for word in ['comida', 'restaurant', 'alimento', 'comida']):
-                categorias['Alimentos'] += float(t['monto'])
-            elif any(word in descripcion for word in ['renta', 'casa', 'vivienda', 'alquiler']):
-                categorias['Vivienda'] += float(t['monto'])
-            elif any(word in descripcion for word in ['transporte', 'taxi', 'uber', 'gasolina']):
-                categorias['Transporte'] += float(t['monto'])
-            elif any(word in descripcion for word in ['tecnología', 'tech', 'tecnologia', 'electrónica']):
-                categorias['Tecnología'] += float(t['monto'])
-            elif any(word in descripcion for word in ['salud', 'medico', 'farmacia', 'hospital']):
-                categorias['Salud'] += float(t['monto'])
-            else:
-                categorias['Otros'] += float(t['monto'])
+        # Ventanas de la tendencia mensual (últimos 6 meses)
+        meses = []
+        for i in range(6, 0, -1):
+            mes_inicio = (now - timedelta(days=30*i)).replace(day=1)
+            mes_fin = (now - timedelta(days=30*(i-1))).replace(day=1)
+            meses.append({'inicio': mes_inicio, 'fin': mes_fin})
+        
+        # Totales del período (cubetas diarias) y de cada mes de la tendencia
+        # (cubetas mensuales) desde los resúmenes materializados del cliente
+        desde = fecha_inicio.strftime('%Y-%m-%d')
+        totales = await en_hilo(resumenes.totales_cliente, user_id, 'dia', desde)
+        centavos_categoria = await en_hilo(resumenes.categorias_cliente, user_id, desde)
+        for mes in meses:
+            totales_mes = await en_hilo(
+                resumenes.totales_cliente, user_id, 'mes',
+                mes['inicio'].strftime('%Y-%m'), mes['fin'].strftime('%Y-%m')
+            )
+            mes['ingresos'] = totales_mes.get('deposito', [0, 0])[1]
+            mes['gastos'] = sum(totales_mes.get(tipo, [0, 0])[1] for tipo in ['retiro', 'transferencia'])
+        
+        total_periodo = sum(conteo for conteo, _ in totales.values())
+        centavos_tipo = {tipo: centavos for tipo, (_, centavos) in totales.items()}
+        
+        depositos = centavos_tipo.get('deposito', 0) / 100
+        retiros = centavos_tipo.get('retiro', 0) / 100
+        transferencias = centavos_tipo.get('transferencia', 0) / 100
+        categorias = {k: v / 100 for k, v in centavos_categoria.items()}
         
         # Convertir categorías a lista
         categoria_data = [
@@ -140,28 +106,14 @@ def get_analytics():
             for k, v in categorias.items()
         ]
         
-        # Tendencia mensual (últimos 6 meses)
-        tendencia_mensual = []
-        for i in range(6, 0, -1):
-            mes_inicio = (now - timedelta(days=30*i)).replace(day=1)
-            mes_fin = (now - timedelta(days=30*(i-1))).replace(day=1)
-            
-            ingresos = sum(
-                float(t['monto']) for t in transacciones
-                if t['tipo_transaccion'] == 'deposito' and
-                mes_inicio <= datetime.fromisoformat(t['fecha_hora'].replace('Z', '+00:00')) < mes_fin
-            )
-            gastos = sum(
-                float(t['monto']) for t in transacciones
-                if t['tipo_transaccion'] in ['retiro', 'transferencia'] and
-                mes_inicio <= datetime.fromisoformat(t['fecha_hora'].replace('Z', '+00:00')) < mes_fin
-            )
-            
-            tendencia_mensual.append({
-                'month': mes_inicio.strftime('%b'),
-                'ingresos': round(ingresos, 2),
-                'gastos': round(gastos, 2)
-            })
+        tendencia_mensual = [
+            {
+                'month': mes['inicio'].strftime('%b'),
+                'ingresos': round(mes['ingresos'] / 100, 2),
+                'gastos': round(mes['gastos'] / 100, 2)
+            }
+            for mes in meses
+        ]
         
         return jsonify({
             'period': period,
@@ -170,45 +122,43 @@ def get_analytics():
             'total_transfers': round(transferencias, 2),
             'categories': categoria_data,
             'monthly_trend': tendencia_mensual,
-            'total_transactions': len(transacciones_periodo)
+            'total_transactions': total_periodo
         }), 200
     
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception('error_analytics')
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @dashboard_bp.route('/summary', methods=['GET'])
-def get_summary():
+async def get_summary():
     """Obtiene un resumen completo del estado financiero del usuario"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
         # Obtener información del usuario
-        cliente = Cliente.obtener_cliente_por_id(user_id)
+        cliente = await en_hilo(Cliente.obtener_cliente_por_id, user_id)
         if not cliente:
             return jsonify({'message': 'Usuario no encontrado'}), 404
         
         # Obtener cuentas
-        cuentas = Cuenta.obtener_cuentas_por_cliente(user_id)
-        
-        # Obtener transacciones
-        transacciones = Transaccion.obtener_transacciones_por_cliente(user_id)
+        cuentas = await en_hilo(Cuenta.obtener_cuentas_por_cliente, user_id)
         
         # Calcular totales
         total_balance = sum(float(c.get('saldo', 0)) for c in cuentas)
         total_ahorro = sum(float(c.get('saldo', 0)) for c in cuentas if c.get('tipo_cuenta') == 'ahorro')
         total_corriente = sum(float(c.get('saldo', 0)) for c in cuentas if c.get('tipo_cuenta') == 'corriente')
         
-        # Transacciones del último mes
+        # Contar transacciones (total y del último mes) con los resúmenes del cliente
         now = datetime.now()
-        hace_un_mes = now - timedelta(days=30)
-        transacciones_mes = [
-            t for t in transacciones
-            if datetime.fromisoformat(t['fecha_hora'].replace('Z', '+00:00')) >= hace_un_mes
-        ]
+        hace_un_mes = (now - timedelta(days=30)).strftime('%Y-%m-%d')
+        total_transacciones = sum(
+            conteo for conteo, _ in (await en_hilo(resumenes.totales_cliente, user_id)).values()
+        )
+        transacciones_mes = sum(
+            conteo for conteo, _ in (await en_hilo(resumenes.totales_cliente, user_id, 'dia', hace_un_mes)).values()
+        )
         
         return jsonify({
             'user': {
@@ -223,8 +173,8 @@ def get_summary():
                 'total_accounts': len(cuentas)
             },
             'transactions_summary': {
-                'total_transactions': len(transacciones),
-                'monthly_transactions': len(transacciones_mes)
+                'total_transactions': total_transacciones,
+                'monthly_transactions': transacciones_mes
             }
         }), 200
     
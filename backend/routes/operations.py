@@ -1,29 +1,17 @@
 from flask import Blueprint, request, jsonify
 from models.Cuenta import Cuenta, CuentaAhorro, CuentaCorriente
 from models.Transaccion import Transaccion
-from utils.auth import decode_token
-from utils.file_manager import read_json, write_json
+from utils.auth import usuario_actual, es_admin
+from utils.file_manager import update_item
+from utils.bloqueos import bloquear_cuentas, optimista
 
 operations_bp = Blueprint('operations', __name__)
 
-def get_user_id_from_token():
-    """Obtiene el ID del usuario desde el token"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return None
-    
-    try:
-        token = auth_header.split(" ")[1]
-        payload = decode_token(token)
-        return payload['user_id'] if payload else None
-    except:
-        return None
-
 @operations_bp.route('/calculate-interest', methods=['POST'])
 def calculate_interest():
     """Calcula y aplica intereses a una cuenta de ahorro"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -33,58 +21,57 @@ def calculate_interest():
         if not numero_cuenta:
             return jsonify({'message': 'Número de cuenta requerido'}), 400
         
-        # Obtener cuenta
-        cuenta_data = Cuenta.obtener_cuenta_por_numero(numero_cuenta)
-        if not cuenta_data:
-            return jsonify({'message': 'Cuenta no encontrada'}), 404
-        
-        # Verificar que pertenezca al usuario
-        if cuenta_data['id_cliente'] != user_id:
+        # Leer, calcular y guardar sin bloqueos: el saldo se guarda con la versión
+        # leída y, si otra operación cambió la cuenta, se repite (ver utils/bloqueos.py)
+        def aplicar():
+            # Obtener cuenta
+            cuenta_data = Cuenta.obtener_cuenta_por_numero(numero_cuenta)
+            if not cuenta_data:
+                return jsonify({'message': 'Cuenta no encontrada'}), 404
+            
+            # Verificar que pertenezca al usuario
+            if cuenta_data['id_cliente'] != user_id:
+                return jsonify({'message': 'No autorizado'}), 403
+            
+            # Verificar que sea cuenta de ahorro
+            if cuenta_data['tipo_cuenta'] != 'ahorro':
+                return jsonify({'message': 'Solo las cuentas de ahorro generan intereses'}), 400
+            
+            # Saldo, marca del período y registro del ledger en una sola escritura: el
+            # interés de un período se acredita una vez (también frente al cierre de mes)
+            resultado, error = Transaccion.acreditar_interes(cuenta_data)
+            if error:
+                return jsonify({'message': error}), 409
+            
+            return jsonify({
+                'message': 'Interés calculado y aplicado exitosamente',
+                'interes': round(resultado['interes'], 2),
+                'nuevo_saldo': round(resultado['nuevo_saldo'], 2)
+            }), 200
+        
+        return optimista(aplicar, numero_cuenta)
+    
+    except Exception as e:
+        return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
+
+@operations_bp.route('/month-end-interest', methods=['POST'])
+def month_end_interest():
+    """Acredita el interés del mes a todas las cuentas de ahorro (operación administrativa)"""
+    try:
+        if not es_admin():
             return jsonify({'message': 'No autorizado'}), 403
         
-        # Verificar que sea cuenta de ahorro
-        if cuenta_data['tipo_cuenta'] != 'ahorro':
-            return jsonify({'message': 'Solo las cuentas de ahorro generan intereses'}), 400
-        
-        # Crear objeto cuenta de ahorro
-        cuenta_ahorro = CuentaAhorro(
-            id_cuenta=cuenta_data['id_cuenta'],
-            id_cliente=cuenta_data['id_cliente'],
-            numero_cuenta=cuenta_data['numero_cuenta'],
-            saldo=cuenta_data['saldo'],
-            tasa_interes=cuenta_data.get('tasa_interes', 3.5),
-            limite_retiros=cuenta_data.get('limite_retiros', 5)
-        )
+        data = request.get_json(silent=True) or {}
         
-        # Calcular interés
-        interes = cuenta_ahorro.calcular_interes()
-        
-        # Actualizar en archivo
-        cuentas = read_json('cuentas.json')
-        for i, c in enumerate(cuentas):
-            if c['numero_cuenta'] == numero_cuenta:
-                cuentas[i]['saldo'] = cuenta_ahorro.saldo
-                write_json('cuentas.json', cuentas)
-                break
-        
-        # Registrar como transacción
-        from utils.file_manager import add_item, get_next_id
-        transaccion_data = {
-            'id_transaccion': get_next_id('transacciones.json', 'id_transaccion'),
-            'numero_cuenta_origen': numero_cuenta,
-            'numero_cuenta_destino': None,
-            'tipo_transaccion': 'interes',
-            'monto': float(interes),
-            'fecha_hora': cuenta_ahorro.fecha_apertura,
-            'descripcion': 'Interés mensual aplicado',
-            'estado': 'completada'
-        }
-        add_item('transacciones.json', transaccion_data)
+        # Repetir la llamada para el mismo período no acredita dos veces
+        try:
+            resumen = Transaccion.acreditar_intereses(data.get('periodo'))
+        except ValueError:
+            return jsonify({'message': 'Período inválido. Use el formato YYYY-MM'}), 400
         
         return jsonify({
-            'message': 'Interés calculado y aplicado exitosamente',
-            'interes': round(interes, 2),
-            'nuevo_saldo': round(cuenta_ahorro.saldo, 2)
+            'message': 'Intereses del período acreditados exitosamente',
+            **resumen
         }), 200
     
     except Exception as e:
@@ -94,7 +81,7 @@ def calculate_interest():
 def reset_withdrawal_limit():
     """Reinicia el límite de retiros de una cuenta de ahorro"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -104,30 +91,30 @@ def reset_withdrawal_limit():
         if not numero_cuenta:
             return jsonify({'message': 'Número de cuenta requerido'}), 400
         
-        # Obtener cuenta
-        cuenta_data = Cuenta.obtener_cuenta_por_numero(numero_cuenta)
-        if not cuenta_data:
-            return jsonify({'message': 'Cuenta no encontrada'}), 404
-        
-        # Verificar que pertenezca al usuario
-        if cuenta_data['id_cliente'] != user_id:
-            return jsonify({'message': 'No autorizado'}), 403
-        
-        # Verificar que sea cuenta de ahorro
-        if cuenta_data['tipo_cuenta'] != 'ahorro':
-            return jsonify({'message': 'Solo las cuentas de ahorro tienen límite de retiros'}), 400
-        
-        # Actualizar límite
-        cuentas = read_json('cuentas.json')
-        for i, c in enumerate(cuentas):
-            if c['numero_cuenta'] == numero_cuenta:
-                cuentas[i]['retiros_realizados'] = 0
-                write_json('cuentas.json', cuentas)
-                break
-        
-        return jsonify({
-            'message': 'Límite de retiros reiniciado exitosamente'
-        }), 200
+        # Leer y guardar con la cuenta bloqueada (ver utils/bloqueos.py)
+        with bloquear_cuentas(numero_cuenta):
+            # Obtener cuenta
+            cuenta_data = Cuenta.obtener_cuenta_por_numero(numero_cuenta)
+            if not cuenta_data:
+                return jsonify({'message': 'Cuenta no encontrada'}), 404
+            
+            # Verificar que pertenezca al usuario
+            if cuenta_data['id_cliente'] != user_id:
+                return jsonify({'message': 'No autorizado'}), 403
+            
+            # Verificar que sea cuenta de ahorro
+            if cuenta_data['tipo_cuenta'] != 'ahorro':
+                return jsonify({'message': 'Solo las cuentas de ahorro tienen límite de retiros'}), 400
+            
+            # Actualizar límite (el contador queda asociado al período actual)
+            update_item('cuentas.json', numero_cuenta, {
+                'retiros_realizados': 0,
+                'periodo_retiros': CuentaAhorro.periodo_actual()
+            }, 'numero_cuenta')
+            
+            return jsonify({
+                'message': 'Límite de retiros reiniciado exitosamente'
+            }), 200
     
     except Exception as e:
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
@@ -136,7 +123,7 @@ def reset_withdrawal_limit():
 def check_overdraft(numero_cuenta):
     """Verifica el estado de sobregiro de una cuenta corriente"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
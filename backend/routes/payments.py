@@ -1,30 +1,22 @@
 from flask import Blueprint, request, jsonify
 from models.Cuenta import Cuenta
 from models.Transaccion import Transaccion
-from utils.auth import decode_token
+from utils.auth import usuario_actual
 from utils.file_manager import add_item, get_next_id
+from utils.idempotencia import idempotente
+from utils.logger import get_logger
 from datetime import datetime
 
-payments_bp = Blueprint('payments', __name__)
+log = get_logger('routes.payments')
 
-def get_user_id_from_token():
-    """Obtiene el ID del usuario desde el token"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return None
-    
-    try:
-        token = auth_header.split(" ")[1]
-        payload = decode_token(token)
-        return payload['user_id'] if payload else None
-    except:
-        return None
+payments_bp = Blueprint('payments', __name__)
 
 @payments_bp.route('/process', methods=['POST'])
+@idempotente
 def process_payment():
     """Procesa un pago de servicio o factura"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -77,15 +69,14 @@ def process_payment():
         }), 201
     
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception('error_procesar_pago')
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @payments_bp.route('/history', methods=['GET'])
 def get_payment_history():
     """Obtiene el historial de pagos del usuario"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -1,28 +1,32 @@
 from flask import Blueprint, request, jsonify
-from models.Transaccion import Transaccion
-from models.Cuenta import Cuenta
-from utils.auth import decode_token
+from models.Transaccion import Transaccion, LOTE_MAX
+from models.Cuenta import Cuenta, ERROR_PRECONDICION
+from utils.auth import usuario_actual
+from utils import resumenes
+from utils.idempotencia import idempotente
 
 transactions_bp = Blueprint('transactions', __name__)
 
-def get_user_id_from_token():
-    """Obtiene el ID del usuario desde el token"""
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return None
-    
-    try:
-        token = auth_header.split(" ")[1]
-        payload = decode_token(token)
-        return payload['user_id'] if payload else None
-    except:
+def version_exigida(cuenta):
+    """Versión de la cuenta que exige el header If-Match.
+
+    Retorna None si no hay condición (sin If-Match o `If-Match: *`) y False si el
+    ETag no coincide con la versión actual.
+    """
+    if not request.if_match or request.if_match.star_tag:
         return None
+    version = Cuenta.version(cuenta)
+    return version if request.if_match.contains(str(version)) else False
+
+def respuesta_error(error):
+    """Respuesta de una transacción rechazada: 412 si falló la condición If-Match"""
+    return jsonify({'message': error}), 412 if error == ERROR_PRECONDICION else 400
 
 @transactions_bp.route('/', methods=['GET'])
 def get_transactions():
     """Obtiene todas las transacciones del usuario autenticado"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -43,7 +47,7 @@ def get_transactions():
 def get_recent_transactions():
     """Obtiene las últimas 10 transacciones del usuario"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -62,10 +66,11 @@ def get_recent_transactions():
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @transactions_bp.route('/transfer', methods=['POST'])
+@idempotente
 def create_transfer():
     """Realiza una transferencia entre cuentas"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -85,17 +90,23 @@ def create_transfer():
         if cuenta_origen['id_cliente'] != user_id:
             return jsonify({'message': 'No autorizado para usar esta cuenta'}), 403
         
+        # If-Match: la transferencia solo se aplica sobre la versión que vio el cliente
+        version = version_exigida(cuenta_origen)
+        if version is False:
+            return jsonify({'message': ERROR_PRECONDICION}), 412
+        
         # Crear transacción
         transaccion, error = Transaccion.crear_transaccion(
             numero_cuenta_origen=data['cuenta_origen'],
             tipo='transferencia',
             monto=float(data['monto']),
             numero_cuenta_destino=data['cuenta_destino'],
-            descripcion=data.get('descripcion', 'Transferencia')
+            descripcion=data.get('descripcion', 'Transferencia'),
+            version_origen=version
         )
         
         if error:
-            return jsonify({'message': error}), 400
+            return respuesta_error(error)
         
         return jsonify({
             'message': 'Transferencia realizada exitosamente',
@@ -106,10 +117,11 @@ def create_transfer():
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @transactions_bp.route('/deposit', methods=['POST'])
+@idempotente
 def create_deposit():
     """Realiza un depósito en una cuenta"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -127,16 +139,22 @@ def create_deposit():
         if cuenta['id_cliente'] != user_id:
             return jsonify({'message': 'No autorizado para usar esta cuenta'}), 403
         
+        # If-Match: la operación solo se aplica sobre la versión que vio el cliente
+        version = version_exigida(cuenta)
+        if version is False:
+            return jsonify({'message': ERROR_PRECONDICION}), 412
+        
         # Crear transacción
         transaccion, error = Transaccion.crear_transaccion(
             numero_cuenta_origen=data['numero_cuenta'],
             tipo='deposito',
             monto=float(data['monto']),
-            descripcion=data.get('descripcion', 'Depósito')
+            descripcion=data.get('descripcion', 'Depósito'),
+            version_origen=version
         )
         
         if error:
-            return jsonify({'message': error}), 400
+            return respuesta_error(error)
         
         return jsonify({
             'message': 'Depósito realizado exitosamente',
@@ -147,10 +165,11 @@ def create_deposit():
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
 @transactions_bp.route('/withdraw', methods=['POST'])
+@idempotente
 def create_withdrawal():
     """Realiza un retiro de una cuenta"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -168,16 +187,22 @@ def create_withdrawal():
         if cuenta['id_cliente'] != user_id:
             return jsonify({'message': 'No autorizado para usar esta cuenta'}), 403
         
+        # If-Match: la operación solo se aplica sobre la versión que vio el cliente
+        version = version_exigida(cuenta)
+        if version is False:
+            return jsonify({'message': ERROR_PRECONDICION}), 412
+        
         # Crear transacción
         transaccion, error = Transaccion.crear_transaccion(
             numero_cuenta_origen=data['numero_cuenta'],
             tipo='retiro',
             monto=float(data['monto']),
-            descripcion=data.get('descripcion', 'Retiro')
+            descripcion=data.get('descripcion', 'Retiro'),
+            version_origen=version
         )
         
         if error:
-            return jsonify({'message': error}), 400
+            return respuesta_error(error)
         
         return jsonify({
             'message': 'Retiro realizado exitosamente',
@@ -187,29 +212,70 @@ def create_withdrawal():
     except Exception as e:
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
 
+@transactions_bp.route('/batch', methods=['POST'])
+@idempotente
+def create_batch():
+    """Aplica un lote de depósitos, retiros y transferencias con una sola escritura"""
+    try:
+        user_id = usuario_actual()
+        if not user_id:
+            return jsonify({'message': 'No autenticado'}), 401
+        
+        data = request.get_json()
+        
+        # Validar campos requeridos
+        operaciones = data.get('operaciones') if isinstance(data, dict) else None
+        if not isinstance(operaciones, list) or not operaciones:
+            return jsonify({'message': 'Se requiere una lista de operaciones'}), 400
+        if len(operaciones) > LOTE_MAX:
+            return jsonify({'message': f'El lote admite hasta {LOTE_MAX} operaciones'}), 400
+        
+        modo = data.get('modo', 'todo_o_nada')
+        if modo not in ['todo_o_nada', 'mejor_esfuerzo']:
+            return jsonify({'message': "Modo inválido. Use 'todo_o_nada' o 'mejor_esfuerzo'"}), 400
+        
+        # La cuenta origen de cada operación debe pertenecer al usuario
+        resultados, aplicadas = Transaccion.procesar_lote(
+            operaciones, todo_o_nada=(modo == 'todo_o_nada'), id_cliente=user_id
+        )
+        
+        if not aplicadas:
+            mensaje = 'Lote revertido' if modo == 'todo_o_nada' else 'Ninguna operación fue aplicada'
+        else:
+            mensaje = 'Lote procesado exitosamente'
+        return jsonify({
+            'message': mensaje,
+            'mode': modo,
+            'applied': aplicadas,
+            'failed': len(operaciones) - aplicadas,
+            'results': resultados
+        }), 201 if aplicadas else 400
+    
+    except Exception as e:
+        return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
+
 @transactions_bp.route('/stats', methods=['GET'])
 def get_transactions_stats():
     """Obtiene estadísticas de transacciones del usuario"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
-        transacciones = Transaccion.obtener_transacciones_por_cliente(user_id)
-        
-        # Calcular estadísticas
-        total_depositos = sum(float(t['monto']) for t in transacciones if t['tipo_transaccion'] == 'deposito')
-        total_retiros = sum(float(t['monto']) for t in transacciones if t['tipo_transaccion'] == 'retiro')
-        total_transferencias = sum(float(t['monto']) for t in transacciones if t['tipo_transaccion'] == 'transferencia')
+        # Estadísticas desde los resúmenes materializados del cliente (montos en centavos)
+        totales = resumenes.totales_cliente(user_id)
+        depositos = totales.get('deposito', [0, 0])
+        retiros = totales.get('retiro', [0, 0])
+        transferencias = totales.get('transferencia', [0, 0])
         
         return jsonify({
-            'total_transactions': len(transacciones),
-            'total_deposits': round(total_depositos, 2),
-            'total_withdrawals': round(total_retiros, 2),
-            'total_transfers': round(total_transferencias, 2),
-            'count_deposits': sum(1 for t in transacciones if t['tipo_transaccion'] == 'deposito'),
-            'count_withdrawals': sum(1 for t in transacciones if t['tipo_transaccion'] == 'retiro'),
-            'count_transfers': sum(1 for t in transacciones if t['tipo_transaccion'] == 'transferencia')
+            'total_transactions': sum(conteo for conteo, _ in totales.values()),
+            'total_deposits': round(depositos[1] / 100, 2),
+            'total_withdrawals': round(retiros[1] / 100, 2),
+            'total_transfers': round(transferencias[1] / 100, 2),
+            'count_deposits': depositos[0],
+            'count_withdrawals': retiros[0],
+            'count_transfers': transferencias[0]
         }), 200
     
     except Exception as e:
@@ -219,7 +285,7 @@ def get_transactions_stats():
 def get_transactions_by_account(numero_cuenta):
     """Obtiene todas las transacciones de una cuenta específica"""
     try:
-        user_id = get_user_id_from_token()
+        user_id = usuario_actual()
         if not user_id:
             return jsonify({'message': 'No autenticado'}), 401
         
@@ -232,12 +298,7 @@ def get_transactions_by_account(numero_cuenta):
             return jsonify({'message': 'No autorizado'}), 403
         
         # Obtener transacciones de la cuenta
-        from utils.file_manager import read_json
-        todas_transacciones = read_json('transacciones.json')
-        transacciones_cuenta = [
-            t for t in todas_transacciones 
-            if t['numero_cuenta_origen'] == numero_cuenta or t.get('numero_cuenta_destino') == numero_cuenta
-        ]
+        transacciones_cuenta = Transaccion.obtener_transacciones_por_cuenta(numero_cuenta)
         
         # Ordenar por fecha descendente
         transacciones_cuenta.sort(key=lambda x: x['fecha_hora'], reverse=True)
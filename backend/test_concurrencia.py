@@ -0,0 +1,312 @@
+# Pruebas de concurrencia entre procesos, de recuperación tras una caída y del
+# formato en disco de los archivos de datos
+#
+# Cada prueba trabaja sobre una copia del backend en un directorio temporal (data/ se
+# ubica junto a utils/) y ejecuta el código en procesos reales, como los workers de
+# gunicorn. No necesita el servidor levantado:
+#     python -m pytest -q test_concurrencia.py
+
+import os
+import sys
+import json
+import time
+import shutil
+import textwrap
+import subprocess
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVOS = ('clientes.json', 'credenciales.json', 'cuentas.json', 'transacciones.json')
+
+# Código común de los procesos: cliente de prueba de Flask y token del usuario
+PREAMBULO = '''
+import sys, os, json
+sys.path.insert(0, ".")
+def salida(valor):
+    print("RESULTADO " + json.dumps(valor))
+'''
+CLIENTE_HTTP = '''
+from app import app
+from utils.auth import generate_token
+http = app.test_client()
+def headers(**extra):
+    return dict({"Authorization": "Bearer " + generate_token(ID_CLIENTE, "prueba@test.com")}, **extra)
+'''
+
+
+def ejecutar(backend, codigo, esperar=True, http=False, **variables):
+    """Ejecuta `codigo` en un proceso nuevo dentro de la copia del backend.
+
+    `backend` es el dict del fixture (su 'path' y el 'almacenamiento' que usan los
+    procesos). Las `variables` se definen antes del código; con http=True también
+    `http` y headers() (CLIENTE_HTTP). Con esperar=False retorna el Popen; si no, el
+    valor que el proceso pasó a salida().
+    """
+    definiciones = ''.join(f'{nombre} = {valor!r}\n' for nombre, valor in variables.items())
+    fuente = PREAMBULO + definiciones + (CLIENTE_HTTP if http else '') + textwrap.dedent(codigo)
+    proceso = subprocess.Popen(
+        [sys.executable, '-c', fuente], cwd=backend['path'], text=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        env=dict(os.environ, BANCO_IDEMPOTENCIA_ESPERA='0.3', BANCO_ADMISION='0',
+                 BANCO_STORAGE=backend.get('almacenamiento', 'json')),
+    )
+    return resultado(proceso) if esperar else proceso
+
+
+def resultado(proceso, timeout=120):
+    stdout, stderr = proceso.communicate(timeout=timeout)
+    for linea in reversed(stdout.splitlines()):
+        if linea.startswith('RESULTADO '):
+            return json.loads(linea[len('RESULTADO '):])
+    pytest.fail(f'El proceso no retornó resultado (código {proceso.returncode}):\n{stderr[-2000:]}')
+
+
+def copiar_backend(tmp_path):
+    """Copia del backend con los archivos de datos vacíos ('[]')"""
+    destino = tmp_path / 'backend'
+    shutil.copytree(
+        BACKEND_DIR, destino,
+        ignore=shutil.ignore_patterns('__pycache__', 'data', 'src', 'node_modules', '.pytest_cache'),
+    )
+    os.makedirs(destino / 'data')
+    for filename in ARCHIVOS:
+        with open(destino / 'data' / filename, 'w') as f:
+            json.dump([], f)
+    return destino
+
+
+@pytest.fixture(params=['indentado', 'jsonl', 'sqlite'])
+def backend(tmp_path, request):
+    """Copia del backend con un cliente, dos cuentas corrientes y una de ahorro.
+
+    El ledger queda en cada formato o, con 'sqlite', todo migrado a SQLite
+    (manage.py migrate-sqlite) y los procesos usan BANCO_STORAGE=sqlite.
+    """
+    destino = copiar_backend(tmp_path)
+    if request.param == 'jsonl':
+        subprocess.run([sys.executable, 'manage.py', 'convert-ledger'], cwd=destino,
+                       check=True, capture_output=True)
+
+    backend = {'path': destino}
+    datos = ejecutar(backend, '''
+        from models.Cliente import Cliente
+        from models.Cuenta import Cuenta
+        cliente, _ = Cliente.crear_cliente("Ana", "Prueba", "0801", "Tegucigalpa", "9999", "prueba@test.com", "clave")
+        a, _ = Cuenta.crear_cuenta(cliente["id_cliente"], "corriente", 0.0)
+        b, _ = Cuenta.crear_cuenta(cliente["id_cliente"], "corriente", 10000.0)
+        c, _ = Cuenta.crear_cuenta(cliente["id_cliente"], "ahorro", 1000.0)
+        salida({"id_cliente": cliente["id_cliente"], "a": a["numero_cuenta"], "b": b["numero_cuenta"], "ahorro": c["numero_cuenta"]})
+    ''')
+    if request.param == 'sqlite':
+        subprocess.run([sys.executable, 'manage.py', 'migrate-sqlite'], cwd=destino,
+                       check=True, capture_output=True)
+        backend['almacenamiento'] = 'sqlite'
+    return dict(backend, **datos)
+
+
+def estado(backend):
+    """Saldos de las cuentas y registros del ledger, leídos desde disco por otro proceso"""
+    return ejecutar(backend, '''
+        from utils import file_manager as fm
+        ids = [t["id_transaccion"] for t in fm.stream_json("transacciones.json")]
+        salida({
+            "saldos": {c["numero_cuenta"]: c["saldo"] for c in fm.read_json("cuentas.json")},
+            "registros": len(ids), "ids_unicos": len(ids) == len(set(ids)),
+        })
+    ''')
+
+
+def test_dos_procesos_escriben_el_mismo_ledger(backend):
+    codigo = '''
+        from concurrent.futures import ThreadPoolExecutor
+        from models.Transaccion import Transaccion
+        def operacion(i):
+            if i % 2:
+                return Transaccion.crear_transaccion(A, "deposito", 1.0)[1]
+            return Transaccion.crear_transaccion(B, "transferencia", 1.0, A)[1]
+        with ThreadPoolExecutor(4) as ex:
+            errores = [e for e in ex.map(operacion, range(OPERACIONES)) if e]
+        salida(errores)
+    '''
+    procesos = [ejecutar(backend, codigo, esperar=False, A=backend['a'], B=backend['b'], OPERACIONES=40)
+                for _ in range(2)]
+    assert [resultado(p) for p in procesos] == [[], []]
+
+    final = estado(backend)
+    # 80 operaciones: 40 depósitos (un registro) y 40 transferencias (dos registros)
+    assert final['saldos'][backend['a']] == 80.0
+    assert final['saldos'][backend['b']] == 10000.0 - 40
+    assert final['registros'] == 40 + 2 * 40
+    assert final['ids_unicos']
+
+
+def test_recuperacion_reaplica_el_wal_tras_una_caida(backend):
+    if backend.get('almacenamiento') == 'sqlite':
+        pytest.skip('SQLite recupera las transacciones con su propio WAL')
+    # El proceso registra la operación en el WAL y muere antes de aplicarla
+    ejecutar(backend, '''
+        import signal
+        from utils import file_manager as fm, wal
+        cuenta = fm.find_by_field("cuentas.json", "numero_cuenta", A)
+        item = {"id_transaccion": fm.reserve_ids("transacciones.json", 1, "id_transaccion"),
+                "numero_cuenta_origen": A, "numero_cuenta_destino": None, "tipo_transaccion": "deposito",
+                "monto": 50.0, "fecha_hora": "2025-01-01T00:00:00", "descripcion": "caida", "estado": "completada"}
+        campos = {"item": item}
+        path = os.path.join(fm.DATA_FOLDER, "transacciones.json")
+        if fm.formato("transacciones.json") == "jsonl":
+            campos["offset"] = os.path.getsize(path)
+            with open(path, "ab") as f:
+                f.write(json.dumps(item).encode()[:20])  # línea cortada por la caída
+        wal.registrar("add", "transacciones.json", **campos)
+        wal.registrar("update", "cuentas.json", id=A, campo="numero_cuenta", cambios={"saldo": cuenta["saldo"] + 50})
+        os.kill(os.getpid(), signal.SIGKILL)
+    ''', esperar=False, A=backend['a']).wait(timeout=60)
+
+    # Al reiniciar se reaplica una sola vez, aunque recuperar se ejecute de nuevo
+    recuperado = ejecutar(backend, '''
+        from utils import file_manager as fm, wal
+        fm.recuperar()
+        fm.recuperar()
+        salida({"pendientes": wal.pendientes(), "ultimo": list(fm.stream_json("transacciones.json"))[-1]["descripcion"]})
+    ''')
+    assert recuperado == {'pendientes': 0, 'ultimo': 'caida'}
+    final = estado(backend)
+    assert final['saldos'][backend['a']] == 50.0
+    assert final['registros'] == 1
+
+
+def test_idempotency_key_repetida_tras_reiniciar(backend):
+    deposito = '''
+        r = http.post("/api/transactions/deposit", json={"numero_cuenta": A, "monto": 25},
+                      headers=headers(**{"Idempotency-Key": CLAVE}))
+        salida({"status": r.status_code, "cuerpo": r.get_json(), "repetida": r.headers.get("Idempotent-Replayed")})
+    '''
+    variables = dict(http=True, A=backend['a'], ID_CLIENTE=backend['id_cliente'])
+    primera = ejecutar(backend, deposito, CLAVE='k-1', **variables)
+    repetida = ejecutar(backend, deposito, CLAVE='k-1', **variables)
+    assert primera['status'] == 201 and primera['repetida'] is None
+    assert repetida == dict(primera, repetida='true')
+    assert estado(backend)['saldos'][backend['a']] == 25.0
+
+
+def test_idempotency_key_en_curso_de_una_ejecucion_anterior(backend):
+    # Clave en curso que dejó otra ejecución: con el mismo pid (contenedor reiniciado,
+    # PID 1) se vuelve a ejecutar; si la tiene un proceso vivo, se responde 409
+    codigo = '''
+        import time, hashlib
+        from utils import idempotencia
+        cuerpo = json.dumps({"numero_cuenta": A, "monto": 10}).encode()
+        huella = hashlib.sha256(b"POST /api/transactions/deposit\\n" + cuerpo).hexdigest()
+        with open(idempotencia.IDEMPOTENCIA_PATH, "a") as f:
+            for clave, pid in (("anterior", os.getpid()), ("viva", os.getppid())):
+                f.write(json.dumps({"clave": f"{ID_CLIENTE}:{clave}", "huella": huella, "estado": "en_curso",
+                                    "pid": pid, "instancia": "ejecucion-anterior", "expira": time.time() + 600}) + "\\n")
+        def depositar(clave):
+            return http.post("/api/transactions/deposit", data=cuerpo, content_type="application/json",
+                             headers=headers(**{"Idempotency-Key": clave})).status_code
+        salida({"anterior": depositar("anterior"), "viva": depositar("viva")})
+    '''
+    assert ejecutar(backend, codigo, http=True, A=backend['a'], ID_CLIENTE=backend['id_cliente']) == {
+        'anterior': 201, 'viva': 409,
+    }
+    assert estado(backend)['saldos'][backend['a']] == 10.0
+
+
+def test_if_match_entre_procesos(backend):
+    variables = dict(http=True, A=backend['a'], ID_CLIENTE=backend['id_cliente'])
+    etag = ejecutar(backend, '''
+        r = http.get(f"/api/accounts/{A}", headers=headers())
+        salida(r.headers["ETag"])
+    ''', **variables)
+
+    # Dos procesos depositan con el mismo ETag: solo uno se aplica, el otro recibe 412
+    deposito = '''
+        r = http.post("/api/transactions/deposit", json={"numero_cuenta": A, "monto": 5},
+                      headers=headers(**{"If-Match": ETAG}))
+        salida(r.status_code)
+    '''
+    procesos = [ejecutar(backend, deposito, esperar=False, ETAG=etag, **variables) for _ in range(2)]
+    assert sorted(resultado(p) for p in procesos) == [201, 412]
+    assert ejecutar(backend, deposito, ETAG='"999"', **variables) == 412
+    assert estado(backend)['saldos'][backend['a']] == 5.0
+
+
+def test_interes_del_periodo_se_acredita_una_vez(backend):
+    codigo = '''
+        r = http.post("/api/operations/calculate-interest", json={"numero_cuenta": AHORRO}, headers=headers())
+        salida(r.status_code)
+    '''
+    procesos = [ejecutar(backend, codigo, esperar=False, http=True, AHORRO=backend['ahorro'],
+                         ID_CLIENTE=backend['id_cliente']) for _ in range(2)]
+    assert sorted(resultado(p) for p in procesos) == [200, 409]
+    assert estado(backend)['registros'] == 1
+
+
+def test_resumenes_leen_la_cola_de_otro_proceso(backend):
+    # Estadísticas y dashboard salen de los resúmenes: tras escrituras de este proceso
+    # y de otro se ponen al día leyendo solo la cola, sin reconstruir desde cero
+    codigo = '''
+        import subprocess
+        from utils import resumenes
+        construcciones = []
+        construir = resumenes._construir
+        resumenes._construir = lambda: construcciones.append(1) or construir()
+        RUTAS = ("/api/transactions/stats", "/api/dashboard/stats", "/api/dashboard/analytics", "/api/dashboard/summary")
+        def consultar():
+            respuestas = {ruta: http.get(ruta, headers=headers()) for ruta in RUTAS}
+            estados = {ruta: r.status_code for ruta, r in respuestas.items()}
+            return estados, respuestas["/api/transactions/stats"].get_json()
+        def resumenes_actuales():
+            return ({k: r.a_dict() for k, r in resumenes._clientes.items()},
+                    {k: r.a_dict() for k, r in resumenes._cuentas.items()})
+
+        estados, antes = consultar()
+        http.post("/api/transactions/deposit", json={"numero_cuenta": A, "monto": 5}, headers=headers())
+        subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, '.')\\n"
+                        "from models.Transaccion import Transaccion\\n"
+                        f"for _ in range(3): Transaccion.crear_transaccion({A!r}, 'deposito', 5.0)"], check=True)
+        estados_despues, despues = consultar()
+        incremental, construidos = resumenes_actuales(), len(construcciones)
+        resumenes.reconstruir(guardar=False)
+        salida({"estados": [estados, estados_despues], "depositos": [antes["count_deposits"], despues["count_deposits"]],
+                "monto": despues["total_deposits"] - antes["total_deposits"], "construcciones": construidos,
+                "igual": incremental == resumenes_actuales()})
+    '''
+    obtenido = ejecutar(backend, codigo, http=True, A=backend['a'], ID_CLIENTE=backend['id_cliente'])
+    assert all(estado == 200 for estados in obtenido['estados'] for estado in estados.values())
+    assert obtenido['depositos'][1] == obtenido['depositos'][0] + 4
+    assert obtenido['monto'] == 20.0
+    # Solo la primera consulta (sin estado guardado) recorre el ledger completo
+    assert obtenido['construcciones'] == 1
+    assert obtenido['igual']
+
+
+@pytest.mark.parametrize('formato', ['compacto', 'jsonl'])
+def test_archivo_sin_registros_conserva_su_formato(tmp_path, formato):
+    # Un archivo convertido sin registros ('[]' o vacío), truncado o borrado sigue en
+    # el formato elegido en la próxima escritura
+    destino = copiar_backend(tmp_path)
+    subprocess.run([sys.executable, 'manage.py', 'convert-format', '--formato', formato,
+                    '--archivos', 'transacciones.json'], cwd=destino, check=True, capture_output=True)
+    codigo = '''
+        from utils import file_manager as fm, formatos
+        path = os.path.join(fm.DATA_FOLDER, "transacciones.json")
+        vistos = {}
+        def agregar(caso):
+            item = {"id_transaccion": len(vistos) + 1, "numero_cuenta_origen": "1", "tipo_transaccion": "deposito",
+                    "monto": 1.0, "fecha_hora": "2025-01-01T00:00:00", "estado": "completada"}
+            antes = fm.formato("transacciones.json")
+            fm.add_item("transacciones.json", item)
+            with open(path, "rb") as f:
+                vistos[caso] = [antes, formatos.detectar(f.read(64))]
+        agregar("sin_registros")
+        open(path, "w").close()
+        agregar("truncado")
+        os.remove(path)
+        agregar("inexistente")
+        salida(vistos)
+    '''
+    assert ejecutar({'path': destino}, codigo) == {
+        caso: [formato, formato] for caso in ('sin_registros', 'truncado', 'inexistente')
+    }
@@ -195,6 +195,7 @@ if __name__ == "__main__":
     
     print("🧹 Limpiando archivos de datos para prueba limpia...")
     write_json('clientes.json', [])
+    write_json('credenciales.json', [])
     write_json('cuentas.json', [])
     write_json('transacciones.json', [])
     print("✅ Archivos limpiados\n")
@@ -0,0 +1,299 @@
+import os
+import math
+import asyncio
+import time
+import heapq
+import itertools
+import threading
+from collections import OrderedDict
+
+from flask import request, jsonify, g
+
+from utils.asincrono import HILOS
+from utils.logger import get_logger
+
+log = get_logger('admision')
+
+# Control de admisión por grupo de rutas (ver README_BACKEND, "Control de admisión"):
+#   - token bucket por usuario y grupo: sin fichas, 429 con Retry-After
+#   - cupos de ejecución compartidos con cola acotada: cola llena o espera vencida, 503
+# Los movimientos de dinero pasan primero en la cola y los reportes no pueden ocupar
+# más de la mitad de los cupos, así un pico de reportes no demora las transferencias.
+ACTIVO = os.environ.get('BANCO_ADMISION', '1') == '1'
+CAPACIDAD = int(os.environ.get('BANCO_ADMISION_CAPACIDAD', str(HILOS)))
+COLA_MAX = int(os.environ.get('BANCO_ADMISION_COLA', '64'))
+ESPERA_MAX = float(os.environ.get('BANCO_ADMISION_ESPERA', '5'))
+BUCKETS_MAX = 10000
+
+# grupo -> prioridad en la cola (menor pasa antes), tasa (fichas/s), ráfaga y cupos máximos
+GRUPOS = {
+    'dinero': {'prioridad': 0, 'tasa': 20.0, 'rafaga': 40, 'cupos': CAPACIDAD},
+    'general': {'prioridad': 1, 'tasa': 20.0, 'rafaga': 40, 'cupos': CAPACIDAD},
+    'reportes': {'prioridad': 2, 'tasa': 5.0, 'rafaga': 20, 'cupos': max(1, CAPACIDAD // 2)},
+}
+
+DINERO = {
+    'transactions.create_transfer', 'transactions.create_deposit',
+    'transactions.create_withdrawal', 'transactions.create_batch',
+    'payments.process_payment', 'operations.calculate_interest',
+}
+REPORTES = {
+    'transactions.get_transactions', 'transactions.get_transactions_stats',
+    'transactions.get_transactions_by_account', 'payments.get_payment_history',
+    'accounts.get_accounts_stats',
+}
+EXENTOS = {'health', 'home', 'static'}
+
+
+def _tasas_por_grupo(texto):
+    """Interpreta BANCO_ADMISION_TASAS, p. ej. "reportes=2/5,dinero=50/100" (fichas/s y ráfaga)"""
+    tasas = {}
+    for par in filter(None, (p.strip() for p in texto.split(','))):
+        grupo, _, valor = par.partition('=')
+        tasa, _, rafaga = valor.partition('/')
+        tasas[grupo.strip()] = (float(tasa), int(rafaga or max(1, float(tasa))))
+    return tasas
+
+
+for _grupo, (_tasa, _rafaga) in _tasas_por_grupo(os.environ.get('BANCO_ADMISION_TASAS', '')).items():
+    if _grupo in GRUPOS:
+        GRUPOS[_grupo].update(tasa=_tasa, rafaga=_rafaga)
+
+
+class Rechazo(Exception):
+    """La petición no se admite: status (429 o 503) y segundos sugeridos para reintentar"""
+
+    def __init__(self, status, mensaje, reintentar):
+        super().__init__(mensaje)
+        self.status = status
+        self.mensaje = mensaje
+        self.reintentar = reintentar
+
+
+class LimitadorTasa:
+    """Token buckets por (usuario, grupo), acotados con LRU"""
+
+    def __init__(self, maximo=BUCKETS_MAX):
+        self.maximo = maximo
+        self._buckets = OrderedDict()
+        self._mutex = threading.Lock()
+
+    def consumir(self, usuario, grupo):
+        """Toma una ficha del bucket o lanza Rechazo(429)"""
+        config = GRUPOS[grupo]
+        ahora = time.monotonic()
+        clave = (usuario, grupo)
+        with self._mutex:
+            fichas, ultimo = self._buckets.pop(clave, (config['rafaga'], ahora))
+            fichas = min(config['rafaga'], fichas + (ahora - ultimo) * config['tasa'])
+            if fichas < 1:
+                self._buckets[clave] = (fichas, ahora)
+                raise Rechazo(429, 'Demasiadas solicitudes, intente más tarde',
+                              math.ceil((1 - fichas) / config['tasa']))
+            self._buckets[clave] = (fichas - 1, ahora)
+            while len(self._buckets) > self.maximo:
+                self._buckets.popitem(last=False)
+
+
+class Controlador:
+    """Cupos de ejecución compartidos entre grupos, con cola de espera por prioridad"""
+
+    def __init__(self, capacidad=CAPACIDAD, cola_max=COLA_MAX):
+        self.capacidad = capacidad
+        self.cola_max = cola_max
+        self._cond = threading.Condition()
+        self._en_curso = {grupo: 0 for grupo in GRUPOS}
+        self._espera = []  # heap de (prioridad, orden, grupo)
+        self._orden = itertools.count()
+        self._despertadores = []  # (loop, futuro) de las esperas de entrar_async
+        self._stats = {'admitidas': 0, 'encoladas': 0, 'rechazadas_429': 0, 'rechazadas_503': 0}
+
+    def _libre(self, grupo):
+        return (sum(self._en_curso.values()) < self.capacidad
+                and self._en_curso[grupo] < GRUPOS[grupo]['cupos'])
+
+    def _turno(self, ticket):
+        """True si `ticket` es la primera petición en espera que puede entrar ahora"""
+        for candidato in sorted(self._espera):
+            if self._libre(candidato[2]):
+                return candidato is ticket
+        return False
+
+    def _notificar(self):
+        """Despierta a las esperas en hilos y a las del event loop (con _cond tomado)"""
+        self._cond.notify_all()
+        for loop, futuro in self._despertadores:
+            loop.call_soon_threadsafe(_resolver, futuro)
+        self._despertadores.clear()
+
+    def _encolar(self, grupo, espera):
+        """Ocupa un cupo libre (retorna None) o pone un ticket en la cola (con _cond tomado)"""
+        if not self._espera and self._libre(grupo):
+            self._ocupar(grupo)
+            return None
+        if len(self._espera) >= self.cola_max or espera <= 0:
+            self._stats['rechazadas_503'] += 1
+            raise Rechazo(503, 'Servidor ocupado, intente más tarde', 1)
+        ticket = (GRUPOS[grupo]['prioridad'], next(self._orden), grupo)
+        heapq.heappush(self._espera, ticket)
+        self._stats['encoladas'] += 1
+        return ticket
+
+    def _ocupar(self, grupo):
+        self._en_curso[grupo] += 1
+        self._stats['admitidas'] += 1
+
+    def _vencida(self, espera):
+        self._stats['rechazadas_503'] += 1
+        return Rechazo(503, 'Servidor ocupado, intente más tarde', max(1, math.ceil(espera)))
+
+    def _desencolar(self, ticket):
+        self._espera.remove(ticket)
+        heapq.heapify(self._espera)
+        # El siguiente en la cola puede ser de otro grupo con cupo libre
+        self._notificar()
+
+    def entrar(self, grupo, espera=ESPERA_MAX):
+        """Ocupa un cupo para `grupo`, esperando en la cola hasta `espera` segundos.
+
+        Lanza Rechazo(503) si la cola está llena o se vence la espera.
+        """
+        with self._cond:
+            ticket = self._encolar(grupo, espera)
+            if ticket is None:
+                return
+            limite = time.monotonic() + espera
+            try:
+                while not self._turno(ticket):
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise self._vencida(espera)
+                    self._cond.wait(restante)
+                self._ocupar(grupo)
+            finally:
+                self._desencolar(ticket)
+
+    async def entrar_async(self, grupo, espera=ESPERA_MAX):
+        """Como entrar, pero la espera en la cola no ocupa un hilo: se espera en el event loop.
+
+        El ticket va al mismo heap que los de entrar, así las vistas async respetan
+        la prioridad de los grupos; _notificar las despierta desde cualquier hilo.
+        """
+        with self._cond:
+            ticket = self._encolar(grupo, espera)
+        if ticket is None:
+            return
+        loop = asyncio.get_running_loop()
+        limite = loop.time() + espera
+        try:
+            while True:
+                with self._cond:
+                    if self._turno(ticket):
+                        self._ocupar(grupo)
+                        return
+                    restante = limite - loop.time()
+                    if restante <= 0:
+                        raise self._vencida(espera)
+                    futuro = loop.create_future()
+                    self._despertadores.append((loop, futuro))
+                await asyncio.wait({futuro}, timeout=restante)
+        finally:
+            with self._cond:
+                self._desencolar(ticket)
+
+    def salir(self, grupo):
+        with self._cond:
+            self._en_curso[grupo] -= 1
+            self._notificar()
+
+    def rechazo(self, status):
+        with self._cond:
+            self._stats[f'rechazadas_{status}'] += 1
+
+    def estadisticas(self):
+        with self._cond:
+            return dict(self._stats, capacidad=self.capacidad, en_cola=len(self._espera),
+                        en_curso=dict(self._en_curso))
+
+
+def _resolver(futuro):
+    if not futuro.done():
+        futuro.set_result(None)
+
+
+limitador = LimitadorTasa()
+controlador = Controlador()
+
+
+def grupo_de(endpoint, metodo):
+    """Grupo de admisión de un endpoint (None si está exento)"""
+    if endpoint is None or endpoint in EXENTOS or metodo == 'OPTIONS':
+        return None
+    if endpoint in DINERO:
+        return 'dinero'
+    if endpoint in REPORTES or endpoint.startswith('dashboard.'):
+        return 'reportes'
+    return 'general'
+
+
+def admitir():
+    """before_request: aplica el token bucket del usuario y ocupa un cupo del grupo.
+
+    Va después de autenticar (los buckets son por g.user_id, o por IP sin token).
+    Las vistas async en modo ASGI (g.vista_async) no esperan aquí, en un hilo del
+    ejecutor que necesitan las peticiones admitidas: el grupo queda en
+    g.admision_pendiente y asgi.py espera el cupo en el event loop (admitir_async).
+    """
+    g.grupo_admision = None
+    if not ACTIVO:
+        return None
+    grupo = grupo_de(request.endpoint, request.method)
+    if grupo is None:
+        return None
+    usuario = g.get('user_id') or request.remote_addr
+    try:
+        limitador.consumir(usuario, grupo)
+    except Rechazo as e:
+        controlador.rechazo(429)
+        return _respuesta_rechazo(e, grupo)
+    if g.get('vista_async'):
+        g.admision_pendiente = grupo
+        return None
+    try:
+        controlador.entrar(grupo)
+    except Rechazo as e:
+        return _respuesta_rechazo(e, grupo)
+    g.grupo_admision = grupo
+    return None
+
+
+async def admitir_async():
+    """Ocupa el cupo que admitir dejó pendiente para una vista async (en el event loop)"""
+    grupo = g.pop('admision_pendiente', None)
+    if grupo is None:
+        return None
+    try:
+        await controlador.entrar_async(grupo)
+    except Rechazo as e:
+        return _respuesta_rechazo(e, grupo)
+    g.grupo_admision = grupo
+    return None
+
+
+def liberar(error=None):
+    """teardown_request: devuelve el cupo ocupado por admitir"""
+    grupo = g.pop('grupo_admision', None)
+    if grupo is not None:
+        controlador.salir(grupo)
+
+
+def _respuesta_rechazo(rechazo, grupo):
+    log.info('peticion_rechazada', status=rechazo.status, grupo=grupo, ruta=request.path)
+    respuesta = jsonify({'message': rechazo.mensaje})
+    respuesta.status_code = rechazo.status
+    respuesta.headers['Retry-After'] = str(rechazo.reintentar)
+    return respuesta
+
+
+def estadisticas():
+    return controlador.estadisticas()
@@ -0,0 +1,64 @@
+import os
+import asyncio
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Ejecutor acotado para el I/O bloqueante (file_manager, SQLite) fuera del event loop.
+# En modo ASGI (asgi.py) también ejecuta las vistas síncronas: así el número de
+# hilos depende de las peticiones en curso y no de las conexiones abiertas.
+HILOS = int(os.environ.get('BANCO_ASGI_HILOS', str(min(32, (os.cpu_count() or 1) + 4))))
+
+_ejecutor = None
+_pid = None
+_mutex = threading.Lock()
+_stats = {'en_curso': 0, 'completadas': 0}
+
+
+def ejecutor():
+    """Ejecutor compartido (se crea al primer uso, uno por proceso)"""
+    global _ejecutor, _pid
+    with _mutex:
+        if _ejecutor is None or _pid != os.getpid():
+            _ejecutor = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix='banco-io')
+            _pid = os.getpid()
+        return _ejecutor
+
+
+def _contar(func):
+    with _mutex:
+        _stats['en_curso'] += 1
+    try:
+        return func()
+    finally:
+        with _mutex:
+            _stats['en_curso'] -= 1
+            _stats['completadas'] += 1
+
+
+async def en_hilo(func, *args, **kwargs):
+    """Ejecuta una función bloqueante en el ejecutor acotado y espera su resultado"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ejecutor(), _contar, functools.partial(func, *args, **kwargs))
+
+
+def a_sincrono(func):
+    """Convierte una vista async en síncrona para el modo WSGI (sin depender de asgiref)"""
+    @functools.wraps(func)
+    def envoltura(*args, **kwargs):
+        return asyncio.run(func(*args, **kwargs))
+    return envoltura
+
+
+def cerrar():
+    """Espera las tareas pendientes y libera los hilos del ejecutor"""
+    global _ejecutor
+    with _mutex:
+        ejecutor_actual, _ejecutor = _ejecutor, None
+    if ejecutor_actual is not None:
+        ejecutor_actual.shutdown(wait=True)
+
+
+def estadisticas():
+    with _mutex:
+        return dict(_stats, hilos=HILOS)
@@ -1,12 +1,27 @@
+import os
 import jwt
+import hmac
+import time
 import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g
 
 # Clave secreta para JWT (en producción debería estar en variables de entorno)
 SECRET_KEY = "tu_clave_secreta_super_segura_2024"
 
+# Token de las operaciones administrativas (header X-Admin-Token); sin definir, quedan deshabilitadas
+ADMIN_TOKEN = os.environ.get('BANCO_ADMIN_TOKEN')
+
+# Caché LRU de tokens ya verificados (token -> payload); cada entrada vence con su `exp`
+TOKENS_CACHE_MAX = int(os.environ.get('BANCO_TOKENS_CACHE', '1024'))
+
+_tokens = OrderedDict()
+_tokens_mutex = threading.Lock()
+_tokens_stats = {'aciertos': 0, 'fallos': 0}
+
 def hash_password(password):
     """Hashea una contraseña usando SHA256"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -25,37 +40,75 @@ def generate_token(user_id, email):
     return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
 
 def decode_token(token):
-    """Decodifica un token JWT"""
+    """Decodifica un token JWT (los ya verificados salen de la caché hasta su `exp`)"""
+    with _tokens_mutex:
+        payload = _tokens.get(token)
+        if payload is not None:
+            if payload.get('exp', 0) > time.time():
+                _tokens.move_to_end(token)
+                _tokens_stats['aciertos'] += 1
+                return payload
+            del _tokens[token]
+        _tokens_stats['fallos'] += 1
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    if TOKENS_CACHE_MAX > 0:
+        with _tokens_mutex:
+            _tokens[token] = payload
+            _tokens.move_to_end(token)
+            while len(_tokens) > TOKENS_CACHE_MAX:
+                _tokens.popitem(last=False)
+    return payload
+
+def estadisticas_tokens():
+    with _tokens_mutex:
+        return dict(_tokens_stats, en_cache=len(_tokens), max=TOKENS_CACHE_MAX)
+
+def autenticar():
+    """before_request: resuelve el usuario del header Authorization una sola vez por petición.
+
+    Deja `g.user_id` (None si no hay token válido) y `g.error_auth` con el motivo.
+    No rechaza la petición: cada ruta decide si exige autenticación.
+    """
+    g.user_id, g.error_auth = None, None
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        g.error_auth = 'Token no proporcionado'
+        return
+    partes = auth_header.split(" ")
+    if len(partes) < 2 or not partes[1]:
+        g.error_auth = 'Token inválido'  # Bearer <token>
+        return
+    payload = decode_token(partes[1])
+    if not payload or not payload.get('user_id'):
+        g.error_auth = 'Token inválido o expirado'
+        return
+    g.user_id = payload['user_id']
+
+def usuario_actual():
+    """ID del usuario autenticado en la petición actual (None si no hay)"""
+    if 'error_auth' not in g:
+        autenticar()
+    return g.user_id
+
+def es_admin():
+    """Verifica el header X-Admin-Token de la petición contra BANCO_ADMIN_TOKEN"""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
 
 def token_required(f):
     """Decorador para proteger rutas que requieren autenticación"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        
-        # Obtener token del header Authorization
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1]  # Bearer <token>
-            except IndexError:
-                return jsonify({'message': 'Token inválido'}), 401
-        
-        if not token:
-            return jsonify({'message': 'Token no proporcionado'}), 401
-        
-        # Verificar token
-        payload = decode_token(token)
-        if not payload:
-            return jsonify({'message': 'Token inválido o expirado'}), 401
+        user_id = usuario_actual()
+        if not user_id:
+            return jsonify({'message': g.error_auth}), 401
         
         # Pasar el user_id a la función
-        return f(payload['user_id'], *args, **kwargs)
+        return f(user_id, *args, **kwargs)
     
     return decorated
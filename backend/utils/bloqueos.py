@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se protege entre hilos del mismo proceso
+    fcntl = None
+
+# Bloqueos por cuenta: las operaciones que leen, validan y guardan el saldo de una
+# cuenta toman el bloqueo de su numero_cuenta. Operaciones sobre cuentas distintas
+# corren en paralelo; las de una misma cuenta se serializan. Las transferencias
+# toman los dos bloqueos siempre en el mismo orden (numero_cuenta ascendente), así
+# dos transferencias cruzadas A->B y B->A no pueden bloquearse mutuamente.
+
+
+class GestorBloqueos:
+    """Tabla de bloqueos reentrantes por clave, creados bajo demanda.
+
+    Cada entrada cuenta cuántos hilos la usan (o esperan) y se elimina cuando
+    queda libre, así la tabla no crece con el número total de cuentas.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._bloqueos = {}  # clave -> [RLock, usuarios]
+        self._stats = {'adquisiciones': 0, 'esperas': 0, 'espera_ms': 0.0}
+
+    def _tomar_entrada(self, clave):
+        with self._mutex:
+            entrada = self._bloqueos.get(clave)
+            if entrada is None:
+                entrada = self._bloqueos[clave] = [threading.RLock(), 0]
+            entrada[1] += 1
+            return entrada
+
+    def _soltar_entrada(self, clave, entrada):
+        with self._mutex:
+            entrada[1] -= 1
+            if entrada[1] == 0:
+                del self._bloqueos[clave]
+
+    def _adquirir(self, clave):
+        entrada = self._tomar_entrada(clave)
+        if entrada[0].acquire(blocking=False):
+            espera = None
+        else:
+            inicio = time.perf_counter()
+            entrada[0].acquire()
+            espera = (time.perf_counter() - inicio) * 1000
+        with self._mutex:
+            self._stats['adquisiciones'] += 1
+            if espera is not None:
+                self._stats['esperas'] += 1
+                self._stats['espera_ms'] += espera
+        return entrada
+
+    @contextmanager
+    def bloquear(self, *claves):
+        """Toma los bloqueos de las claves (sin repetir y en orden) durante el bloque `with`"""
+        ordenadas = sorted({str(c) for c in claves if c is not None})
+        tomadas = []
+        try:
+            for clave in ordenadas:
+                tomadas.append((clave, self._adquirir(clave)))
+            yield
+        finally:
+            for clave, entrada in reversed(tomadas):
+                entrada[0].release()
+                self._soltar_entrada(clave, entrada)
+
+    def estadisticas(self):
+        """Contadores de adquisiciones y esperas (contención entre operaciones de una misma cuenta)"""
+        with self._mutex:
+            stats = dict(self._stats)
+            stats['activos'] = len(self._bloqueos)
+        stats['espera_ms'] = round(stats['espera_ms'], 2)
+        return stats
+
+
+_cuentas = GestorBloqueos()
+
+
+@contextmanager
+def bloquear_cuentas(*numeros_cuenta):
+    """Bloquea las cuentas indicadas (en orden determinista) durante el bloque `with`.
+
+    Los bloqueos son de este proceso: entre workers, el bloqueo exclusivo de
+    file_manager se toma solo durante la escritura, y lo que otro worker cambió
+    entre la lectura y la escritura lo detecta la versión de la cuenta
+    (ConflictoVersion). Por eso quien escribe saldos con las cuentas bloqueadas
+    debe guardar con la versión leída y reintentar ante un conflicto (ver optimista).
+    """
+    with _cuentas.bloquear(*numeros_cuenta):
+        yield
+
+
+# Intentos sin bloqueos de una operación optimista antes de tomar los bloqueos
+REINTENTOS_OPTIMISTAS = int(os.environ.get('BANCO_REINTENTOS_OPTIMISTAS', '3'))
+_optimistas = {'operaciones': 0, 'conflictos': 0, 'con_bloqueo': 0}
+_optimistas_mutex = threading.Lock()
+
+
+def _contar_optimista(campo):
+    with _optimistas_mutex:
+        _optimistas[campo] += 1
+
+
+def optimista(operacion, *numeros_cuenta, reintentos=None):
+    """Ejecuta `operacion()` sin bloqueos, reintentando si otra escritura se adelanta.
+
+    La operación lee las cuentas y las guarda con la versión que leyó (compare-and-swap
+    de file_manager): si alguna cambió, falla con ConflictoVersion y se vuelve a
+    ejecutar desde la lectura. Tras `reintentos` conflictos se ejecuta con las
+    cuentas bloqueadas, donde solo puede chocar con escrituras optimistas en curso
+    o de otros workers.
+    """
+    from utils.file_manager import ConflictoVersion
+    _contar_optimista('operaciones')
+    for _ in range(REINTENTOS_OPTIMISTAS if reintentos is None else reintentos):
+        try:
+            return operacion()
+        except ConflictoVersion:
+            _contar_optimista('conflictos')
+    _contar_optimista('con_bloqueo')
+    with bloquear_cuentas(*numeros_cuenta):
+        while True:
+            try:
+                return operacion()
+            except ConflictoVersion:
+                _contar_optimista('conflictos')
+
+
+def estadisticas_cuentas():
+    """Contadores del gestor de bloqueos de cuentas y de las operaciones optimistas (ver /api/health)"""
+    stats = _cuentas.estadisticas()
+    with _optimistas_mutex:
+        stats['optimista'] = dict(_optimistas)
+    return stats
+
+
+class BloqueoProcesos:
+    """Bloqueo lector/escritor entre procesos (fcntl.flock) sobre un archivo de lock.
+
+    Varios lectores lo comparten; un escritor lo toma exclusivo. Dentro de un mismo
+    proceso el bloqueo es reentrante y compartido entre hilos (se lleva la cuenta
+    de usos): la exclusión entre hilos la dan _cache_lock y los bloqueos de cuenta.
+
+    El archivo guarda además el contador de commits: 8 bytes con la generación
+    global seguidos de un JSON {filename: generación de su último commit}. Así
+    cada proceso sabe qué archivos cambió otro proceso desde que los cacheó.
+    """
+
+    _GENERACION = struct.Struct('<Q')
+
+    def __init__(self, path):
+        self.path = path
+        # El flock bloqueante se espera sin tomar _cond: los demás hilos siguen
+        # usando el bloqueo ya tomado y solo esperan si necesitan cambiarlo
+        self._cond = threading.Condition()
+        self._cambiando = False
+        self._fd = None
+        self._pid = None
+        self._modo = None  # None, 'compartido' o 'exclusivo'
+        self._usos = 0
+        self._stats = {
+            'compartidos': 0, 'exclusivos': 0, 'esperas': 0,
+            'espera_ms': 0.0, 'espera_max_ms': 0.0,
+        }
+
+    def _descriptor(self):
+        # Después de un fork (workers de gunicorn) cada proceso abre su propio
+        # descriptor: flock comparte el bloqueo entre descriptores heredados
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+            self._modo, self._usos = None, 0
+        return self._fd
+
+    def _flock(self, fd, exclusivo):
+        if fcntl is None:
+            return None
+        operacion = fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH
+        try:
+            fcntl.flock(fd, operacion | fcntl.LOCK_NB)
+            return None
+        except BlockingIOError:
+            inicio = time.perf_counter()
+            fcntl.flock(fd, operacion)
+            return (time.perf_counter() - inicio) * 1000
+
+    def adquirir(self, exclusivo=False):
+        with self._cond:
+            # Otro hilo está tomando (o pasando a exclusivo) el flock: esperar su resultado
+            while self._cambiando:
+                self._cond.wait()
+            fd = self._descriptor()
+            self._usos += 1
+            self._stats['exclusivos' if exclusivo else 'compartidos'] += 1
+            if not (self._usos == 1 or (exclusivo and self._modo == 'compartido')):
+                return
+            self._cambiando = True
+        try:
+            # Un compartido que pasa a exclusivo no es atómico: el llamador
+            # debe revalidar lo que leyó (ver file_manager._sincronizar_procesos)
+            espera = self._flock(fd, exclusivo)
+        except BaseException:
+            with self._cond:
+                self._cambiando = False
+                self._cond.notify_all()
+            self.liberar()
+            raise
+        with self._cond:
+            self._modo = 'exclusivo' if exclusivo else 'compartido'
+            self._cambiando = False
+            self._cond.notify_all()
+            if espera is not None:
+                self._stats['esperas'] += 1
+                self._stats['espera_ms'] += espera
+                self._stats['espera_max_ms'] = max(self._stats['espera_max_ms'], espera)
+
+    def liberar(self):
+        with self._cond:
+            # Mientras otro hilo toma el flock su uso ya está contado: aquí no llega a 0
+            self._usos -= 1
+            if self._usos == 0:
+                if fcntl is not None:
+                    fcntl.flock(self._descriptor(), fcntl.LOCK_UN)
+                self._modo = None
+
+    @contextmanager
+    def compartido(self):
+        self.adquirir(exclusivo=False)
+        try:
+            yield
+        finally:
+            self.liberar()
+
+    @contextmanager
+    def exclusivo(self):
+        self.adquirir(exclusivo=True)
+        try:
+            yield
+        finally:
+            self.liberar()
+
+    def generacion(self):
+        """Generación global: cambia con cada commit de cualquier proceso"""
+        datos = os.pread(self._descriptor(), self._GENERACION.size, 0)
+        return self._GENERACION.unpack(datos)[0] if len(datos) == self._GENERACION.size else 0
+
+    def generaciones(self):
+        """Retorna (generación global, {filename: generación de su último commit})"""
+        fd = self._descriptor()
+        datos = os.pread(fd, os.fstat(fd).st_size, 0)
+        if len(datos) < self._GENERACION.size:
+            return 0, {}
+        tabla = json.loads(datos[self._GENERACION.size:] or b'{}')
+        return self._GENERACION.unpack_from(datos)[0], tabla
+
+    def registrar_commit(self, filename):
+        """Anota un commit sobre `filename` y retorna la nueva generación (con el bloqueo exclusivo)"""
+        generacion, tabla = self.generaciones()
+        generacion += 1
+        tabla[filename] = generacion
+        contenido = self._GENERACION.pack(generacion) + json.dumps(tabla, separators=(',', ':')).encode()
+        fd = self._descriptor()
+        os.pwrite(fd, contenido, 0)
+        os.ftruncate(fd, len(contenido))
+        return generacion
+
+    def estadisticas(self):
+        """Contadores de adquisiciones y de tiempo esperando a otros procesos"""
+        with self._cond:
+            stats = dict(self._stats)
+        stats['espera_ms'] = round(stats['espera_ms'], 2)
+        stats['espera_max_ms'] = round(stats['espera_max_ms'], 2)
+        return stats
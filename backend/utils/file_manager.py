@@ -1,82 +1,1425 @@
 import os
 import json
+import mmap
+import time
+import heapq
+import threading
+import zlib
+from contextlib import contextmanager
 from datetime import datetime
+from types import MappingProxyType
+
+from utils import formatos
+from utils.bloqueos import BloqueoProcesos
+from utils.logger import get_logger
+
+log = get_logger('file_manager')
 
 # Obtener el directorio del backend
 BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_FOLDER = os.path.join(BACKEND_DIR, "data")
 
-def read_json(filename):
-    """Lee un archivo JSON y retorna su contenido"""
+# Backend de almacenamiento: 'json' (archivos en data/) o 'sqlite'
+STORAGE_BACKEND = os.environ.get('BANCO_STORAGE', 'json')
+SQLITE_PATH = os.environ.get('BANCO_SQLITE_PATH', os.path.join(DATA_FOLDER, 'banco.db'))
+
+# Caché de registros en memoria: {filename: {'firma': (mtime_ns, size, inodo), 'data': [...]}}
+# Las listas se mantienen parseadas entre peticiones y se actualizan en sitio en
+# cada escritura; solo se vuelve a leer el archivo si cambia su firma (por ejemplo,
+# si alguien lo edita a mano) o si otro proceso lo modificó (ver LOCK_PATH).
+_cache = {}
+_cache_lock = threading.RLock()
+
+# Los archivos JSON Lines a partir de este tamaño se recorren con mmap
+MMAP_MIN_BYTES = 8 * 1024 * 1024
+
+# Índices hash secundarios que se mantienen junto al caché de cada archivo.
+# campo -> True si el valor es único (apunta a un registro) o False si agrupa
+# varios registros (apunta a una lista).
+INDICES = {
+    'clientes.json': {'id_cliente': True, 'email': True, 'dni': True},
+    'credenciales.json': {'id_cliente': True, 'email': True},
+    'cuentas.json': {'id_cuenta': True, 'numero_cuenta': True, 'id_cliente': False},
+}
+
+# Listas de postings: para cada valor de estos campos (un número de cuenta), las
+# posiciones de los registros que lo mencionan, en orden de llegada. En archivos
+# JSON la posición es el índice en la lista cacheada; en ledgers JSON Lines es el
+# offset en bytes de la línea, así no hace falta tener el historial en memoria.
+POSTINGS = {
+    'transacciones.json': ('numero_cuenta_origen', 'numero_cuenta_destino'),
+}
+_postings_jsonl = {}
+
+# Ledgers particionados por mes (ver archivar): campo con la fecha de cada registro.
+# Los meses cerrados pasan a particiones selladas en data/archivo/ y el archivo
+# original queda como partición activa.
+PARTICIONES = {
+    'transacciones.json': 'fecha_hora',
+}
+
+# Versión por registro (control optimista de concurrencia): cada actualización
+# incrementa el campo. update_item y aplicar_lote con la versión que leyó el
+# llamador fallan con ConflictoVersion si el registro cambió mientras tanto.
+VERSIONES = {
+    'cuentas.json': 'version',
+}
+
+
+class ConflictoVersion(Exception):
+    """El registro cambió desde que se leyó: su versión ya no es la esperada"""
+
+    def __init__(self, filename, id_value, esperada, actual):
+        super().__init__(f"{filename}: {id_value} tiene versión {actual}, se esperaba {esperada}")
+        self.id_value = id_value
+        self.esperada = esperada
+        self.actual = actual
+
+# Observadores de append por archivo (ver on_append)
+_observadores = {}
+
+# Group commit (BANCO_GROUP_COMMIT=1): las escrituras se aplican al caché y al WAL
+# sin fsync; un solo flush por ventana sincroniza el WAL y reescribe una vez cada
+# archivo modificado. Cada petición espera a que su lote sea durable antes de
+# retornar. El flush se adelanta si se juntan FLUSH_LOTE escrituras.
+GROUP_COMMIT = os.environ.get('BANCO_GROUP_COMMIT', '0') == '1'
+FLUSH_INTERVALO = float(os.environ.get('BANCO_FLUSH_INTERVALO_MS', '5')) / 1000
+FLUSH_LOTE = int(os.environ.get('BANCO_FLUSH_LOTE', '64'))
+
+# ticket: escrituras aplicadas; durable: escrituras ya sincronizadas a disco;
+# sucios: {filename: 'reescribir' | 'fsync'}; lider: hay un hilo esperando para hacer el flush;
+# retenido: el bloqueo exclusivo entre procesos se mantiene hasta el flush;
+# escribiendo: hilos dentro de (o esperando) una escritura, que pronto sumarán su ticket
+_grupo = {'ticket': 0, 'durable': 0, 'sucios': {}, 'lider': False, 'retenido': False, 'escribiendo': 0}
+_grupo_cond = threading.Condition()
+_flush_stats = {'flushes': 0, 'escrituras': 0, 'max_por_flush': 0, 'ultimo_flush': 0}
+
+# Profundidad de _escritura por hilo: quien ya está dentro de una escritura no
+# puede esperar el flush de otro hilo (ver _confirmar)
+_local = threading.local()
+
+# Varios procesos (workers de gunicorn) sobre la misma carpeta data/: las lecturas
+# desde disco toman el bloqueo compartido de LOCK_PATH y las escrituras el
+# exclusivo. Cada commit anota su archivo en LOCK_PATH (ver BloqueoProcesos); los
+# demás procesos descartan de su caché lo que otro proceso cambió.
+LOCK_PATH = os.path.join(DATA_FOLDER, "banco.lock")
+_procesos = BloqueoProcesos(LOCK_PATH)
+# global: última generación vista; archivos: {filename: generación cacheada}
+_generaciones = {'global': None, 'archivos': {}, 'invalidaciones': 0}
+
+# Formato en disco de cada archivo convertido o vaciado ({filename: formato}): los
+# archivos sin registros no lo dicen en su contenido (ver _formato_archivo)
+FORMATOS_PATH = os.path.join(DATA_FOLDER, "formatos.json")
+_formatos = {'firma': None, 'data': {}}
+
+def _firma_archivo(path):
+    """Retorna (mtime_ns, size, inodo) del archivo o None si no existe"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    # Cada reescritura es un archivo nuevo (temporal + rename): el inodo cambia
+    # aunque el tamaño y el mtime coincidan
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _sincronizar_procesos():
+    """Descarta del caché los archivos que otro proceso modificó (con _cache_lock tomado)"""
+    generacion = _procesos.generacion()
+    if generacion == _generaciones['global']:
+        return
+    generacion, tabla = _procesos.generaciones()
+    vistas = _generaciones['archivos']
+    for filename, ultima in tabla.items():
+        if ultima > vistas.get(filename, 0):
+            vistas[filename] = ultima
+            if _cache.pop(filename, None) is not None:
+                _generaciones['invalidaciones'] += 1
+            _postings_jsonl.pop(filename, None)
+    # El WAL y el snapshot los comparten todos los procesos
+    from utils import wal
+    wal.invalidar()
+    _generaciones['global'] = generacion
+
+def _commit(filename):
+    """Anota que `filename` cambió en disco (con el bloqueo exclusivo tomado)"""
+    generacion = _procesos.registrar_commit(filename)
+    _generaciones['global'] = generacion
+    _generaciones['archivos'][filename] = generacion
+
+@contextmanager
+def _escritura():
+    """_cache_lock más el bloqueo exclusivo entre procesos, con el caché al día"""
+    profundidad = getattr(_local, 'profundidad', 0)
+    if profundidad == 0 and GROUP_COMMIT:
+        with _grupo_cond:
+            _grupo['escribiendo'] += 1
+    _local.profundidad = profundidad + 1
+    try:
+        with _cache_lock, _procesos.exclusivo():
+            _sincronizar_procesos()
+            yield
+    finally:
+        _local.profundidad = profundidad
+        if profundidad == 0 and GROUP_COMMIT:
+            with _grupo_cond:
+                _grupo['escribiendo'] -= 1
+                _grupo_cond.notify_all()
+
+@contextmanager
+def bloqueo_escritura():
+    """Bloqueo exclusivo entre procesos para un ciclo leer-validar-guardar.
+
+    Lo toman los bloqueos de cuenta (utils/bloqueos.py): así ningún otro worker
+    escribe entre que se lee un saldo y se guarda el nuevo.
+    """
+    with _procesos.exclusivo():
+        with _cache_lock:
+            _sincronizar_procesos()
+        yield
+
+def bloqueo_stats():
+    """Contadores del bloqueo entre procesos: esperas y cachés descartados por commits ajenos"""
+    stats = _procesos.estadisticas()
+    with _cache_lock:
+        stats['invalidaciones'] = _generaciones['invalidaciones']
+    return stats
+
+def _retener_exclusivo():
+    """Con group commit el caché va adelante del disco: el bloqueo exclusivo sigue hasta el flush"""
+    if not _grupo['retenido']:
+        _procesos.adquirir(exclusivo=True)
+        _grupo['retenido'] = True
+
+def _formato_archivo(path):
+    """Detecta el formato de un archivo de datos (ver utils/formatos.py)
+
+    Los archivos JSON de siempre empiezan con '['; un ledger convertido empieza con '{'.
+    Si el archivo no tiene registros (no existe, está vacío o es '[]') vale el formato
+    registrado en FORMATOS_PATH; sin registro, un archivo vacío es un ledger JSON
+    Lines y los demás quedan indentados.
+    """
+    try:
+        with open(path, 'rb') as f:
+            inicio = f.read(64)
+    except FileNotFoundError:
+        inicio = None
+    formato = formatos.detectar(inicio) if inicio is not None else None
+    if formato is None:
+        formato = _formatos_registrados().get(os.path.relpath(path, DATA_FOLDER))
+    if formato is None:
+        formato = 'jsonl' if inicio is not None and not inicio.strip() else 'indentado'
+    return formato
+
+def _formatos_registrados():
+    """{filename: formato} de FORMATOS_PATH (se vuelve a leer si otro proceso lo cambió)"""
+    firma = _firma_archivo(FORMATOS_PATH)
+    if _formatos['firma'] != firma:
+        try:
+            with open(FORMATOS_PATH, 'rb') as f:
+                registrados = formatos.loads(f.read())
+        except FileNotFoundError:
+            registrados = {}
+        _formatos.update(firma=firma, data=registrados)
+    return _formatos['data']
+
+def _registrar_formato(path, formato):
+    """Anota el formato de un archivo en FORMATOS_PATH (con el bloqueo de escritura tomado)"""
+    nombre = os.path.relpath(path, DATA_FOLDER)
+    registrados = _formatos_registrados()
+    if registrados.get(nombre) == formato:
+        return
+    registrados = dict(registrados, **{nombre: formato})
+    tmp_path = FORMATOS_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(registrados, f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, FORMATOS_PATH)
+    _formatos.update(firma=_firma_archivo(FORMATOS_PATH), data=registrados)
+
+def _iter_jsonl(path, claves=None):
+    """Recorre un archivo JSON Lines registro por registro.
+
+    `claves` (bytes) filtra antes de decodificar: solo se parsean las líneas que
+    contienen alguna de ellas.
+    """
+    if os.path.getsize(path) >= MMAP_MIN_BYTES:
+        yield from _iter_jsonl_mmap(path, claves)
+        return
+    with open(path, 'rb') as f:
+        for linea in f:
+            if claves and not any(c in linea for c in claves):
+                continue
+            linea = linea.strip()
+            if linea:
+                yield formatos.loads(linea)
+
+def _iter_jsonl_mmap(path, claves=None):
+    """Igual que _iter_jsonl pero sobre el archivo mapeado en memoria (sin copiar a buffers)"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0
+        fin_archivo = len(mm)
+        while pos < fin_archivo:
+            fin = mm.find(b'\n', pos)
+            if fin == -1:
+                fin = fin_archivo
+            if claves and not any(0 <= mm.find(c, pos, fin) for c in claves):
+                pos = fin + 1
+                continue
+            linea = mm[pos:fin].strip()
+            pos = fin + 1
+            if linea:
+                yield formatos.loads(linea)
+
+def _ultima_linea_jsonl(path, fin=None):
+    """Última línea (bytes, sin espacios) de un archivo JSON Lines, leyendo desde el final o desde el byte `fin`"""
+    with open(path, 'rb') as f:
+        if fin is None:
+            f.seek(0, os.SEEK_END)
+            fin = f.tell()
+        bloque = b''
+        pos = fin
+        while pos > 0:
+            salto = min(4096, pos)
+            pos -= salto
+            f.seek(pos)
+            bloque = f.read(salto) + bloque
+            lineas = bloque.strip().split(b'\n')
+            if len(lineas) > 1 or pos == 0:
+                return lineas[-1].strip()
+    return b''
+
+def _ultimo_registro_jsonl(path):
+    """Lee solo el último registro de un archivo JSON Lines (leyendo desde el final)"""
+    ultima = _ultima_linea_jsonl(path)
+    return formatos.loads(ultima) if ultima else None
+
+def _iter_array(path, tam_bloque=65536):
+    """Recorre un archivo JSON de arreglo elemento por elemento sin cargarlo completo"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buf = f.read(tam_bloque).lstrip()
+        if not buf.startswith('['):
+            return
+        pos = 1
+        while True:
+            # Saltar separadores; pedir más datos si el buffer se acabó
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buf):
+                mas = f.read(tam_bloque)
+                if not mas:
+                    return
+                buf, pos = mas, 0
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                item, fin = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                mas = f.read(tam_bloque)
+                if not mas:
+                    raise
+                buf, pos = buf[pos:] + mas, 0
+                continue
+            yield item
+            pos = fin
+            if pos > tam_bloque:
+                buf, pos = buf[pos:], 0
+
+def iter_archivo(path, where=None, claves=None):
+    """Recorre los registros de un archivo de datos (arreglo o JSON Lines) sin cargarlo completo.
+
+    El filtro se aplica mientras se parsea, así la memoria no depende del tamaño
+    del archivo:
+      - claves: textos que todo registro buscado contiene; en JSON Lines las líneas
+        que no los contienen ni se decodifican.
+      - where: predicado final sobre cada registro decodificado.
+    """
+    if not os.path.exists(path):
+        return
+    claves_bytes = [c.encode('utf-8') for c in claves] if claves else None
+    formato = 'gzip' if path.endswith('.gz') else _formato_archivo(path)
+    if formato == 'gzip':
+        from utils.particiones import iter_comprimida
+        registros = iter_comprimida(path, claves_bytes)
+    elif formato == 'jsonl':
+        registros = _iter_jsonl(path, claves_bytes)
+    else:
+        registros = _iter_array(path)
+    for item in registros:
+        if where is None or where(item):
+            yield item
+
+def stream_json(filename, where=None, claves=None, particion=None):
+    """Recorre un archivo de datos directamente desde disco, con memoria acotada.
+
+    En un ledger particionado recorre todas sus particiones en orden, o solo
+    `particion` (un nombre retornado por particiones()). Ver iter_archivo para
+    los filtros `where` y `claves`.
+    """
+    nombres = [particion] if particion else particiones(filename)
+    for nombre in nombres:
+        yield from iter_archivo(os.path.join(DATA_FOLDER, nombre), where, claves)
+
+def formato(filename):
+    """Formato en disco de un archivo de datos: 'indentado', 'compacto' o 'jsonl'"""
+    return _formato_archivo(os.path.join(DATA_FOLDER, filename))
+
+def particiones(filename, desde=None, hasta=None):
+    """Nombres de las particiones de un ledger que se solapan con los meses [desde, hasta].
+
+    Los meses son 'YYYY-MM'. Van de la más antigua a la más nueva; la última es
+    siempre el archivo activo. Un archivo sin particiones retorna [filename].
+    """
+    if filename not in PARTICIONES:
+        return [filename]
+    from utils import particiones as archivo
+    return [p['nombre'] for p in archivo.listar(filename, desde, hasta)] + [filename]
+
+# --- Lectura incremental de ledgers (ver utils/resumenes.py) ---
+#
+# Quien mantiene datos derivados de un ledger guarda un cursor opaco (un valor JSON)
+# y lee solo lo agregado desde entonces. En estos archivos el cursor anota cada
+# partición sellada {mes: {'nombre', 'firma', 'registros'}} y el archivo activo
+# {'inodo', 'offset', 'registros', 'ultimo', 'firma'}: 'offset' es el byte hasta
+# donde se leyó un ledger JSON Lines y 'ultimo' la huella de su última línea leída.
+
+class ColaLedger:
+    """Registros de un ledger posteriores a un cursor (ver leer_cola).
+
+    `registros` produce pares (registro, reemplazable). Al terminar de recorrerlos,
+    `cursor` es el cursor nuevo y `posicion` la posicion_ledger que le corresponde
+    (None si el ledger siguió cambiando durante la lectura). Si `cursor` queda None,
+    el ledger no continúa al cursor pedido: lo leído no sirve y hay que leerlo completo.
+    """
+
+    def __init__(self):
+        self.registros = iter(())
+        self.reescrito = False
+        self.cursor = None
+        self.posicion = None
+
+def _firma_lista(nombre):
+    firma = _firma_archivo(os.path.join(DATA_FOLDER, nombre))
+    return list(firma) if firma is not None else None
+
+def _huella(linea):
+    """Huella de una línea de un ledger JSON Lines (comprueba que el cursor siga valiendo)"""
+    return zlib.crc32(linea.strip())
+
+def posicion_ledger(filename):
+    """Posición actual de un ledger: valor opaco que cambia con cada escritura.
+
+    Igual (==) a la posición de una ColaLedger o de avanzar_cursor si desde entonces
+    no cambió nada; sirve para saber sin leer el ledger si hay registros nuevos.
+    """
+    nombres = particiones(filename)
+    selladas = {os.path.basename(n).partition('.')[0]: [n, _firma_lista(n)] for n in nombres[:-1]}
+    return [selladas, _firma_lista(filename)]
+
+def _posicion_cursor(cursor):
+    if cursor['activo']['firma'] is None:
+        return None
+    return [{mes: [p['nombre'], p['firma']] for mes, p in cursor['selladas'].items()}, cursor['activo']['firma']]
+
+def _activo_vacio():
+    return {'inodo': None, 'offset': None, 'registros': 0, 'ultimo': None, 'firma': None}
+
+def _lineas_desde(path, offset):
+    """Recorre un ledger JSON Lines desde el byte `offset`: (registro, offset siguiente, huella).
+
+    Una última línea sin salto (una escritura en curso) se deja para la próxima lectura.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for linea in f:
+            if not linea.endswith(b'\n'):
+                return
+            offset += len(linea)
+            if linea.strip():
+                yield formatos.loads(linea), offset, _huella(linea)
+
+@contextmanager
+def leer_cola(filename, cursor=None):
+    """Lee los registros de un ledger posteriores a `cursor` y produce una ColaLedger.
+
+    Con cursor None se recorre el ledger completo sin bloquear a los escritores; si
+    un archivado lo cambió durante el recorrido, el cursor de la cola queda None.
+    La cola, con el bloqueo compartido tomado, tiene solo las particiones selladas
+    nuevas, los registros que se les agregaron y lo que creció el archivo activo.
+    Los registros del archivo activo son reemplazables: si alguna partición sellada
+    cambió, un archivado lo reescribió (`reescrito`) y se vuelven a leer completos.
+    """
+    cola = ColaLedger()
+    if cursor is not None:
+        with _procesos.compartido():
+            cola.registros = _cola(filename, cursor, cola)
+            yield cola
+        return
+    cola.registros = _cola(filename, None, cola)
+    yield cola
+    if cola.cursor is not None:
+        # Un archivado toma el bloqueo exclusivo hasta terminar: con el compartido se
+        # sabe si alguno empezó o terminó durante el recorrido
+        with _procesos.compartido():
+            selladas, firma = posicion_ledger(filename)
+        leidas = {mes: [p['nombre'], p['firma']] for mes, p in cola.cursor['selladas'].items()}
+        if selladas != leidas or (firma and firma[2]) != cola.cursor['activo']['inodo']:
+            cola.cursor = cola.posicion = None
+
+def _cola(filename, cursor, cola):
+    selladas, firma = posicion_ledger(filename)
+    previas = cursor['selladas'] if cursor is not None else {}
+    if any(mes not in selladas for mes in previas):
+        return
+    cambiadas = {mes for mes, (_, firma_sellada) in selladas.items()
+                 if mes not in previas or previas[mes]['firma'] != firma_sellada}
+    cola.reescrito = cursor is not None and bool(cambiadas)
+
+    # sellar agrega al final de la partición existente: los primeros registros son los ya leídos
+    nuevas = {}
+    for mes, (nombre, firma_sellada) in selladas.items():
+        registros = previas[mes]['registros'] if mes in previas else 0
+        if mes in cambiadas:
+            leidos = 0
+            for item in iter_archivo(os.path.join(DATA_FOLDER, nombre)):
+                leidos += 1
+                if leidos > registros:
+                    yield item, False
+            if leidos < registros:
+                return
+            registros = leidos
+        nuevas[mes] = {'nombre': nombre, 'firma': firma_sellada, 'registros': registros}
+
+    # Archivo activo: en JSON Lines, si es el mismo (inodo) se lee desde el offset; si se
+    # reescribió (conversión de formato) o es un arreglo JSON, se recorre salteando los
+    # registros ya leídos
+    activo = cursor['activo'] if cursor is not None and not cambiadas else _activo_vacio()
+    path = os.path.join(DATA_FOLDER, filename)
+    jsonl = _formato_archivo(path) == 'jsonl'
+    continua = jsonl and activo['offset'] is not None and firma is not None and firma[2] == activo['inodo']
+    if continua and activo['offset'] and (
+            firma[1] < activo['offset'] or _huella(_ultima_linea_jsonl(path, activo['offset'])) != activo['ultimo']):
+        # Mismo archivo con otro contenido antes del offset: se truncó (ver recuperar)
+        return
+    if continua:
+        base, omitir, offset, ultimo = activo['registros'], 0, activo['offset'], activo['ultimo']
+        registros = _lineas_desde(path, offset)
+    else:
+        base, omitir, offset, ultimo = 0, activo['registros'], 0 if jsonl else None, None
+        registros = (_lineas_desde(path, 0) if jsonl
+                     else ((item, None, None) for item in iter_archivo(path)))
+    leidos = 0
+    for item, offset, ultimo in registros:
+        leidos += 1
+        if leidos > omitir:
+            yield item, True
+    if leidos < omitir:
+        return
+    # La firma solo se anota si el archivo es exactamente lo leído: si no, la próxima
+    # lectura vuelve a mirar desde el cursor
+    actual = _firma_lista(filename)
+    vigente = actual is not None and firma is not None and (
+        actual == firma if offset is None else actual[2] == firma[2] and actual[1] == offset)
+    cola.cursor = {'selladas': nuevas, 'activo': {
+        'inodo': firma[2] if firma is not None else None, 'offset': offset,
+        'registros': base + leidos, 'ultimo': ultimo, 'firma': actual if vigente else None,
+    }}
+    cola.posicion = _posicion_cursor(cola.cursor)
+
+def avanzar_cursor(filename, cursor, item, firma_previa, firma_nueva):
+    """Cursor después de un append notificado por on_append (ver leer_cola).
+
+    Retorna (cursor, posicion, reemplazable), o None si el append no continúa al
+    cursor: hubo escrituras que no pasaron por el observador y hay que leer la cola.
+    """
+    activo = cursor['activo']
+    if activo['firma'] is None or activo['firma'] != list(firma_previa or ()):
+        return None
+    firma = list(firma_nueva)
+    cursor = dict(cursor, activo=dict(
+        activo, firma=firma, inodo=firma[2], registros=activo['registros'] + 1,
+        offset=firma[1] if activo['offset'] is not None else None,
+        ultimo=_huella(_serializar_linea(item).encode('utf-8')) if activo['offset'] is not None else None,
+    ))
+    return cursor, _posicion_cursor(cursor), True
+
+def archivar(filename, antes_de=None, comprimir=False):
+    """Mueve los registros de meses cerrados de un ledger a particiones mensuales selladas.
+
+    Se archivan los meses anteriores a `antes_de` ('YYYY-MM', por defecto el mes
+    actual); el archivo del ledger se reescribe solo con el resto. Retorna
+    {mes: registros en la partición}.
+    """
+    from utils import particiones as archivo
+    campo = PARTICIONES[filename]
+    antes_de = antes_de or datetime.now().strftime('%Y-%m')
     path = os.path.join(DATA_FOLDER, filename)
-    print(f"[FileManager] Leyendo archivo: {path}")
-    print(f"[FileManager] Path absoluto: {os.path.abspath(path)}")
-    print(f"[FileManager] Archivo existe: {os.path.exists(path)}")
+    with _escritura():
+        # Con el WAL vacío no quedan registros que apunten a offsets del archivo actual
+        checkpoint()
+        por_mes, activos = {}, []
+        for item in iter_archivo(path):
+            mes = str(item.get(campo, ''))[:7]
+            if len(mes) == 7 and mes < antes_de:
+                por_mes.setdefault(mes, []).append(item)
+            else:
+                activos.append(item)
+        if comprimir:
+            # También se comprimen los meses que ya se habían archivado sin comprimir
+            for particion in archivo.listar(filename, hasta=antes_de):
+                if not particion['comprimida'] and particion['mes'] < antes_de:
+                    por_mes.setdefault(particion['mes'], [])
+        if not por_mes:
+            return {}
+
+        # Primero las particiones (durables), después el archivo activo
+        resultado = {mes: archivo.sellar(filename, mes, items, comprimir) for mes, items in sorted(por_mes.items())}
+        _reemplazar_archivo(path, activos, sync=True)
+        _commit(filename)
+        _cache.pop(filename, None)
+        _postings_jsonl.pop(filename, None)
+        checkpoint()
+    log.info('ledger_archivado', archivo=filename, meses=sorted(resultado), activos=len(activos))
+    return resultado
+
+def _serializar_linea(item):
+    """Serializa un registro como una línea JSON compacta"""
+    return json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def _parsear_archivo(path):
+    """Parsea un archivo de datos completo en cualquiera de los formatos soportados"""
+    formato = _formato_archivo(path)
+    if formato == 'jsonl':
+        return list(_iter_jsonl(path))
+    with open(path, 'rb') as f:
+        return formatos.loads(f.read())
+
+def _leer_archivo(path):
+    """Lee y parsea un archivo de datos desde disco"""
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            print(f"[FileManager] Datos cargados: {len(data)} items")
-            return data
+        data = _parsear_archivo(path)
+        log.debug('archivo_cargado', path=path, items=len(data))
+        return data
     except FileNotFoundError:
-        print(f"[FileManager] Archivo no encontrado")
+        log.warning('archivo_no_encontrado', path=path)
         return []
     except json.JSONDecodeError:
-        print(f"[FileManager] Error al decodificar JSON")
+        log.error('json_invalido', path=path)
         return []
 
+def _construir_indices(filename, data):
+    """Construye los índices hash configurados en INDICES para un archivo"""
+    indices = {campo: {} for campo in INDICES.get(filename, {})}
+    for item in data:
+        _indexar(filename, indices, item)
+    return indices
+
+def _indexar(filename, indices, item):
+    """Agrega un registro a los índices de su archivo"""
+    for campo, unico in INDICES.get(filename, {}).items():
+        if campo not in item:
+            continue
+        if unico:
+            indices[campo].setdefault(item[campo], item)
+        else:
+            indices[campo].setdefault(item[campo], []).append(item)
+
+def _nueva_entrada(filename, firma, data):
+    return {'firma': firma, 'data': data, 'indices': _construir_indices(filename, data)}
+
+def _entrada(filename):
+    """Retorna la entrada de caché de un archivo, recargándola si cambió en disco"""
+    path = os.path.join(DATA_FOLDER, filename)
+    with _cache_lock:
+        _sincronizar_procesos()
+        firma = _firma_archivo(path)
+        entrada = _cache.get(filename)
+        # Con group commit el caché va adelante del disco hasta el próximo flush
+        if entrada is not None and (entrada['firma'] == firma or filename in _grupo['sucios']):
+            return entrada
+
+        # Compartido: otro proceso no puede estar agregando al archivo mientras se lee
+        with _procesos.compartido():
+            firma = _firma_archivo(path)
+            data = _leer_archivo(path) if firma is not None else []
+        entrada = _nueva_entrada(filename, firma, data)
+        _cache[filename] = entrada
+        return entrada
+
+def _cargar(filename):
+    """Retorna la lista cacheada de un archivo, recargándola si cambió en disco.
+
+    La lista retornada es la del caché: no debe modificarse fuera de este módulo.
+    """
+    return _entrada(filename)['data']
+
+def precargar():
+    """Carga al caché los archivos indexados y construye sus índices (una vez al iniciar)"""
+    for filename in INDICES:
+        _entrada(filename)
+
+def invalidate_cache(filename=None):
+    """Descarta el caché de un archivo (o de todos si filename es None)"""
+    with _cache_lock:
+        # Lo que aún no se escribió (group commit) solo existe en el caché
+        _flush_pendientes()
+        if filename is None:
+            _cache.clear()
+        else:
+            _cache.pop(filename, None)
+
+def read_json(filename):
+    """Lee un archivo JSON y retorna su contenido"""
+    # Copias de los registros: update_item los modifica en sitio dentro del caché,
+    # así el llamador nunca ve (ni serializa) un registro a medio actualizar.
+    # Los cambios deben guardarse con write_json.
+    return [dict(item) for item in _cargar(filename)]
+
+def iter_json(filename):
+    """Recorre los registros de un archivo uno por uno.
+
+    Los ledgers en formato JSON Lines se leen línea por línea desde disco sin
+    cargarlos completos en memoria; los archivos JSON normales salen del caché.
+    """
+    path = os.path.join(DATA_FOLDER, filename)
+    if _formato_archivo(path) == 'jsonl':
+        with _cache_lock:
+            entrada = _cache.get(filename)
+            if entrada is not None and entrada['firma'] == _firma_archivo(path):
+                data = list(entrada['data'])
+            else:
+                data = None
+        if data is not None:
+            yield from data
+        elif os.path.exists(path):
+            yield from _iter_jsonl(path)
+        return
+    yield from list(_cargar(filename))
+
+def _reemplazar_archivo(path, data, sync=False, formato=None):
+    """Reemplaza el contenido de un archivo de datos (temporal + rename).
+
+    Se conserva el formato actual del archivo, salvo que se indique otro.
+    """
+    tmp_path = path + '.tmp'
+    formato = formato or _formato_archivo(path)
+    if not data:
+        # Sin registros el contenido no dice el formato: queda registrado aparte
+        _registrar_formato(path, formato)
+    if formato == 'jsonl':
+        contenido = ''.join(_serializar_linea(item) for item in data).encode('utf-8')
+    else:
+        contenido = formatos.serializar(data, formato)
+    with open(tmp_path, 'wb') as f:
+        f.write(contenido)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    # Un corte a mitad de escritura deja el archivo anterior intacto
+    os.replace(tmp_path, path)
+
+def _escribir(filename, data, agregados=0):
+    """Reemplaza el contenido de un archivo de datos y actualiza su caché.
+
+    `agregados`: los últimos registros de `data` son nuevos y el resto es la lista
+    cacheada sin cambios (add_item): las listas de postings se conservan y solo se
+    extienden con las posiciones nuevas, en vez de reconstruirse en la próxima lectura.
+    """
+    path = os.path.join(DATA_FOLDER, filename)
+    with _cache_lock:
+        previa = _cache.get(filename)
+        if GROUP_COMMIT:
+            # El archivo se reescribe una sola vez en el próximo flush
+            firma = _cache[filename]['firma'] if filename in _grupo['sucios'] else _firma_archivo(path)
+            entrada = _nueva_entrada(filename, firma, list(data))
+            _grupo['sucios'][filename] = 'reescribir'
+            _retener_exclusivo()
+        else:
+            _reemplazar_archivo(path, data)
+            _commit(filename)
+            entrada = _nueva_entrada(filename, _firma_archivo(path), list(data))
+        if agregados and previa is not None and 'postings' in previa:
+            listas = entrada['postings'] = previa['postings']
+            for i in range(len(data) - agregados, len(data)):
+                _agregar_posting(listas, POSTINGS[filename], data[i], i)
+        _cache[filename] = entrada
+
 def write_json(filename, data):
-    """Escribe datos en un archivo JSON"""
+    """Escribe datos en un archivo JSON (o JSON Lines si el archivo es un ledger)"""
+    with _escritura():
+        data = list(data)
+        ticket = _registrar('write', filename, data=data)
+        _escribir(filename, data)
+        _checkpoint_si_corresponde()
+    _confirmar(ticket)
+
+def convertir_a_jsonl(filename):
+    """Convierte (una sola vez) un archivo JSON de arreglo al formato ledger JSON Lines.
+
+    Retorna la cantidad de registros convertidos, o None si ya estaba convertido.
+    """
+    path = os.path.join(DATA_FOLDER, filename)
+    with _escritura():
+        if not os.path.exists(path) or _formato_archivo(path) == 'jsonl':
+            return None
+        # Los registros pendientes del WAL se refieren al formato anterior
+        checkpoint()
+        data = _parsear_archivo(path)
+        _registrar_formato(path, 'jsonl')
+        _reemplazar_archivo(path, data, sync=True, formato='jsonl')
+        _commit(filename)
+        _cache.pop(filename, None)
+        checkpoint()
+    return len(data)
+
+def convertir_formato(filename, formato):
+    """Reescribe un archivo de datos en otro formato en disco (ver utils/formatos.py).
+
+    Retorna la cantidad de registros, o None si no existe o ya estaba en ese formato.
+    Los ledgers en 'jsonl' agregan cada registro al final; los demás formatos
+    reescriben el archivo completo en cada cambio.
+    """
+    if formato not in formatos.FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato}")
+    if formato == 'jsonl':
+        return convertir_a_jsonl(filename)
+    path = os.path.join(DATA_FOLDER, filename)
+    with _escritura():
+        if not os.path.exists(path) or _formato_archivo(path) == formato:
+            return None
+        checkpoint()
+        data = _parsear_archivo(path)
+        _registrar_formato(path, formato)
+        _reemplazar_archivo(path, data, sync=True, formato=formato)
+        _commit(filename)
+        _cache.pop(filename, None)
+        _postings_jsonl.pop(filename, None)
+        # El snapshot registra el tamaño de los ledgers JSON Lines: debe actualizarse
+        checkpoint()
+    return len(data)
+
+def _ultimo_id(filename, id_field):
+    """Retorna el mayor ID presente en el archivo (0 si está vacío)"""
     path = os.path.join(DATA_FOLDER, filename)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    if _formato_archivo(path) == 'jsonl':
+        # En un ledger los IDs se agregan en orden: basta con leer el último registro
+        ultimo = _ultimo_registro_jsonl(path) if os.path.exists(path) else None
+        if ultimo:
+            return ultimo[id_field]
+    else:
+        data = _cargar(filename)
+        if data:
+            return max(item[id_field] for item in data)
+    # Partición activa vacía: el último ID está en la partición sellada más reciente
+    selladas = particiones(filename)[:-1]
+    if selladas:
+        return max((item[id_field] for item in stream_json(filename, particion=selladas[-1])), default=0)
+    return 0
+
+def reserve_ids(filename, cantidad, id_field='id'):
+    """Reserva un bloque de IDs consecutivos (para inserciones en lote) y retorna el primero.
+
+    Usa la secuencia persistida del archivo: no recorre los datos salvo la primera vez.
+    """
+    from utils import sequences
+    return sequences.reservar(filename, cantidad, semilla=lambda: _ultimo_id(filename, id_field))
 
 def get_next_id(filename, id_field='id'):
-    """Obtiene el siguiente ID disponible"""
-    data = read_json(filename)
-    if not data:
-        return 1
-    return max(item[id_field] for item in data) + 1
+    """Obtiene (y reserva) el siguiente ID disponible"""
+    return reserve_ids(filename, 1, id_field)
+
+def _copia(item):
+    """Copia de un registro del caché (las búsquedas nunca entregan el registro compartido)"""
+    return dict(item) if item is not None else None
+
+def find_by_id(filename, id_value, id_field='id', solo_lectura=False):
+    """Busca un elemento por ID (retorna una copia).
 
-def find_by_id(filename, id_value, id_field='id'):
-    """Busca un elemento por ID"""
-    data = read_json(filename)
+    Con solo_lectura=True retorna una vista inmutable (MappingProxyType) que queda
+    guardada en la entrada del caché: las lecturas repetidas del mismo registro no
+    copian nada hasta la próxima escritura del archivo, que crea una entrada nueva.
+    """
+    entrada = _entrada(filename)
+    if solo_lectura:
+        vistas = entrada.setdefault('vistas', {}).setdefault(id_field, {})
+        vista = vistas.get(id_value)
+        if vista is None:
+            # La copia se toma con el lock: una escritura no puede estar modificándolo
+            with _cache_lock:
+                item = find_by_id(filename, id_value, id_field)
+                if item is not None:
+                    vista = vistas[id_value] = MappingProxyType(item)
+        return vista
+    if INDICES.get(filename, {}).get(id_field):
+        return _copia(entrada['indices'][id_field].get(id_value))
+    data = entrada['data']
     for item in data:
         if item[id_field] == id_value:
-            return item
+            return _copia(item)
     return None
 
 def find_by_field(filename, field_name, field_value):
-    """Busca un elemento por un campo específico"""
-    data = read_json(filename)
-    print(f"[FileManager] Buscando '{field_name}' = '{field_value}' en {len(data)} items")
+    """Busca un elemento por un campo específico (retorna una copia)"""
+    entrada = _entrada(filename)
+    if INDICES.get(filename, {}).get(field_name):
+        return _copia(entrada['indices'][field_name].get(field_value))
+    data = entrada['data']
+    log.debug('busqueda_lineal', archivo=filename, campo=field_name, items=len(data))
+    trace = log.trace_activo
     for item in data:
-        print(f"[FileManager] Comparando: '{item.get(field_name)}' == '{field_value}'")
+        if trace:
+            log.trace('comparando', campo=field_name, valor=item.get(field_name))
         if item.get(field_name) == field_value:
-            print(f"[FileManager] ✅ Encontrado!")
-            return item
-    print(f"[FileManager] ❌ No encontrado")
+            return _copia(item)
     return None
 
-def update_item(filename, id_value, updated_data, id_field='id'):
-    """Actualiza un elemento existente"""
-    data = read_json(filename)
-    for i, item in enumerate(data):
-        if item[id_field] == id_value:
-            data[i].update(updated_data)
-            write_json(filename, data)
-            return data[i]
-    return None
+def find_all_by_field(filename, field_name, field_value):
+    """Busca todos los elementos con un valor en un campo específico (retorna copias)"""
+    entrada = _entrada(filename)
+    if field_name in INDICES.get(filename, {}):
+        encontrado = entrada['indices'][field_name].get(field_value)
+        if INDICES[filename][field_name]:
+            return [dict(encontrado)] if encontrado is not None else []
+        return [dict(item) for item in encontrado or []]
+    return [dict(item) for item in entrada['data'] if item.get(field_name) == field_value]
+
+def _agregar_posting(listas, campos, item, posicion):
+    for clave in {item.get(campo) for campo in campos}:
+        if clave is not None:
+            listas.setdefault(clave, []).append(posicion)
+
+def _postings_array(filename):
+    """Retorna la entrada de caché con sus listas de postings (se construyen al primer uso
+    y después se extienden con cada append, ver _escribir)"""
+    entrada = _entrada(filename)
+    if 'postings' not in entrada:
+        listas = {}
+        for i, item in enumerate(entrada['data']):
+            _agregar_posting(listas, POSTINGS[filename], item, i)
+        entrada['postings'] = listas
+    return entrada
+
+def _postings_ledger(nombre, path, campos):
+    """Retorna las listas de postings por offset de un ledger (o partición) JSON Lines"""
+    firma = _firma_archivo(path)
+    entrada = _postings_jsonl.get(nombre)
+    if entrada is not None and entrada['firma'] == firma:
+        return entrada
+
+    listas = {}
+    offset = 0
+    with open(path, 'rb') as f:
+        for linea in f:
+            if linea.strip():
+                _agregar_posting(listas, campos, formatos.loads(linea), offset)
+            offset += len(linea)
+    entrada = {'firma': firma, 'listas': listas}
+    _postings_jsonl[nombre] = entrada
+    return entrada
+
+def _mezclar(listas):
+    """Mezcla listas ordenadas de posiciones eliminando duplicados"""
+    resultado = []
+    for posicion in heapq.merge(*listas):
+        if not resultado or resultado[-1] != posicion:
+            resultado.append(posicion)
+    return resultado
+
+def iter_by_posting(filename, keys, particion=None):
+    """Recorre los registros que mencionan alguna de las claves, en orden de llegada.
+
+    Solo se visitan las listas de postings de esas claves (p. ej. las cuentas de un
+    cliente), no el archivo completo. En un ledger JSON Lines cada registro se lee
+    del disco al momento de entregarlo. En un ledger particionado se recorren todas
+    las particiones en orden, o solo `particion`.
+    """
+    nombres = [particion] if particion else particiones(filename)
+    for nombre in nombres:
+        if nombre == filename:
+            yield from _iter_by_posting_activo(filename, keys)
+        else:
+            yield from _iter_by_posting_sellada(filename, nombre, keys)
+
+def _iter_by_posting_sellada(filename, nombre, keys):
+    """Postings de una partición sellada: por offset, o filtrando si está comprimida"""
+    path = os.path.join(DATA_FOLDER, nombre)
+    campos = POSTINGS[filename]
+    if path.endswith('.gz'):
+        claves = set(keys)
+        yield from iter_archivo(path, lambda t: any(t.get(c) in claves for c in campos), list(claves))
+        return
+    with _cache_lock:
+        listas = _postings_ledger(nombre, path, campos)['listas']
+        offsets = _mezclar([listas.get(k, []) for k in keys])
+    with open(path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield formatos.loads(f.readline())
+
+def _iter_by_posting_activo(filename, keys):
+    path = os.path.join(DATA_FOLDER, filename)
+    with _cache_lock:
+        if _formato_archivo(path) == 'jsonl':
+            if not os.path.exists(path):
+                return
+            listas = _postings_ledger(filename, path, POSTINGS[filename])['listas']
+            offsets = _mezclar([listas.get(k, []) for k in keys])
+            data = None
+        else:
+            entrada = _postings_array(filename)
+            listas = entrada['postings']
+            posiciones = _mezclar([listas.get(k, []) for k in keys])
+            data = entrada['data']
+            registros = [data[i] for i in posiciones]
+
+    if data is not None:
+        yield from registros
+        return
+    # Las líneas de un ledger no cambian una vez escritas: se leen sin tomar el lock
+    with open(path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield formatos.loads(f.readline())
+
+def find_by_posting(filename, keys, particion=None):
+    """Retorna los registros que mencionan alguna de las claves, en orden de llegada"""
+    return list(iter_by_posting(filename, keys, particion))
+
+def _versionar(filename, id_value, item, cambios, esperada=None):
+    """Agrega a los cambios la versión siguiente del registro (archivos de VERSIONES).
+
+    Con `esperada`, el registro debe seguir en esa versión (si no, ConflictoVersion).
+    """
+    campo = VERSIONES.get(filename)
+    if not campo:
+        return cambios
+    actual = item.get(campo, 0)
+    if esperada is not None and actual != esperada:
+        raise ConflictoVersion(filename, id_value, esperada, actual)
+    return dict(cambios, **{campo: actual + 1})
+
+def update_item(filename, id_value, updated_data, id_field='id', version=None):
+    """Actualiza un elemento existente.
+
+    Si se indica `version`, solo se actualiza si el registro sigue en esa versión
+    (compare-and-swap); si cambió, ConflictoVersion.
+    """
+    with _escritura():
+        data = _cargar(filename)
+        for i, item in enumerate(data):
+            if item[id_field] == id_value:
+                updated_data = _versionar(filename, id_value, item, updated_data, version)
+                ticket = _registrar('update', filename, id=id_value, campo=id_field, cambios=updated_data)
+                data[i].update(updated_data)
+                _escribir(filename, data)
+                _checkpoint_si_corresponde()
+                actualizado = data[i]
+                break
+        else:
+            return None
+    _confirmar(ticket)
+    return actualizado
 
 def delete_item(filename, id_value, id_field='id'):
     """Elimina un elemento por ID"""
-    data = read_json(filename)
-    data = [item for item in data if item[id_field] != id_value]
-    write_json(filename, data)
+    with _escritura():
+        data = _cargar(filename)
+        data = [item for item in data if item[id_field] != id_value]
+        ticket = _registrar('delete', filename, id=id_value, campo=id_field)
+        _escribir(filename, data)
+        _checkpoint_si_corresponde()
+    _confirmar(ticket)
     return True
 
+def on_append(filename, callback):
+    """Registra callback(item, firma_previa, firma_nueva), llamado después de cada add_item.
+
+    Las firmas describen el archivo antes y después del append (aquí, las de
+    data_signature): si la previa no coincide con la que conoce el observador, hubo
+    cambios que no vio. Para un ledger, avanzar_cursor las interpreta.
+    """
+    _observadores.setdefault(filename, []).append(callback)
+
+def _notificar_append(filename, item, firma_previa, firma_nueva):
+    for callback in _observadores.get(filename, ()):
+        callback(item, firma_previa, firma_nueva)
+
+def data_signature(filename):
+    """Firma del contenido actual de un archivo: cambia con cada escritura"""
+    return _firma_archivo(os.path.join(DATA_FOLDER, filename))
+
 def add_item(filename, item):
     """Agrega un nuevo elemento"""
-    data = read_json(filename)
-    data.append(item)
-    write_json(filename, data)
+    path = os.path.join(DATA_FOLDER, filename)
+    with _escritura():
+        firma = _firma_archivo(path)
+        if _formato_archivo(path) == 'jsonl':
+            # Ledger: una sola escritura al final del archivo, sin releer el historial
+            lineas = [_serializar_linea(item).encode('utf-8')]
+            offsets = _offsets_lineas(firma, lineas)
+            ticket = _registrar('add', filename, item=item, offset=offsets[0])
+            _agregar_lineas(filename, path, firma, [item], lineas, offsets)
+        else:
+            data = _cargar(filename)
+            ticket = _registrar('add', filename, item=item)
+            # Se guarda una copia para que cambios posteriores del llamador
+            # sobre `item` no alteren el caché sin pasar por disco
+            data.append(dict(item))
+            _escribir(filename, data, agregados=1)
+        _notificar_append(filename, item, firma, _firma_archivo(path))
+        _checkpoint_si_corresponde()
+    _confirmar(ticket)
     return item
+
+def _offsets_lineas(firma, lineas):
+    """Offsets que tendrán las líneas (bytes) al agregarlas al final del archivo con esa firma"""
+    offset = firma[1] if firma else 0
+    offsets = []
+    for linea in lineas:
+        offsets.append(offset)
+        offset += len(linea)
+    return offsets
+
+def _agregar_lineas(filename, path, firma, items, lineas, offsets):
+    """Agrega registros al final de un ledger JSON Lines (una sola escritura) y actualiza caché y postings"""
+    entrada = _cache.get(filename)
+    vigente = entrada is not None and entrada['firma'] == firma
+    postings = _postings_jsonl.get(filename)
+    with open(path, 'ab') as f:
+        f.write(b''.join(lineas))
+    _commit(filename)
+    if GROUP_COMMIT:
+        _grupo['sucios'].setdefault(filename, 'fsync')
+        _retener_exclusivo()
+    nueva = _firma_archivo(path)
+    if postings is not None and postings['firma'] == firma:
+        for item, offset in zip(items, offsets):
+            _agregar_posting(postings['listas'], POSTINGS[filename], item, offset)
+        postings['firma'] = nueva
+    if vigente:
+        for item in items:
+            copia = dict(item)
+            entrada['data'].append(copia)
+            _indexar(filename, entrada['indices'], copia)
+        entrada['firma'] = nueva
+    else:
+        _cache.pop(filename, None)
+
+def aplicar_lote(actualizaciones=(), agregados=()):
+    """Aplica varias escrituras como una sola unidad, posiblemente en varios archivos.
+
+    - actualizaciones: [(filename, id_field, {id: cambios})] o, para exigir
+      versiones (compare-and-swap), [(filename, id_field, {id: cambios}, {id: version})]
+    - agregados: [(filename, [items])]
+
+    Todas van en un único registro del WAL y cada archivo se escribe una sola vez:
+    tras un corte se recuperan todas o ninguna. Si algún id no existe (ValueError)
+    o no está en la versión exigida (ConflictoVersion) no se aplica nada. Retorna
+    la cantidad de operaciones aplicadas.
+    """
+    with _escritura():
+        ops, pasos = [], []
+        for filename, id_field, cambios, *versiones in actualizaciones:
+            versiones = versiones[0] if versiones else {}
+            if INDICES.get(filename, {}).get(id_field):
+                por_id = _entrada(filename)['indices'][id_field]
+            else:
+                por_id = {item[id_field]: item for item in _cargar(filename)}
+            faltan = [id_value for id_value in cambios if id_value not in por_id]
+            if faltan:
+                raise ValueError(f"No existen en {filename}: {faltan[:5]}")
+            cambios = {id_value: _versionar(filename, id_value, por_id[id_value], c, versiones.get(id_value))
+                       for id_value, c in cambios.items()}
+            ops.extend({'op': 'update', 'archivo': filename, 'id': id_value, 'campo': id_field, 'cambios': c}
+                       for id_value, c in cambios.items())
+            pasos.append(('update', filename, por_id, cambios))
+
+        for filename, items in agregados:
+            path = os.path.join(DATA_FOLDER, filename)
+            firma = _firma_archivo(path)
+            if _formato_archivo(path) == 'jsonl':
+                lineas = [_serializar_linea(item).encode('utf-8') for item in items]
+                offsets = _offsets_lineas(firma, lineas)
+                ops.extend({'op': 'add', 'archivo': filename, 'item': item, 'offset': offset}
+                           for item, offset in zip(items, offsets))
+                pasos.append(('append', filename, firma, (items, lineas, offsets)))
+            else:
+                ops.extend({'op': 'add', 'archivo': filename, 'item': item} for item in items)
+                pasos.append(('add', filename, firma, items))
+
+        if not ops:
+            return 0
+        ticket = _registrar('lote', None, ops=ops)
+        for paso, filename, *args in pasos:
+            path = os.path.join(DATA_FOLDER, filename)
+            if paso == 'update':
+                por_id, cambios = args
+                for id_value, c in cambios.items():
+                    por_id[id_value].update(c)
+                _escribir(filename, _cargar(filename))
+                continue
+            firma, datos = args
+            if paso == 'append':
+                items = datos[0]
+                _agregar_lineas(filename, path, firma, *datos)
+            else:
+                items = datos
+                data = _cargar(filename)
+                data.extend(dict(item) for item in items)
+                _escribir(filename, data, agregados=len(items))
+            nueva = _firma_archivo(path)
+            for i, item in enumerate(items):
+                _notificar_append(filename, item, firma if i == 0 else nueva, nueva)
+        _checkpoint_si_corresponde()
+    _confirmar(ticket)
+    return len(ops)
+
+# --- Durabilidad: write-ahead log + snapshots (ver utils/wal.py) ---
+
+def _registrar(op, filename, **campos):
+    """Escribe la operación en el WAL antes de aplicarla a los archivos de datos.
+
+    Retorna el ticket que la operación debe pasar a _confirmar (fuera del lock).
+    """
+    from utils import wal
+    archivos = {sub['archivo'] for sub in campos['ops']} if op == 'lote' else {filename}
+    faltan = archivos - set(POSTINGS) - wal.archivos_snapshot()
+    if faltan:
+        # La recuperación parte del snapshot: debe incluir el estado previo del archivo
+        checkpoint(incluir=sorted(faltan))
+    wal.registrar(op, filename, sync=not GROUP_COMMIT, **campos)
+    if not GROUP_COMMIT:
+        return 0
+    with _grupo_cond:
+        _grupo['ticket'] += 1
+        if _grupo['ticket'] - _grupo['durable'] >= FLUSH_LOTE:
+            _grupo_cond.notify_all()
+        return _grupo['ticket']
+
+def _flush_pendientes():
+    """Hace durables las escrituras pendientes: un fsync del WAL y una escritura por archivo.
+
+    Se llama con _cache_lock tomado.
+    """
+    from utils import wal
+    with _grupo_cond:
+        hasta = _grupo['ticket']
+        escrituras = hasta - _grupo['durable']
+        sucios, _grupo['sucios'] = _grupo['sucios'], {}
+    if not sucios and escrituras == 0:
+        return
+
+    # Primero el WAL: los archivos de datos nunca van adelante del log
+    wal.sincronizar()
+    for filename, accion in sorted(sucios.items()):
+        path = os.path.join(DATA_FOLDER, filename)
+        if accion == 'fsync':
+            _fsync_archivo(path)
+            continue
+        entrada = _cache[filename]
+        _reemplazar_archivo(path, entrada['data'], sync=True)
+        _commit(filename)
+        entrada['firma'] = _firma_archivo(path)
+
+    _flush_stats['flushes'] += 1
+    _flush_stats['escrituras'] += escrituras
+    _flush_stats['max_por_flush'] = max(_flush_stats['max_por_flush'], escrituras)
+    _flush_stats['ultimo_flush'] = escrituras
+    log.debug('flush', escrituras=escrituras, archivos=sorted(sucios))
+    with _grupo_cond:
+        _grupo['durable'] = hasta
+        _grupo_cond.notify_all()
+    if _grupo['retenido']:
+        _grupo['retenido'] = False
+        _procesos.liberar()
+
+def _confirmar(ticket):
+    """Retorna cuando la escritura `ticket` ya es durable (group commit).
+
+    El primer hilo que llega hace de líder: mientras haya otros hilos escribiendo
+    espera (hasta FLUSH_INTERVALO o FLUSH_LOTE escrituras) a que sumen su ticket,
+    y después hace el flush de todo el lote; los demás esperan su resultado. Una
+    escritura sola, sin otras en curso, se sincroniza sin esperar.
+    """
+    if not GROUP_COMMIT:
+        return
+    if getattr(_local, 'profundidad', 0):
+        # Dentro de otra escritura: no se puede esperar a un hilo que necesita _cache_lock para el flush
+        with _cache_lock:
+            _flush_pendientes()
+        return
+    while True:
+        with _grupo_cond:
+            if _grupo['durable'] >= ticket:
+                return
+            if _grupo['lider']:
+                _grupo_cond.wait()
+                continue
+            _grupo['lider'] = True
+            # Solo vale la pena esperar la ventana si hay otras escrituras en curso
+            limite = time.monotonic() + FLUSH_INTERVALO
+            while _grupo['escribiendo'] and _grupo['ticket'] - _grupo['durable'] < FLUSH_LOTE:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                _grupo_cond.wait(restante)
+        try:
+            with _cache_lock:
+                _flush_pendientes()
+        finally:
+            with _grupo_cond:
+                _grupo['lider'] = False
+                _grupo_cond.notify_all()
+
+def flush_stats():
+    """Contadores del group commit: flushes hechos y escrituras cubiertas por cada uno"""
+    with _cache_lock:
+        stats = dict(_flush_stats)
+    stats['promedio_por_flush'] = round(stats['escrituras'] / stats['flushes'], 2) if stats['flushes'] else 0
+    stats['group_commit'] = GROUP_COMMIT
+    return stats
+
+def _checkpoint_si_corresponde():
+    from utils import wal
+    if wal.pendientes() >= wal.SNAPSHOT_CADA:
+        checkpoint()
+
+def _fsync_archivo(path):
+    try:
+        with open(path, 'rb') as f:
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        pass
+
+def checkpoint(incluir=()):
+    """Guarda un snapshot del estado (todo lo que no es ledger) y vacía el WAL.
+
+    Los ledgers no van al snapshot: solo se agregan al final, y antes de vaciar el
+    WAL se sincronizan a disco junto con los demás archivos.
+    """
+    from utils import wal
+    with _escritura():
+        _flush_pendientes()
+        nombres = (wal.archivos_snapshot() | set(INDICES) | set(incluir)) - set(POSTINGS)
+        ledgers = {}
+        for filename in nombres | set(POSTINGS):
+            path = os.path.join(DATA_FOLDER, filename)
+            _fsync_archivo(path)
+            if filename in POSTINGS and os.path.exists(path) and _formato_archivo(path) == 'jsonl':
+                ledgers[filename] = os.path.getsize(path)
+        wal.escribir_snapshot({filename: _cargar(filename) for filename in sorted(nombres)}, ledgers)
+        _commit(os.path.basename(wal.SNAPSHOT_PATH))
+        log.debug('checkpoint', archivos=sorted(nombres))
+
+def _reaplicar_append(path, registro):
+    """Reaplica un append a un ledger JSON Lines usando el offset registrado"""
+    linea = _serializar_linea(registro['item']).encode('utf-8')
+    offset = registro['offset']
+    tamano = os.path.getsize(path) if os.path.exists(path) else 0
+    if tamano >= offset + len(linea):
+        return  # la línea ya estaba escrita
+    if tamano > offset:
+        os.truncate(path, offset)  # línea incompleta por un corte
+    with open(path, 'ab') as f:
+        f.write(linea)
+
+def _reaplicar(filename, data, registro, recientes):
+    """Aplica un registro del WAL a la lista de un archivo"""
+    op = registro['op']
+    if op == 'add':
+        # En un ledger el registro puede estar ya en disco (entre los últimos)
+        if filename in POSTINGS and registro['item'] in data[-recientes:]:
+            return
+        data.append(registro['item'])
+    elif op == 'update':
+        for item in data:
+            if item.get(registro['campo']) == registro['id']:
+                item.update(registro['cambios'])
+                break
+    elif op == 'delete':
+        data[:] = [item for item in data if item.get(registro['campo']) != registro['id']]
+    elif op == 'write':
+        data[:] = registro['data']
+
+def _descartar_lineas_sin_wal(snapshot, registros):
+    """Trunca las líneas de un ledger que ningún registro del WAL respalda.
+
+    Con group commit la línea del ledger se escribe antes del fsync del WAL: tras un
+    corte de energía puede quedar en disco una transacción que nunca se confirmó.
+    """
+    for filename, tamano in snapshot.get('ledgers', {}).items():
+        fin = tamano
+        for registro in registros:
+            if registro['archivo'] != filename:
+                continue
+            if registro['op'] != 'add' or 'offset' not in registro:
+                break  # el ledger se reescribió: no hay un límite confiable
+            fin = registro['offset'] + len(_serializar_linea(registro['item']).encode('utf-8'))
+        else:
+            path = os.path.join(DATA_FOLDER, filename)
+            if _formato_archivo(path) == 'jsonl' and os.path.getsize(path) > fin:
+                log.warning('ledger_truncado', archivo=filename, bytes=os.path.getsize(path) - fin)
+                os.truncate(path, fin)
+
+def _expandir_lotes(registros):
+    """Reemplaza cada registro 'lote' del WAL por sus operaciones (ver aplicar_lote)"""
+    expandidos = []
+    for registro in registros:
+        if registro['op'] == 'lote':
+            expandidos.extend(dict(sub, lsn=registro['lsn']) for sub in registro['ops'])
+        else:
+            expandidos.append(registro)
+    return expandidos
+
+def recuperar():
+    """Reaplica la cola del WAL sobre el último snapshot (al iniciar la aplicación).
+
+    Solo se leen el snapshot y las operaciones posteriores a él, así el costo depende
+    de la actividad reciente y no del tamaño del historial. Retorna los registros
+    reaplicados.
+    """
+    from utils import wal
+    with _escritura():
+        registros = list(wal.leer_registros())
+        if not registros and not GROUP_COMMIT:
+            return 0
+        snapshot = wal.leer_snapshot()
+        registros = _expandir_lotes(r for r in registros if r['lsn'] > snapshot['lsn'])
+        if GROUP_COMMIT:
+            _descartar_lineas_sin_wal(snapshot, registros)
+        if not registros:
+            return 0
+
+        estados = {}
+        for registro in registros:
+            filename = registro['archivo']
+            path = os.path.join(DATA_FOLDER, filename)
+            if filename not in estados:
+                if filename in POSTINGS and registro['op'] == 'add' and _formato_archivo(path) == 'jsonl':
+                    _reaplicar_append(path, registro)
+                    continue
+                if filename in snapshot['archivos']:
+                    estados[filename] = snapshot['archivos'][filename]
+                else:
+                    estados[filename] = _leer_archivo(path)
+            _reaplicar(filename, estados[filename], registro, len(registros))
+
+        for filename, data in estados.items():
+            _escribir(filename, data)
+        checkpoint()
+        log.info('wal_recuperado', registros=len(registros), archivos=sorted({r['archivo'] for r in registros}))
+        return len(registros)
+
+# Con BANCO_STORAGE=sqlite la misma API se atiende desde la base de datos,
+# sin que los modelos tengan que cambiar sus imports
+if STORAGE_BACKEND == 'sqlite':
+    from utils.sqlite_backend import (
+        read_json, iter_json, write_json, find_by_id, find_by_field, find_all_by_field,
+        find_by_posting, iter_by_posting, stream_json, update_item, delete_item, add_item,
+        precargar, reserve_ids, get_next_id, data_signature, recuperar, checkpoint,
+        particiones, aplicar_lote, posicion_ledger, leer_cola, avanzar_cursor
+    )
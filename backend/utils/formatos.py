@@ -0,0 +1,51 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa el módulo json de la biblioteca estándar
+    orjson = None
+
+# Formatos en disco de los archivos de datos (se detectan al leer):
+#   indentado  arreglo JSON con indent=4 (el formato original)
+#   compacto   arreglo JSON sin espacios
+#   jsonl      un registro por línea (ledger append-only, ver convertir_a_jsonl)
+# Un archivo sin registros ('[]' o vacío) no dice su formato: file_manager lo
+# registra aparte (data/formatos.json) al convertirlo o al dejarlo vacío.
+FORMATOS = ('indentado', 'compacto', 'jsonl')
+
+
+def loads(datos):
+    """Parsea JSON (str o bytes), con orjson si está instalado"""
+    if orjson is not None:
+        return orjson.loads(datos)
+    return json.loads(datos)
+
+
+def dumps(valor):
+    """Serializa a JSON compacto en bytes UTF-8, con orjson si está instalado"""
+    if orjson is not None:
+        return orjson.dumps(valor)
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def detectar(inicio):
+    """Formato de un archivo a partir de sus primeros bytes, o None si no tiene registros"""
+    inicio = inicio.lstrip()
+    if not inicio or inicio.startswith(b'[]'):
+        return None
+    if inicio.startswith(b'[{'):
+        return 'compacto'
+    if inicio.startswith(b'['):
+        # '[' seguido de espacios: puede ser un arreglo indentado vacío
+        return 'indentado' if inicio[1:].strip()[:1] not in (b']', b'') else None
+    return 'jsonl'
+
+
+def serializar(data, formato):
+    """Contenido completo (bytes) de un archivo de arreglo con los registros `data`"""
+    if formato == 'indentado':
+        return json.dumps(data, indent=4, ensure_ascii=False).encode('utf-8')
+    if formato == 'compacto':
+        return dumps(data)
+    raise ValueError(f"Formato desconocido: {formato}")
+
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, jsonify, make_response, current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se protege entre hilos del mismo proceso
+    fcntl = None
+
+from utils.auth import usuario_actual
+from utils.file_manager import DATA_FOLDER
+from utils.logger import get_logger
+
+log = get_logger('idempotencia')
+
+# Respuestas de las operaciones con Idempotency-Key. El estado vive en memoria
+# (OrderedDict en orden LRU) y se respalda en un diario JSON Lines que comparten
+# todos los workers: cada proceso lee las líneas nuevas antes de decidir, con el
+# bloqueo exclusivo de IDEMPOTENCIA_LOCK tomado. Una clave pasa por:
+#   en_curso   un proceso reclamó la clave y está ejecutando la operación
+#   completa   la respuesta quedó guardada: los reintentos la reciben tal cual
+#   liberada   la operación falló con 5xx: un reintento puede volver a ejecutarla
+IDEMPOTENCIA_PATH = os.path.join(DATA_FOLDER, "idempotencia.jsonl")
+IDEMPOTENCIA_LOCK = os.path.join(DATA_FOLDER, "idempotencia.lock")
+
+TTL = int(os.environ.get('BANCO_IDEMPOTENCIA_TTL', '86400'))
+CAPACIDAD = int(os.environ.get('BANCO_IDEMPOTENCIA_MAX', '10000'))
+# Segundos que un reintento espera a que termine la ejecución en curso
+ESPERA_MAX = float(os.environ.get('BANCO_IDEMPOTENCIA_ESPERA', '30'))
+CLAVE_MAX = 255
+
+
+class AlmacenIdempotencia:
+    """Claves de idempotencia con TTL y desalojo LRU, persistidas en un diario compartido"""
+
+    def __init__(self, path, lock_path, ttl=TTL, capacidad=CAPACIDAD):
+        self.path = path
+        self.lock_path = lock_path
+        self.ttl = ttl
+        self.capacidad = capacidad
+        self._entradas = OrderedDict()
+        self._cond = threading.Condition()
+        self._firma = None  # (inodo, offset leído) del diario
+        self._lineas = 0
+        self._stats = {'ejecutadas': 0, 'repetidas': 0, 'esperas': 0, 'conflictos': 0, 'desalojadas': 0}
+
+    # --- diario compartido ---
+
+    def _bloquear(self):
+        f = open(self.lock_path, 'a')
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return f
+
+    def _desbloquear(self, f):
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+    def _sincronizar(self):
+        """Aplica las líneas del diario que escribieron otros procesos (con el bloqueo tomado)"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._entradas.clear()
+            self._firma, self._lineas = None, 0
+            return
+        inodo, offset = self._firma or (None, 0)
+        if inodo != st.st_ino or st.st_size < offset:
+            # El diario se compactó: se vuelve a leer completo
+            self._entradas.clear()
+            offset, self._lineas = 0, 0
+        if st.st_size == offset:
+            self._firma = (st.st_ino, offset)
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    break  # línea cortada por un corte: se ignora
+                offset += len(linea)
+                try:
+                    self._aplicar(json.loads(linea))
+                except (ValueError, KeyError):
+                    log.warning('linea_idempotencia_invalida', offset=offset)
+        self._firma = (st.st_ino, offset)
+
+    def _aplicar(self, registro):
+        clave = registro['clave']
+        self._lineas += 1
+        if registro['estado'] == 'liberada':
+            self._entradas.pop(clave, None)
+            return
+        self._entradas[clave] = registro
+        self._entradas.move_to_end(clave)
+
+    def _escribir(self, registro, sync=False):
+        linea = (json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with open(self.path, 'ab') as f:
+            f.write(linea)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        inodo, offset = self._firma or (os.stat(self.path).st_ino, 0)
+        self._firma = (inodo, offset + len(linea))
+        self._aplicar(registro)
+
+    def _purgar(self, ahora):
+        """Descarta las claves vencidas y, sobre la capacidad, las menos usadas"""
+        for clave in [c for c, e in self._entradas.items() if e['expira'] <= ahora]:
+            del self._entradas[clave]
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+            self._stats['desalojadas'] += 1
+        if self._lineas > 2 * max(self.capacidad, 1000):
+            self._compactar()
+
+    def _compactar(self):
+        """Reescribe el diario solo con las claves vigentes (temporal + rename)"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for registro in self._entradas.values():
+                f.write((json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._firma, self._lineas = (st.st_ino, st.st_size), len(self._entradas)
+        log.info('idempotencia_compactada', claves=len(self._entradas))
+
+    # --- API ---
+
+    def reclamar(self, clave, huella):
+        """Decide qué hacer con una petición con esta clave.
+
+        Retorna ('ejecutar', None) si la petición debe ejecutarse (la clave queda
+        en curso), ('repetir', registro) si ya hay respuesta guardada o
+        ('conflicto', (mensaje, status)).
+        """
+        limite = time.monotonic() + ESPERA_MAX
+        esperando = False
+        with self._cond:
+            while True:
+                ahora = time.time()
+                f = self._bloquear()
+                try:
+                    self._sincronizar()
+                    entrada = self._entradas.get(clave)
+                    if entrada is not None and entrada['expira'] <= ahora:
+                        entrada = None
+                    if entrada is None:
+                        self._escribir({
+                            'clave': clave, 'huella': huella, 'estado': 'en_curso',
+                            'pid': os.getpid(), 'instancia': _instancia(), 'expira': ahora + self.ttl,
+                        })
+                        self._stats['ejecutadas'] += 1
+                        return 'ejecutar', None
+                    if entrada['huella'] != huella:
+                        self._stats['conflictos'] += 1
+                        return 'conflicto', ('La Idempotency-Key ya se usó con otra petición', 422)
+                    if entrada['estado'] == 'completa':
+                        self._entradas.move_to_end(clave)
+                        self._stats['repetidas'] += 1
+                        return 'repetir', entrada
+                    if _abandonada(entrada):
+                        # El proceso que la reclamó murió sin responder: se vuelve a ejecutar
+                        self._escribir(dict(entrada, pid=os.getpid(), instancia=_instancia(),
+                                            expira=ahora + self.ttl))
+                        self._stats['ejecutadas'] += 1
+                        return 'ejecutar', None
+                finally:
+                    self._desbloquear(f)
+
+                # En curso en otro hilo o proceso: esperar su respuesta
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._stats['conflictos'] += 1
+                    return 'conflicto', ('Ya hay una petición en curso con esta Idempotency-Key', 409)
+                if not esperando:
+                    self._stats['esperas'] += 1
+                    esperando = True
+                # Los hilos del proceso se despiertan con notify; otros procesos, por sondeo
+                self._cond.wait(min(restante, 0.05))
+
+    def completar(self, clave, huella, cuerpo, status):
+        """Guarda la respuesta de una clave en curso (sincronizada a disco antes de responder)"""
+        self._terminar({
+            'clave': clave, 'huella': huella, 'estado': 'completa', 'pid': os.getpid(),
+            'expira': time.time() + self.ttl, 'cuerpo': cuerpo, 'status': status,
+        }, sync=True)
+
+    def liberar(self, clave):
+        """Suelta una clave en curso sin respuesta: el próximo reintento vuelve a ejecutarla"""
+        self._terminar({'clave': clave, 'estado': 'liberada'})
+
+    def _terminar(self, registro, sync=False):
+        with self._cond:
+            f = self._bloquear()
+            try:
+                self._sincronizar()
+                self._escribir(registro, sync=sync)
+                self._purgar(time.time())
+            finally:
+                self._desbloquear(f)
+            self._cond.notify_all()
+
+    def estadisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['claves'] = len(self._entradas)
+        return stats
+
+
+# Identificador de esta ejecución del proceso (uno nuevo tras un fork). El pid solo
+# no alcanza: en un contenedor el servidor corre como PID 1 y tras reiniciarse por
+# una caída vuelve a tener el mismo pid que el proceso que dejó claves en curso.
+_identidad = {'pid': None, 'instancia': None}
+
+
+def _instancia():
+    if _identidad['pid'] != os.getpid():
+        _identidad.update(pid=os.getpid(), instancia=uuid.uuid4().hex)
+    return _identidad['instancia']
+
+
+def _abandonada(entrada):
+    """True si el proceso que dejó la clave en curso ya no existe"""
+    if entrada.get('instancia') == _instancia():
+        return False
+    if entrada['pid'] == os.getpid():
+        return True  # el mismo pid en otra ejecución: el proceso anterior terminó
+    return not _proceso_vivo(entrada['pid'])
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+almacen = AlmacenIdempotencia(IDEMPOTENCIA_PATH, IDEMPOTENCIA_LOCK)
+
+
+def idempotente(f):
+    """Decorador para rutas POST que mueven dinero: respeta el header Idempotency-Key.
+
+    La clave se asocia al usuario; la huella (método, ruta y cuerpo) detecta si la
+    misma clave se reutiliza para otra petición. Las respuestas 5xx no se guardan.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        clave = request.headers.get('Idempotency-Key')
+        if not clave:
+            return f(*args, **kwargs)
+        if len(clave) > CLAVE_MAX:
+            return jsonify({'message': f'Idempotency-Key admite hasta {CLAVE_MAX} caracteres'}), 400
+
+        user_id = usuario_actual()
+        if not user_id:
+            return f(*args, **kwargs)  # la ruta responde 401
+
+        clave = f"{user_id}:{clave}"
+        huella = hashlib.sha256(
+            request.method.encode() + b' ' + request.path.encode() + b'\n' + request.get_data()
+        ).hexdigest()
+
+        accion, resultado = almacen.reclamar(clave, huella)
+        if accion == 'repetir':
+            respuesta = current_app.response_class(
+                resultado['cuerpo'], status=resultado['status'], mimetype='application/json'
+            )
+            respuesta.headers['Idempotent-Replayed'] = 'true'
+            return respuesta
+        if accion == 'conflicto':
+            mensaje, status = resultado
+            return jsonify({'message': mensaje}), status
+
+        try:
+            respuesta = make_response(f(*args, **kwargs))
+        except BaseException:
+            almacen.liberar(clave)
+            raise
+        if respuesta.status_code >= 500:
+            almacen.liberar(clave)
+        else:
+            almacen.completar(clave, huella, respuesta.get_data(as_text=True), respuesta.status_code)
+        return respuesta
+
+    return decorated
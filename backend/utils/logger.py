@@ -0,0 +1,117 @@
+import os
+import json
+import random
+import logging
+from datetime import datetime
+
+# Nivel para eventos por registro (comparaciones, líneas leídas...): más fino que DEBUG
+TRACE = 5
+logging.addLevelName(TRACE, 'TRACE')
+
+# Perfiles de logging. En producción solo se emiten advertencias y errores, y
+# nunca eventos por registro.
+PERFILES = {
+    'development': {'nivel': 'DEBUG'},
+    'production': {'nivel': 'WARNING'},
+}
+
+# Variables de entorno:
+#   BANCO_LOG_PROFILE       development | production
+#   BANCO_LOG_LEVELS        niveles por módulo, p. ej. "file_manager=TRACE,routes=INFO"
+#   BANCO_LOG_TRACE_SAMPLE  fracción de eventos TRACE que se emiten (0.0 - 1.0)
+PERFIL = os.environ.get('BANCO_LOG_PROFILE', 'development')
+TRACE_SAMPLE = float(os.environ.get('BANCO_LOG_TRACE_SAMPLE', '0.01'))
+
+
+class FormatoEstructurado(logging.Formatter):
+    """Formatea cada evento como una línea JSON: ts, nivel, modulo, evento y campos"""
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'modulo': record.name,
+            'evento': record.getMessage(),
+        }
+        datos.update(getattr(record, 'campos', {}))
+        if record.exc_info:
+            datos['error'] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class LoggerEstructurado:
+    """Logger con eventos nombrados y campos clave=valor.
+
+    Los métodos retornan de inmediato si el nivel está desactivado, sin formatear
+    nada. Para bucles por registro, consultar `trace_activo` una vez antes del bucle.
+    """
+
+    def __init__(self, nombre):
+        self._logger = logging.getLogger(f'banco.{nombre}')
+
+    def _emitir(self, nivel, evento, campos, exc_info=False):
+        if self._logger.isEnabledFor(nivel):
+            self._logger.log(nivel, evento, extra={'campos': campos}, exc_info=exc_info)
+
+    @property
+    def trace_activo(self):
+        return TRACE_SAMPLE > 0 and self._logger.isEnabledFor(TRACE)
+
+    def trace(self, evento, **campos):
+        """Evento por registro: se emite solo una muestra (BANCO_LOG_TRACE_SAMPLE)"""
+        if not self.trace_activo:
+            return
+        if TRACE_SAMPLE < 1 and random.random() >= TRACE_SAMPLE:
+            return
+        self._logger.log(TRACE, evento, extra={'campos': campos})
+
+    def debug(self, evento, **campos):
+        self._emitir(logging.DEBUG, evento, campos)
+
+    def info(self, evento, **campos):
+        self._emitir(logging.INFO, evento, campos)
+
+    def warning(self, evento, **campos):
+        self._emitir(logging.WARNING, evento, campos)
+
+    def error(self, evento, **campos):
+        self._emitir(logging.ERROR, evento, campos)
+
+    def exception(self, evento, **campos):
+        """Error con el traceback de la excepción en curso"""
+        self._emitir(logging.ERROR, evento, campos, exc_info=True)
+
+
+def get_logger(nombre):
+    """Retorna el logger estructurado de un módulo (p. ej. 'file_manager', 'routes.auth')"""
+    return LoggerEstructurado(nombre)
+
+
+def _niveles_por_modulo(texto):
+    niveles = {}
+    for par in filter(None, (p.strip() for p in texto.split(','))):
+        modulo, _, nivel = par.partition('=')
+        niveles[modulo.strip()] = nivel.strip().upper()
+    return niveles
+
+
+def configurar_logging(perfil=None, niveles=None):
+    """Configura el logging de la aplicación según el perfil y los niveles por módulo"""
+    perfil = perfil or PERFIL
+    config = PERFILES.get(perfil, PERFILES['development'])
+    if niveles is None:
+        niveles = _niveles_por_modulo(os.environ.get('BANCO_LOG_LEVELS', ''))
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(FormatoEstructurado())
+
+    raiz = logging.getLogger('banco')
+    raiz.handlers[:] = [handler]
+    raiz.propagate = False
+    raiz.setLevel(config['nivel'])
+
+    for modulo, nivel in niveles.items():
+        logging.getLogger(f'banco.{modulo}').setLevel(nivel)
+
+    # Logging de librerías (werkzeug, etc.) con el mismo nivel base
+    logging.basicConfig(level=config['nivel'])
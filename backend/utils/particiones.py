@@ -0,0 +1,97 @@
+import os
+import gzip
+import json
+
+from utils.file_manager import DATA_FOLDER
+
+# Particiones mensuales selladas de los ledgers (ver file_manager.archivar):
+#   data/archivo/<ledger>/<YYYY-MM>.jsonl       JSON Lines de solo lectura
+#   data/archivo/<ledger>/<YYYY-MM>.jsonl.gz    ídem, comprimida con gzip
+# El archivo del ledger (p. ej. transacciones.json) queda como partición activa
+# con los meses que todavía no se archivaron.
+ARCHIVO_FOLDER = os.path.join(DATA_FOLDER, "archivo")
+EXTENSIONES = ('.jsonl', '.jsonl.gz')
+
+
+def _carpeta(filename):
+    return os.path.join(ARCHIVO_FOLDER, os.path.splitext(filename)[0])
+
+
+def listar(filename, desde=None, hasta=None):
+    """Particiones selladas de un ledger cuyos meses ('YYYY-MM') están en [desde, hasta].
+
+    Retorna [{'mes', 'nombre', 'comprimida'}] de la más antigua a la más nueva;
+    `nombre` es relativo a DATA_FOLDER, como los demás archivos de datos.
+    """
+    carpeta = _carpeta(filename)
+    try:
+        archivos = os.listdir(carpeta)
+    except FileNotFoundError:
+        return []
+
+    resultado = []
+    for archivo in archivos:
+        mes, _, extension = archivo.partition('.')
+        if '.' + extension not in EXTENSIONES:
+            continue
+        if (desde and mes < desde) or (hasta and mes > hasta):
+            continue
+        resultado.append({
+            'mes': mes,
+            'nombre': os.path.relpath(os.path.join(carpeta, archivo), DATA_FOLDER),
+            'comprimida': extension.endswith('.gz'),
+        })
+    resultado.sort(key=lambda p: p['mes'])
+    return resultado
+
+
+def sellar(filename, mes, items, comprimir=False):
+    """Escribe la partición sellada de un mes (solo lectura), agregando a la existente si la hay.
+
+    Un registro que ya está en la partición no se duplica: así se puede repetir un
+    archivado interrumpido.
+    """
+    from utils.file_manager import iter_archivo, _serializar_linea
+
+    carpeta = _carpeta(filename)
+    os.makedirs(carpeta, exist_ok=True)
+    previas = listar(filename, mes, mes)
+
+    lineas, vistas = [], set()
+    registros = [item for p in previas for item in iter_archivo(os.path.join(DATA_FOLDER, p['nombre']))]
+    for item in registros + list(items):
+        linea = _serializar_linea(item).encode('utf-8')
+        if linea not in vistas:
+            vistas.add(linea)
+            lineas.append(linea)
+
+    path = os.path.join(carpeta, mes + ('.jsonl.gz' if comprimir else '.jsonl'))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        if comprimir:
+            with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                gz.writelines(lineas)
+        else:
+            f.writelines(lineas)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp_path, 0o444)
+    os.replace(tmp_path, path)
+
+    # Si cambió la compresión, la versión anterior sobra
+    for p in previas:
+        anterior = os.path.join(DATA_FOLDER, p['nombre'])
+        if anterior != path:
+            os.remove(anterior)
+    return len(lineas)
+
+
+def iter_comprimida(path, claves=None):
+    """Recorre una partición comprimida línea por línea (con el mismo filtro `claves` en bytes)"""
+    with gzip.open(path, 'rb') as f:
+        for linea in f:
+            if claves and not any(c in linea for c in claves):
+                continue
+            linea = linea.strip()
+            if linea:
+                yield json.loads(linea)
@@ -0,0 +1,453 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+from utils import file_manager
+from utils.logger import get_logger
+
+log = get_logger('resumenes')
+
+LEDGER = 'transacciones.json'
+RESUMENES_PATH = os.path.join(file_manager.DATA_FOLDER, 'resumenes.json')
+# Segundos entre guardados del estado incremental en RESUMENES_PATH
+GUARDAR_CADA = float(os.environ.get('BANCO_RESUMENES_GUARDAR', '60'))
+
+# Signo de cada tipo sobre el saldo de la cuenta origen del registro. Una transferencia
+# con registro único ('transferencia') también acredita a la cuenta destino.
+CREDITOS = {'deposito', 'transferencia_recibida', 'interes'}
+DEBITOS = {'retiro', 'transferencia_enviada', 'transferencia'}
+
+
+def categoria(descripcion):
+    """Clasifica una transacción en una categoría según su descripción"""
+    descripcion = (descripcion or '').lower()
+    if any(word in descripcion for word in ['compra', 'shopping', 'tienda']):
+        return 'Compras'
+    elif any(word in descripcion for word in ['comida', 'restaurant', 'alimento', 'comida']):
+        return 'Alimentos'
+    elif any(word in descripcion for word in ['renta', 'casa', 'vivienda', 'alquiler']):
+        return 'Vivienda'
+    elif any(word in descripcion for word in ['transporte', 'taxi', 'uber', 'gasolina']):
+        return 'Transporte'
+    elif any(word in descripcion for word in ['tecnología', 'tech', 'tecnologia', 'electrónica']):
+        return 'Tecnología'
+    elif any(word in descripcion for word in ['salud', 'medico', 'farmacia', 'hospital']):
+        return 'Salud'
+    return 'Otros'
+
+
+def _sumar(totales, tipo, conteo, centavos):
+    acumulado = totales.get(tipo)
+    if acumulado is None:
+        totales[tipo] = [conteo, centavos]
+    else:
+        acumulado[0] += conteo
+        acumulado[1] += centavos
+
+
+def _combinar(destino, origen, signo):
+    for tipo, (conteo, centavos) in origen.items():
+        _sumar(destino, tipo, signo * conteo, signo * centavos)
+        if destino[tipo][0] == 0:
+            del destino[tipo]
+
+
+class Resumen:
+    """Agregados materializados de un cliente o de una cuenta.
+
+    - dias: {'YYYY-MM-DD': {'tipos': {tipo: [conteo, centavos]}, 'categorias': {categoria: centavos}}}
+    - meses: {'YYYY-MM': {tipo: [conteo, centavos]}}
+    - total: {tipo: [conteo, centavos]} de todo el historial
+    - neto: créditos menos débitos en centavos (movimiento acumulado del saldo)
+
+    Los registros sin fecha interpretable solo cuentan en `total` y `neto`.
+    """
+
+    __slots__ = ('dias', 'meses', 'total', 'neto')
+
+    def __init__(self, dias=None, meses=None, total=None, neto=0):
+        self.dias = dias or {}
+        self.meses = meses or {}
+        self.total = total or {}
+        self.neto = neto
+
+    def agregar(self, dia, tipo, centavos, nombre_categoria, neto):
+        _sumar(self.total, tipo, 1, centavos)
+        self.neto += neto
+        if dia is None:
+            return
+        cubeta = self.dias.get(dia)
+        if cubeta is None:
+            cubeta = self.dias[dia] = {'tipos': {}, 'categorias': {}}
+        _sumar(cubeta['tipos'], tipo, 1, centavos)
+        cubeta['categorias'][nombre_categoria] = cubeta['categorias'].get(nombre_categoria, 0) + centavos
+        _sumar(self.meses.setdefault(dia[:7], {}), tipo, 1, centavos)
+
+    def totales(self, periodo=None, desde=None, hasta=None):
+        """{tipo: [conteo, centavos]} del historial (periodo None) o de las cubetas
+        'dia'/'mes' con desde <= clave < hasta"""
+        if periodo is None:
+            return {tipo: list(valores) for tipo, valores in self.total.items()}
+        resultado = {}
+        for clave, cubeta in self._cubetas(periodo, desde, hasta):
+            for tipo, (conteo, centavos) in (cubeta['tipos'] if periodo == 'dia' else cubeta).items():
+                _sumar(resultado, tipo, conteo, centavos)
+        return resultado
+
+    def categorias(self, desde=None, hasta=None):
+        """{categoria: centavos} de las cubetas diarias con desde <= día < hasta"""
+        resultado = {}
+        for _, cubeta in self._cubetas('dia', desde, hasta):
+            for nombre, centavos in cubeta['categorias'].items():
+                resultado[nombre] = resultado.get(nombre, 0) + centavos
+        return resultado
+
+    def _cubetas(self, periodo, desde, hasta):
+        cubetas = self.dias if periodo == 'dia' else self.meses
+        for clave, cubeta in cubetas.items():
+            if (desde is None or clave >= desde) and (hasta is None or clave < hasta):
+                yield clave, cubeta
+
+    def combinar(self, otro, signo=1):
+        """Suma (signo 1) o resta (signo -1) los agregados de `otro`, descartando lo que queda sin registros"""
+        _combinar(self.total, otro.total, signo)
+        self.neto += signo * otro.neto
+        for mes, tipos in otro.meses.items():
+            propios = self.meses.setdefault(mes, {})
+            _combinar(propios, tipos, signo)
+            if not propios:
+                del self.meses[mes]
+        for dia, cubeta in otro.dias.items():
+            propia = self.dias.setdefault(dia, {'tipos': {}, 'categorias': {}})
+            _combinar(propia['tipos'], cubeta['tipos'], signo)
+            categorias = propia['categorias']
+            for nombre, centavos in cubeta['categorias'].items():
+                categorias[nombre] = categorias.get(nombre, 0) + signo * centavos
+                if categorias[nombre] == 0:
+                    del categorias[nombre]
+            if not propia['tipos']:
+                del self.dias[dia]
+
+    def a_dict(self):
+        return {'dias': self.dias, 'meses': self.meses, 'total': self.total, 'neto': self.neto}
+
+
+# Estado materializado del proceso:
+#   _clientes, _cuentas  resúmenes de todo el ledger
+#   _activo              (clientes, cuentas) con lo que aportan solo los registros
+#                        reemplazables (el archivo activo): un archivado los reescribe y se restan
+#   _cursor              hasta dónde llegan los resúmenes (opaco, ver file_manager.leer_cola)
+#   _posicion            posición del ledger que corresponde exactamente al cursor (o None)
+# Las transacciones de este proceso se suman con cada append al ledger (on_append); las
+# de otros procesos se leen desde el cursor, solo la cola nueva. El estado se guarda con
+# su cursor en data/resumenes.json: al reiniciar se lee solo lo agregado después. Se
+# reconstruye desde cero únicamente si el ledger no continúa al cursor (se truncó o se
+# reescribió fuera de la API). Todo pasa por la API de file_manager, así que funciona
+# igual con los archivos JSON y con SQLite.
+_clientes = {}
+_cuentas = {}
+_activo = ({}, {})
+_cursor = None
+_posicion = None
+_cambios = 0  # registros sumados desde el último guardado
+_guardado = 0.0  # time.monotonic() del último guardado
+_cliente_de = {}
+_lock = threading.Lock()
+_construccion = threading.RLock()  # una sola lectura del ledger (o guardado) a la vez
+
+
+def _dia(fecha_hora):
+    """Día local 'YYYY-MM-DD' del registro (None si la fecha no se interpreta o tiene zona)"""
+    try:
+        fecha = datetime.fromisoformat(fecha_hora.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    if fecha.tzinfo is not None:
+        return None
+    return fecha.strftime('%Y-%m-%d')
+
+
+def _id_cliente(numero_cuenta, mapa=None):
+    if numero_cuenta is None:
+        return None
+    if mapa is not None:
+        return mapa.get(numero_cuenta)
+    id_cliente = _cliente_de.get(numero_cuenta)
+    if id_cliente is None:
+        cuenta = file_manager.find_by_field('cuentas.json', 'numero_cuenta', numero_cuenta)
+        if cuenta is not None:
+            id_cliente = _cliente_de[numero_cuenta] = cuenta['id_cliente']
+    return id_cliente
+
+
+def _aportes(t, mapa=None):
+    """Lo que un registro suma a cada cuenta y cliente que menciona.
+
+    Como el historial de un cliente, el registro cuenta una vez para cada cuenta
+    (origen o destino) y para cada cliente dueño de alguna de ellas. Retorna
+    (dia, tipo, centavos, categoria, {numero_cuenta: neto}, {id_cliente: neto}).
+    """
+    tipo = t['tipo_transaccion']
+    centavos = round(float(t['monto']) * 100)
+    origen, destino = t['numero_cuenta_origen'], t.get('numero_cuenta_destino')
+
+    netos_cuenta = {origen: centavos if tipo in CREDITOS else -centavos if tipo in DEBITOS else 0}
+    if destino is not None and destino != origen:
+        netos_cuenta[destino] = centavos if tipo == 'transferencia' else 0
+
+    netos_cliente = {}
+    for numero, neto in netos_cuenta.items():
+        id_cliente = _id_cliente(numero, mapa)
+        if id_cliente is not None:
+            netos_cliente[id_cliente] = netos_cliente.get(id_cliente, 0) + neto
+    return _dia(t.get('fecha_hora')), tipo, centavos, categoria(t.get('descripcion')), netos_cuenta, netos_cliente
+
+
+def _aplicar(clientes, cuentas, aportes):
+    dia, tipo, centavos, nombre_categoria, netos_cuenta, netos_cliente = aportes
+    for numero, neto in netos_cuenta.items():
+        resumen = cuentas.get(numero)
+        if resumen is None:
+            resumen = cuentas[numero] = Resumen()
+        resumen.agregar(dia, tipo, centavos, nombre_categoria, neto)
+    for id_cliente, neto in netos_cliente.items():
+        resumen = clientes.get(id_cliente)
+        if resumen is None:
+            resumen = clientes[id_cliente] = Resumen()
+        resumen.agregar(dia, tipo, centavos, nombre_categoria, neto)
+
+
+
+def _leer_cola(cursor):
+    """Lee lo que el ledger agregó después de `cursor`.
+
+    Retorna ([(aportes, reemplazable)], cola) o None si el ledger no continúa al cursor.
+    """
+    with file_manager.leer_cola(LEDGER, cursor) as cola:
+        aportes = [(_aportes(t), reemplazable) for t, reemplazable in cola.registros]
+    if cola.cursor is None:
+        return None
+    return aportes, cola
+
+
+def _aplicar_cola(aportes, cola):
+    """Instala lo leído por _leer_cola (con _lock tomado)"""
+    global _activo, _cursor, _posicion, _cambios
+    if cola.reescrito:
+        # Un archivado reescribió los registros reemplazables: lo que aportaban se
+        # resta y la cola los trae de nuevo
+        for total, parte in zip((_clientes, _cuentas), _activo):
+            for clave, resumen in parte.items():
+                total[clave].combinar(resumen, -1)
+                if not total[clave].total:
+                    del total[clave]
+        _activo = ({}, {})
+    for aporte, reemplazable in aportes:
+        _aplicar(_clientes, _cuentas, aporte)
+        if reemplazable:
+            _aplicar(*_activo, aporte)
+    _cursor, _posicion = cola.cursor, cola.posicion
+    _cambios += len(aportes)
+
+
+def _construir():
+    """Recorre el ledger completo y retorna (clientes, cuentas, activo, cursor, posicion, registros).
+
+    Retorna None si un archivado cambió el ledger durante el recorrido: el resultado
+    puede no corresponder a ningún estado del ledger.
+    """
+    mapa = {c['numero_cuenta']: c['id_cliente'] for c in file_manager.read_json('cuentas.json')}
+    clientes, cuentas, activo = {}, {}, ({}, {})
+    registros = 0
+    with file_manager.leer_cola(LEDGER) as cola:
+        for t, reemplazable in cola.registros:
+            aportes = _aportes(t, mapa)
+            _aplicar(clientes, cuentas, aportes)
+            if reemplazable:
+                _aplicar(*activo, aportes)
+            registros += 1
+    if cola.cursor is None:
+        return None
+    return clientes, cuentas, activo, cola.cursor, cola.posicion, registros
+
+
+def _instalar(clientes, cuentas, activo, cursor, posicion=None, cambios=0):
+    global _clientes, _cuentas, _activo, _cursor, _posicion, _cambios
+    _clientes, _cuentas, _activo, _cursor, _posicion, _cambios = clientes, cuentas, activo, cursor, posicion, cambios
+
+
+def _desde_dict(datos, clave_int):
+    return {int(k) if clave_int else k: Resumen(**v) for k, v in datos.items()}
+
+
+def _cargar_guardado():
+    """Estado de data/resumenes.json: (clientes, cuentas, activo, cursor) o None si no sirve.
+
+    Sirve aunque el ledger haya crecido después: se lee la cola desde su cursor, que
+    solo vale para el almacenamiento con el que se guardó.
+    """
+    try:
+        with open(RESUMENES_PATH, 'r', encoding='utf-8') as f:
+            guardado = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if guardado.get('cursor') is None or guardado.get('almacenamiento') != file_manager.STORAGE_BACKEND:
+        return None  # formato anterior u otro almacenamiento
+    return (
+        _desde_dict(guardado['clientes'], True), _desde_dict(guardado['cuentas'], False),
+        (_desde_dict(guardado['activo']['clientes'], True), _desde_dict(guardado['activo']['cuentas'], False)),
+        guardado['cursor'],
+    )
+
+
+def _guardar():
+    """Escribe el estado y su cursor en data/resumenes.json (con _construccion tomado)"""
+    global _cambios, _guardado
+    with _lock:
+        # Se serializa con _lock tomado: el estado y el cursor deben coincidir
+        datos = json.dumps({
+            'almacenamiento': file_manager.STORAGE_BACKEND,
+            'cursor': _cursor,
+            'clientes': {str(k): r.a_dict() for k, r in _clientes.items()},
+            'cuentas': {k: r.a_dict() for k, r in _cuentas.items()},
+            'activo': {
+                'clientes': {str(k): r.a_dict() for k, r in _activo[0].items()},
+                'cuentas': {k: r.a_dict() for k, r in _activo[1].items()},
+            },
+        }, ensure_ascii=False, separators=(',', ':'))
+        _cambios, _guardado = 0, time.monotonic()
+    temporal = f"{RESUMENES_PATH}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(datos)
+    os.replace(temporal, RESUMENES_PATH)
+
+
+def reconstruir(guardar=True):
+    """Recalcula todos los resúmenes desde el ledger (y los guarda en data/resumenes.json).
+
+    Retorna {'clientes', 'cuentas', 'registros'} del resultado.
+    """
+    for _ in range(3):
+        construido = _construir()
+        if construido is not None:
+            break
+    else:
+        raise RuntimeError("El ledger cambió durante la reconstrucción de los resúmenes")
+    clientes, cuentas, activo, cursor, posicion, registros = construido
+    with _construccion:
+        with _lock:
+            _instalar(clientes, cuentas, activo, cursor, posicion, cambios=registros)
+        if guardar:
+            _guardar()
+    log.info('resumenes_reconstruidos', clientes=len(clientes), cuentas=len(cuentas), registros=registros)
+    return {'clientes': len(clientes), 'cuentas': len(cuentas), 'registros': registros}
+
+
+def _al_dia(posicion):
+    with _lock:
+        return _cursor is not None and _posicion is not None and posicion == _posicion
+
+
+def _actualizar():
+    """Lee la cola del ledger desde el cursor (con _construccion tomado)"""
+    with _lock:
+        cursor = _cursor
+    if cursor is None:
+        guardado = _cargar_guardado()
+        if guardado is None:
+            reconstruir()
+            return
+        with _lock:
+            _instalar(*guardado)
+        cursor = guardado[3]
+    for _ in range(3):
+        leido = _leer_cola(cursor)
+        if leido is None:
+            log.warning('resumenes_sin_continuidad')
+            reconstruir()
+            return
+        with _lock:
+            if _cursor is cursor:
+                _aplicar_cola(*leido)
+                return
+            # Una escritura de este proceso movió el cursor durante la lectura: repetir desde ahí
+            cursor = _cursor
+
+
+def _asegurar():
+    """Deja los resúmenes al día con el ledger y guarda el estado cada GUARDAR_CADA segundos"""
+    if not _al_dia(file_manager.posicion_ledger(LEDGER)):
+        with _construccion:
+            # Otra petición pudo ponerlos al día mientras se esperaba
+            if not _al_dia(file_manager.posicion_ledger(LEDGER)):
+                _actualizar()
+    if _cambios and time.monotonic() - _guardado >= GUARDAR_CADA and _construccion.acquire(blocking=False):
+        try:
+            _guardar()
+        finally:
+            _construccion.release()
+
+
+def _resumen(coleccion, clave):
+    _asegurar()
+    with _lock:
+        return (_clientes if coleccion == 'clientes' else _cuentas).get(clave)
+
+
+def totales_cliente(id_cliente, periodo=None, desde=None, hasta=None):
+    """{tipo: [conteo, centavos]} del historial de un cliente (ver Resumen.totales)"""
+    resumen = _resumen('clientes', id_cliente)
+    if resumen is None:
+        return {}
+    with _lock:
+        return resumen.totales(periodo, desde, hasta)
+
+
+def categorias_cliente(id_cliente, desde=None, hasta=None):
+    """{categoria: centavos} de un cliente por día (ver Resumen.categorias)"""
+    resumen = _resumen('clientes', id_cliente)
+    if resumen is None:
+        return {}
+    with _lock:
+        return resumen.categorias(desde, hasta)
+
+
+def totales_cuenta(numero_cuenta, periodo=None, desde=None, hasta=None):
+    """{tipo: [conteo, centavos]} del historial de una cuenta (ver Resumen.totales)"""
+    resumen = _resumen('cuentas', numero_cuenta)
+    if resumen is None:
+        return {}
+    with _lock:
+        return resumen.totales(periodo, desde, hasta)
+
+
+def neto_cuenta(numero_cuenta):
+    """Movimiento neto acumulado de una cuenta según el ledger (créditos - débitos)"""
+    resumen = _resumen('cuentas', numero_cuenta)
+    return resumen.neto / 100 if resumen is not None else 0.0
+
+
+
+def _al_agregar(item, firma_previa, firma_nueva):
+    """Suma cada transacción nueva del ledger a los resúmenes de sus cuentas y clientes"""
+    global _cursor, _posicion, _cambios
+    if _cursor is None:
+        return
+    aportes = _aportes(item)
+    with _lock:
+        avance = None
+        if _cursor is not None:
+            avance = file_manager.avanzar_cursor(LEDGER, _cursor, item, firma_previa, firma_nueva)
+        if avance is None:
+            # Hubo escrituras que no pasaron por aquí: se leen desde el cursor al próximo uso
+            return
+        _cursor, _posicion, reemplazable = avance
+        _aplicar(_clientes, _cuentas, aportes)
+        if reemplazable:
+            _aplicar(*_activo, aportes)
+        _cambios += 1
+
+
+file_manager.on_append(LEDGER, _al_agregar)
@@ -0,0 +1,67 @@
+import os
+import json
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se protege entre hilos del mismo proceso
+    fcntl = None
+
+from utils.file_manager import DATA_FOLDER
+
+# Secuencias persistidas: {nombre: último ID entregado}. Entregar un ID cuesta
+# leer y escribir este archivo pequeño, sin importar el tamaño de la colección.
+SECUENCIAS_PATH = os.path.join(DATA_FOLDER, "secuencias.json")
+LOCK_PATH = os.path.join(DATA_FOLDER, "secuencias.lock")
+
+_lock = threading.Lock()
+
+
+class _BloqueoProceso:
+    """Bloqueo exclusivo entre procesos (flock) sobre el archivo de lock"""
+
+    def __enter__(self):
+        self._f = open(LOCK_PATH, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+        self._f.close()
+
+
+def _leer():
+    try:
+        with open(SECUENCIAS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _escribir(valores):
+    """Escribe las secuencias de forma atómica (archivo temporal + rename)"""
+    tmp_path = SECUENCIAS_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(valores, f, indent=4)
+    os.replace(tmp_path, SECUENCIAS_PATH)
+
+
+def reservar(nombre, cantidad=1, semilla=None):
+    """Reserva `cantidad` IDs consecutivos de una secuencia y retorna el primero.
+
+    `semilla` es una función que retorna el último ID usado; solo se llama la
+    primera vez que se usa la secuencia (para continuar desde los datos existentes).
+    """
+    if cantidad < 1:
+        raise ValueError("La cantidad de IDs a reservar debe ser al menos 1")
+
+    with _lock, _BloqueoProceso():
+        valores = _leer()
+        actual = valores.get(nombre)
+        if actual is None:
+            actual = semilla() if semilla else 0
+        valores[nombre] = actual + cantidad
+        _escribir(valores)
+    return actual + 1
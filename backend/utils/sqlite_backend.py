@@ -0,0 +1,563 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+
+from utils.file_manager import (
+    SQLITE_PATH, POSTINGS, VERSIONES, ConflictoVersion, ColaLedger, _notificar_append
+)
+
+# Cada "archivo" de la API de file_manager corresponde a una tabla real.
+# Columnas opcionales: se omiten del registro cuando son NULL (p. ej. una cuenta
+# de ahorro no tiene limite_descubierto). Los campos que no tienen columna se
+# guardan en `extra` como JSON.
+TABLAS = {
+    'clientes.json': {
+        'tabla': 'clientes',
+        'pk': 'id_cliente',
+        'columnas': ['id_cliente', 'nombre', 'apellido', 'dni', 'direccion',
+                     'telefono', 'email', 'password', 'fecha_registro'],
+        # password queda NULL: solo lo traen las bases anteriores a credenciales
+        'opcionales': {'password'},
+    },
+    'credenciales.json': {
+        'tabla': 'credenciales',
+        'pk': 'id_cliente',
+        'columnas': ['id_cliente', 'email', 'password'],
+        'opcionales': set(),
+    },
+    'cuentas.json': {
+        'tabla': 'cuentas',
+        'pk': 'id_cuenta',
+        'columnas': ['id_cuenta', 'id_cliente', 'numero_cuenta', 'tipo_cuenta', 'saldo',
+                     'fecha_apertura', 'estado', 'tasa_interes', 'limite_retiros',
+                     'retiros_realizados', 'limite_descubierto'],
+        'opcionales': {'tasa_interes', 'limite_retiros', 'retiros_realizados', 'limite_descubierto'},
+    },
+    'transacciones.json': {
+        'tabla': 'transacciones',
+        'pk': 'id_transaccion',
+        'columnas': ['id_transaccion', 'numero_cuenta_origen', 'numero_cuenta_destino',
+                     'tipo_transaccion', 'monto', 'fecha_hora', 'descripcion', 'estado'],
+        'opcionales': set(),
+    },
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS clientes (
+    id_cliente INTEGER PRIMARY KEY,
+    nombre TEXT,
+    apellido TEXT,
+    dni TEXT UNIQUE,
+    direccion TEXT,
+    telefono TEXT,
+    email TEXT UNIQUE,
+    password TEXT,
+    fecha_registro TEXT,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS credenciales (
+    id_cliente INTEGER PRIMARY KEY,
+    email TEXT UNIQUE,
+    password TEXT NOT NULL,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS cuentas (
+    id_cuenta INTEGER PRIMARY KEY,
+    id_cliente INTEGER NOT NULL,
+    numero_cuenta TEXT NOT NULL UNIQUE,
+    tipo_cuenta TEXT NOT NULL,
+    saldo REAL NOT NULL DEFAULT 0,
+    fecha_apertura TEXT,
+    estado TEXT,
+    tasa_interes REAL,
+    limite_retiros INTEGER,
+    retiros_realizados INTEGER,
+    limite_descubierto REAL,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_cuentas_cliente ON cuentas (id_cliente);
+CREATE TABLE IF NOT EXISTS transacciones (
+    id_transaccion INTEGER PRIMARY KEY,
+    numero_cuenta_origen TEXT NOT NULL,
+    numero_cuenta_destino TEXT,
+    tipo_transaccion TEXT NOT NULL,
+    monto REAL NOT NULL,
+    fecha_hora TEXT NOT NULL,
+    descripcion TEXT,
+    estado TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trans_origen ON transacciones (numero_cuenta_origen, fecha_hora);
+CREATE INDEX IF NOT EXISTS idx_trans_destino ON transacciones (numero_cuenta_destino, fecha_hora);
+CREATE TABLE IF NOT EXISTS secuencias (
+    nombre TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generaciones (
+    tabla TEXT PRIMARY KEY,
+    origen TEXT NOT NULL,
+    agregados INTEGER NOT NULL DEFAULT 0,
+    reescrituras INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Generaciones de cada ledger (tablas de POSTINGS), para leer solo la cola nueva (ver
+# leer_cola): 'agregados' cuenta las transacciones que insertan filas y 'reescrituras'
+# las que cambian o borran filas existentes; 'origen' distingue una base recreada.
+# Los IDs se reservan antes de insertar, así que una fila puede confirmarse después
+# de otra con ID mayor: el cursor anota esos huecos (los más recientes, hasta
+# MAX_HUECOS dentro de los últimos VENTANA_HUECOS IDs) y los vuelve a buscar.
+VENTANA_HUECOS = 10000
+MAX_HUECOS = 500
+
+# Una conexión por hilo; sqlite3 reutiliza los statements preparados de cada conexión
+_local = threading.local()
+
+
+def _conexion():
+    """Retorna la conexión SQLite del hilo actual (creándola si hace falta)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(SQLITE_PATH, isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(ESQUEMA)
+        for filename in POSTINGS:
+            conn.execute(
+                "INSERT OR IGNORE INTO generaciones (tabla, origen) VALUES (?, ?)",
+                (TABLAS[filename]['tabla'], os.urandom(8).hex())
+            )
+        _local.conn = conn
+    return conn
+
+
+def _marcar(conn, filename, columna):
+    """Cuenta en la transacción abierta un cambio de un ledger ('agregados' o 'reescrituras')"""
+    if filename in POSTINGS:
+        conn.execute(
+            f"UPDATE generaciones SET {columna} = {columna} + 1 WHERE tabla = ?", (TABLAS[filename]['tabla'],)
+        )
+
+
+def precargar():
+    """Abre la conexión y crea el esquema; los índices los mantiene SQLite"""
+    _conexion()
+
+
+def recuperar():
+    """SQLite recupera las transacciones confirmadas con su propio WAL al abrir la base"""
+    _conexion()
+    return 0
+
+
+def checkpoint(incluir=()):
+    """Traslada el WAL de SQLite al archivo de la base"""
+    _conexion().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _tabla(filename):
+    """Retorna la definición de tabla para un nombre de archivo"""
+    try:
+        return TABLAS[filename]
+    except KeyError:
+        raise ValueError(f"No hay tabla SQLite para '{filename}'")
+
+
+def _a_registro(definicion, fila):
+    """Convierte una fila de SQLite al diccionario que usan los modelos"""
+    registro = {}
+    for columna in definicion['columnas']:
+        valor = fila[columna]
+        if valor is None and columna in definicion['opcionales']:
+            continue
+        registro[columna] = valor
+    if fila['extra']:
+        registro.update(json.loads(fila['extra']))
+    return registro
+
+
+def _a_fila(definicion, item):
+    """Separa un registro en valores de columnas y el JSON de campos extra"""
+    valores = [item.get(columna) for columna in definicion['columnas']]
+    extra = {k: v for k, v in item.items() if k not in definicion['columnas']}
+    valores.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+    return valores
+
+
+def _sql_insert(definicion):
+    columnas = definicion['columnas'] + ['extra']
+    marcas = ', '.join('?' for _ in columnas)
+    return f"INSERT INTO {definicion['tabla']} ({', '.join(columnas)}) VALUES ({marcas})"
+
+
+def read_json(filename):
+    """Retorna todos los registros de la tabla"""
+    return list(iter_json(filename))
+
+
+def iter_json(filename):
+    """Recorre los registros de la tabla con un cursor, sin cargarlos todos"""
+    definicion = _tabla(filename)
+    cursor = _conexion().execute(
+        f"SELECT * FROM {definicion['tabla']} ORDER BY {definicion['pk']}"
+    )
+    for fila in cursor:
+        yield _a_registro(definicion, fila)
+
+
+def write_json(filename, data):
+    """Reemplaza el contenido completo de la tabla (en una sola transacción)"""
+    definicion = _tabla(filename)
+    conn = _conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DELETE FROM {definicion['tabla']}")
+        conn.executemany(_sql_insert(definicion), (_a_fila(definicion, item) for item in data))
+        _marcar(conn, filename, 'reescrituras')
+
+
+def reserve_ids(filename, cantidad, id_field='id'):
+    """Reserva un bloque de IDs consecutivos en la tabla `secuencias` y retorna el primero"""
+    if cantidad < 1:
+        raise ValueError("La cantidad de IDs a reservar debe ser al menos 1")
+    definicion = _tabla(filename)
+    conn = _conexion()
+    with conn:
+        # BEGIN IMMEDIATE toma el lock de escritura: seguro entre hilos y procesos
+        conn.execute("BEGIN IMMEDIATE")
+        fila = conn.execute(
+            "SELECT valor FROM secuencias WHERE nombre = ?", (definicion['tabla'],)
+        ).fetchone()
+        if fila is None:
+            actual = conn.execute(
+                f"SELECT COALESCE(MAX({definicion['pk']}), 0) FROM {definicion['tabla']}"
+            ).fetchone()[0]
+        else:
+            actual = fila['valor']
+        conn.execute(
+            "INSERT OR REPLACE INTO secuencias (nombre, valor) VALUES (?, ?)",
+            (definicion['tabla'], actual + cantidad)
+        )
+    return actual + 1
+
+
+def get_next_id(filename, id_field='id'):
+    """Obtiene (y reserva) el siguiente ID disponible"""
+    return reserve_ids(filename, 1, id_field)
+
+
+def _buscar(filename, campo, valor):
+    definicion = _tabla(filename)
+    if campo not in definicion['columnas']:
+        # Campo sin columna (vive en `extra`): búsqueda lineal
+        return next((r for r in iter_json(filename) if r.get(campo) == valor), None)
+    fila = _conexion().execute(
+        f"SELECT * FROM {definicion['tabla']} WHERE {campo} = ? LIMIT 1", (valor,)
+    ).fetchone()
+    return _a_registro(definicion, fila) if fila else None
+
+
+def find_by_id(filename, id_value, id_field='id', solo_lectura=False):
+    """Busca un elemento por ID (con solo_lectura=True, como vista inmutable)"""
+    item = _buscar(filename, id_field, id_value)
+    return MappingProxyType(item) if solo_lectura and item is not None else item
+
+
+def find_by_field(filename, field_name, field_value):
+    """Busca un elemento por un campo específico"""
+    return _buscar(filename, field_name, field_value)
+
+
+def find_all_by_field(filename, field_name, field_value):
+    """Busca todos los elementos con un valor en un campo específico"""
+    definicion = _tabla(filename)
+    if field_name not in definicion['columnas']:
+        return [r for r in iter_json(filename) if r.get(field_name) == field_value]
+    cursor = _conexion().execute(
+        f"SELECT * FROM {definicion['tabla']} WHERE {field_name} = ? ORDER BY {definicion['pk']}",
+        (field_value,)
+    )
+    return [_a_registro(definicion, fila) for fila in cursor]
+
+
+def iter_by_posting(filename, keys, particion=None):
+    """Recorre los registros que mencionan alguna de las claves, en orden de llegada"""
+    definicion = _tabla(filename)
+    claves = list(keys)
+    if not claves:
+        return
+    marcas = ', '.join('?' for _ in claves)
+    condicion = ' OR '.join(f"{campo} IN ({marcas})" for campo in POSTINGS[filename])
+    cursor = _conexion().execute(
+        f"SELECT * FROM {definicion['tabla']} WHERE {condicion} ORDER BY {definicion['pk']}",
+        claves * len(POSTINGS[filename])
+    )
+    for fila in cursor:
+        yield _a_registro(definicion, fila)
+
+
+def find_by_posting(filename, keys, particion=None):
+    """Retorna los registros que mencionan alguna de las claves, en orden de llegada"""
+    return list(iter_by_posting(filename, keys))
+
+
+def particiones(filename, desde=None, hasta=None):
+    """En SQLite cada colección es una sola tabla: no hay particiones"""
+    return [filename]
+
+
+def stream_json(filename, where=None, claves=None, particion=None):
+    """Recorre la tabla con un cursor aplicando el predicado `where` (las claves no aplican)"""
+    for registro in iter_json(filename):
+        if where is None or where(registro):
+            yield registro
+
+
+def _actualizar(conn, definicion, id_value, updated_data, id_field):
+    """UPDATE de una sola fila dentro de la transacción abierta. Retorna False si no existe"""
+    if id_field not in definicion['columnas']:
+        raise ValueError(f"'{id_field}' no es una columna de {definicion['tabla']}")
+    columnas = [k for k in updated_data if k in definicion['columnas']]
+    extra = {k: v for k, v in updated_data.items() if k not in definicion['columnas']}
+
+    if extra:
+        fila = conn.execute(
+            f"SELECT extra FROM {definicion['tabla']} WHERE {id_field} = ?", (id_value,)
+        ).fetchone()
+        if fila is None:
+            return False
+        actual = json.loads(fila['extra']) if fila['extra'] else {}
+        actual.update(extra)
+        columnas.append('extra')
+        updated_data = dict(updated_data, extra=json.dumps(actual, ensure_ascii=False))
+    if columnas:
+        asignaciones = ', '.join(f"{c} = ?" for c in columnas)
+        cursor = conn.execute(
+            f"UPDATE {definicion['tabla']} SET {asignaciones} WHERE {id_field} = ?",
+            [updated_data[c] for c in columnas] + [id_value]
+        )
+        if cursor.rowcount == 0:
+            return False
+    return True
+
+
+def _versionar(conn, filename, definicion, id_value, updated_data, id_field, esperada=None):
+    """Agrega a los cambios la versión siguiente de la fila (ver file_manager.VERSIONES).
+
+    La versión vive en `extra`. Retorna None si la fila no existe; con `esperada`,
+    ConflictoVersion si la fila cambió.
+    """
+    campo = VERSIONES.get(filename)
+    if not campo:
+        return updated_data
+    fila = conn.execute(
+        f"SELECT extra FROM {definicion['tabla']} WHERE {id_field} = ?", (id_value,)
+    ).fetchone()
+    if fila is None:
+        return None
+    actual = json.loads(fila['extra']).get(campo, 0) if fila['extra'] else 0
+    if esperada is not None and actual != esperada:
+        raise ConflictoVersion(filename, id_value, esperada, actual)
+    return dict(updated_data, **{campo: actual + 1})
+
+
+def update_item(filename, id_value, updated_data, id_field='id', version=None):
+    """Actualiza un elemento existente con un UPDATE de una sola fila (compare-and-swap si hay `version`)"""
+    definicion = _tabla(filename)
+    conn = _conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        updated_data = _versionar(conn, filename, definicion, id_value, updated_data, id_field, version)
+        if updated_data is None or not _actualizar(conn, definicion, id_value, updated_data, id_field):
+            return None
+        _marcar(conn, filename, 'reescrituras')
+    return _buscar(filename, id_field, id_value)
+
+
+def aplicar_lote(actualizaciones=(), agregados=()):
+    """Aplica actualizaciones e inserciones de varias tablas en una sola transacción"""
+    conn = _conexion()
+    notificaciones = []
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        total = 0
+        for filename, id_field, cambios, *versiones in actualizaciones:
+            definicion = _tabla(filename)
+            versiones = versiones[0] if versiones else {}
+            for id_value, c in cambios.items():
+                c = _versionar(conn, filename, definicion, id_value, c, id_field, versiones.get(id_value))
+                if c is None or not _actualizar(conn, definicion, id_value, c, id_field):
+                    raise ValueError(f"No existe en {filename}: {id_value}")
+            _marcar(conn, filename, 'reescrituras')
+            total += len(cambios)
+        for filename, items in agregados:
+            definicion = _tabla(filename)
+            firma_previa = _firma_append(conn, filename)
+            conn.executemany(_sql_insert(definicion), [_a_fila(definicion, item) for item in items])
+            _marcar(conn, filename, 'agregados')
+            notificaciones.append((filename, items, firma_previa, _firma_append(conn, filename)))
+            total += len(items)
+    for filename, items, firma_previa, firma_nueva in notificaciones:
+        for i, item in enumerate(items):
+            _notificar_append(filename, item, firma_previa if i == 0 else firma_nueva, firma_nueva)
+    return total
+
+
+def delete_item(filename, id_value, id_field='id'):
+    """Elimina un elemento por ID"""
+    definicion = _tabla(filename)
+    conn = _conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"DELETE FROM {definicion['tabla']} WHERE {id_field} = ?", (id_value,))
+        _marcar(conn, filename, 'reescrituras')
+    return True
+
+
+def data_signature(filename):
+    """Firma del contenido de la tabla: el mayor ID (las tablas crecen por append)"""
+    definicion = _tabla(filename)
+    return _conexion().execute(
+        f"SELECT MAX({definicion['pk']}) FROM {definicion['tabla']}"
+    ).fetchone()[0]
+
+
+def add_item(filename, item):
+    """Agrega un nuevo elemento"""
+    definicion = _tabla(filename)
+    conn = _conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        firma_previa = _firma_append(conn, filename)
+        conn.execute(_sql_insert(definicion), _a_fila(definicion, item))
+        _marcar(conn, filename, 'agregados')
+        firma_nueva = _firma_append(conn, filename)
+    _notificar_append(filename, item, firma_previa, firma_nueva)
+    return item
+
+
+def _firma_append(conn, filename):
+    """Firma que se notifica a on_append: la posición del ledger o, en otras tablas, el mayor ID"""
+    return _posicion(conn, filename) if filename in POSTINGS else data_signature(filename)
+
+
+def _posicion(conn, filename):
+    fila = conn.execute(
+        "SELECT origen, agregados, reescrituras FROM generaciones WHERE tabla = ?", (TABLAS[filename]['tabla'],)
+    ).fetchone()
+    return [fila['origen'], fila['agregados'], fila['reescrituras']]
+
+
+def posicion_ledger(filename):
+    """Posición actual de un ledger (ver file_manager.posicion_ledger): [origen, agregados, reescrituras]"""
+    return _posicion(_conexion(), filename)
+
+
+def _recortar_huecos(huecos, maximo):
+    return sorted(h for h in huecos if h > maximo - VENTANA_HUECOS)[-MAX_HUECOS:]
+
+
+def _anotar_id(huecos, maximo, id_value):
+    """Agrega un ID leído al cursor: retorna el máximo nuevo (y actualiza los huecos en sitio)"""
+    if id_value > maximo:
+        huecos.update(range(max(maximo + 1, id_value - VENTANA_HUECOS), id_value))
+        return id_value
+    huecos.discard(id_value)
+    return maximo
+
+
+@contextmanager
+def leer_cola(filename, cursor=None):
+    """Lee las filas de un ledger posteriores a `cursor` (ver file_manager.leer_cola).
+
+    El cursor anota la posición, el mayor ID leído y los huecos por debajo de él.
+    La lectura es una sola transacción, así la posición y las filas corresponden al
+    mismo estado. No hay archivo activo que se reescriba: ninguna fila es reemplazable.
+    """
+    conn = _conexion()
+    cola = ColaLedger()
+    propia = not conn.in_transaction
+    if propia:
+        conn.execute("BEGIN")
+    try:
+        cola.registros = _cola(conn, filename, cursor, cola)
+        yield cola
+    finally:
+        if propia:
+            conn.execute("COMMIT")
+
+
+def _cola(conn, filename, cursor, cola):
+    definicion = _tabla(filename)
+    tabla, pk = definicion['tabla'], definicion['pk']
+    posicion = _posicion(conn, filename)
+    if cursor is None:
+        maximo, huecos = 0, set()
+        filas = conn.execute(f"SELECT * FROM {tabla} ORDER BY {pk}")
+    elif [cursor['origen'], cursor['reescrituras']] != [posicion[0], posicion[2]]:
+        return
+    else:
+        maximo, huecos = cursor['maximo'], set(cursor['huecos'])
+        marcas = ', '.join('?' for _ in huecos)
+        filas = conn.execute(
+            f"SELECT * FROM {tabla} WHERE {pk} > ?"
+            + (f" OR {pk} IN ({marcas})" if huecos else "") + f" ORDER BY {pk}",
+            [maximo, *huecos]
+        )
+    for fila in filas:
+        maximo = _anotar_id(huecos, maximo, fila[pk])
+        if len(huecos) > 2 * VENTANA_HUECOS:
+            huecos = set(_recortar_huecos(huecos, maximo))
+        yield _a_registro(definicion, fila), False
+    cola.cursor = {'origen': posicion[0], 'agregados': posicion[1], 'reescrituras': posicion[2],
+                   'maximo': maximo, 'huecos': _recortar_huecos(huecos, maximo)}
+    cola.posicion = posicion
+
+
+def avanzar_cursor(filename, cursor, item, firma_previa, firma_nueva):
+    """Cursor después de un append notificado por on_append (ver file_manager.avanzar_cursor)"""
+    if [cursor['origen'], cursor['agregados'], cursor['reescrituras']] != firma_previa:
+        return None
+    huecos = set(cursor['huecos'])
+    maximo = _anotar_id(huecos, cursor['maximo'], item[_tabla(filename)['pk']])
+    cursor = dict(cursor, agregados=firma_nueva[1], maximo=maximo, huecos=_recortar_huecos(huecos, maximo))
+    return cursor, firma_nueva, False
+
+
+def migrar_desde_json(data_folder, tam_lote=1000):
+    """Importa los archivos data/*.json a SQLite leyendo registro por registro.
+
+    Inserta en lotes de `tam_lote` filas dentro de una sola transacción por tabla.
+    Retorna {filename: cantidad_importada}.
+    """
+    from utils.file_manager import iter_archivo
+
+    conn = _conexion()
+    resultado = {}
+    for filename, definicion in TABLAS.items():
+        total = 0
+        sql = _sql_insert(definicion).replace("INSERT", "INSERT OR REPLACE", 1)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            lote = []
+            for item in iter_archivo(os.path.join(data_folder, filename)):
+                lote.append(_a_fila(definicion, item))
+                if len(lote) >= tam_lote:
+                    conn.executemany(sql, lote)
+                    total += len(lote)
+                    lote = []
+            if lote:
+                conn.executemany(sql, lote)
+                total += len(lote)
+        resultado[filename] = total
+    # Las secuencias se vuelven a sembrar desde los IDs importados
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM secuencias")
+        for filename in TABLAS:
+            _marcar(conn, filename, 'reescrituras')
+    return resultado
@@ -0,0 +1,195 @@
+import os
+import json
+import threading
+
+from utils.file_manager import DATA_FOLDER
+
+# Write-ahead log: cada operación de escritura (add, update, delete, write) se
+# agrega como una línea JSON con su número de secuencia (lsn) y se sincroniza a
+# disco ANTES de aplicarla a los archivos de datos. Cada cierto número de
+# registros se guarda un snapshot del estado (clientes, cuentas...) y el log se
+# vacía, así un reinicio solo reaplica la cola de operaciones recientes.
+WAL_PATH = os.path.join(DATA_FOLDER, "wal.log")
+SNAPSHOT_PATH = os.path.join(DATA_FOLDER, "snapshot.json")
+
+# Registros del WAL entre un snapshot y el siguiente
+SNAPSHOT_CADA = int(os.environ.get('BANCO_SNAPSHOT_CADA', '1000'))
+
+_lock = threading.Lock()
+# {'lsn': último lsn escrito, 'snapshot_lsn': lsn del snapshot, 'archivos': set}. Se
+# descarta cuando otro proceso escribe en el WAL (ver invalidar).
+_estado = None
+_snapshot_meta = {'firma': None, 'lsn': 0, 'archivos': set()}
+
+
+def _fsync_directorio():
+    """Sincroniza el directorio de datos para que los rename sobrevivan a un corte"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(DATA_FOLDER, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def leer_snapshot():
+    """Retorna el último snapshot: {'lsn': n, 'archivos': {filename: [...]}}"""
+    try:
+        with open(SNAPSHOT_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'lsn': 0, 'archivos': {}}
+
+
+def leer_registros(desde_lsn=0):
+    """Itera los registros del WAL con lsn mayor a `desde_lsn`.
+
+    Una última línea incompleta (corte a mitad de escritura) se ignora: esa
+    operación nunca llegó a confirmarse.
+    """
+    try:
+        f = open(WAL_PATH, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        for linea in f:
+            if not linea.endswith(b'\n'):
+                break
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                break
+            if registro['lsn'] > desde_lsn:
+                yield registro
+
+
+def _firma(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _leer_meta_snapshot():
+    """lsn y archivos del snapshot vigente (solo se vuelve a parsear si cambió)"""
+    firma = _firma(SNAPSHOT_PATH)
+    if firma != _snapshot_meta['firma']:
+        snapshot = leer_snapshot()
+        _snapshot_meta.update(firma=firma, lsn=snapshot['lsn'], archivos=set(snapshot['archivos']))
+    return _snapshot_meta
+
+
+def _ultimo_lsn():
+    """lsn del último registro completo del WAL (0 si está vacío), leyendo solo la cola"""
+    try:
+        f = open(WAL_PATH, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        fin = f.seek(0, os.SEEK_END)
+        cola = b''
+        while fin > 0:
+            inicio = max(0, fin - 65536)
+            f.seek(inicio)
+            cola = f.read(fin - inicio) + cola
+            fin = inicio
+            # Lo que sigue al último '\n' es una línea cortada: no cuenta
+            ultima = cola.rfind(b'\n')
+            comienzo = cola.rfind(b'\n', 0, max(ultima, 0)) + 1
+            if ultima < 0 or (comienzo == 0 and fin > 0):
+                continue
+            try:
+                return json.loads(cola[comienzo:ultima])['lsn']
+            except json.JSONDecodeError:
+                break
+    return max((r['lsn'] for r in leer_registros()), default=0)
+
+
+def _cargar_estado():
+    global _estado
+    if _estado is None:
+        meta = _leer_meta_snapshot()
+        _estado = {
+            'lsn': max(meta['lsn'], _ultimo_lsn()),
+            'snapshot_lsn': meta['lsn'],
+            'archivos': set(meta['archivos']),
+        }
+    return _estado
+
+
+def invalidar():
+    """Descarta el estado en memoria: otro proceso escribió en el WAL o hizo un snapshot"""
+    global _estado
+    with _lock:
+        _estado = None
+
+
+def archivos_snapshot():
+    """Archivos cuyo estado completo está en el snapshot vigente"""
+    with _lock:
+        return set(_cargar_estado()['archivos'])
+
+
+def pendientes():
+    """Registros escritos en el WAL desde el último snapshot"""
+    with _lock:
+        estado = _cargar_estado()
+        return estado['lsn'] - estado['snapshot_lsn']
+
+
+def registrar(op, archivo, sync=True, **campos):
+    """Agrega una operación al WAL y la sincroniza a disco. Retorna su lsn.
+
+    Con sync=False la línea queda escrita pero sin fsync: el llamador debe llamar a
+    sincronizar() antes de confirmar la operación (group commit).
+    """
+    with _lock:
+        estado = _cargar_estado()
+        lsn = estado['lsn'] + 1
+        registro = {'lsn': lsn, 'op': op, 'archivo': archivo}
+        registro.update(campos)
+        linea = json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with open(WAL_PATH, 'ab') as f:
+            f.write(linea.encode('utf-8'))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        estado['lsn'] = lsn
+        return lsn
+
+
+def sincronizar():
+    """Sincroniza a disco (un solo fsync) todos los registros escritos con sync=False"""
+    with _lock:
+        try:
+            with open(WAL_PATH, 'rb') as f:
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            pass
+
+
+def escribir_snapshot(archivos, ledgers=None):
+    """Guarda el estado completo de `archivos` ({filename: [...]}) y vacía el WAL.
+
+    El snapshot queda marcado con el último lsn: si hay un corte entre el
+    snapshot y el vaciado del WAL, la recuperación ignora los registros viejos.
+    `ledgers` guarda el tamaño en bytes de cada ledger JSON Lines en ese momento.
+    """
+    with _lock:
+        estado = _cargar_estado()
+        tmp_path = SNAPSHOT_PATH + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'lsn': estado['lsn'], 'archivos': archivos, 'ledgers': ledgers or {}}, f,
+                      ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SNAPSHOT_PATH)
+
+        with open(WAL_PATH, 'wb') as f:
+            os.fsync(f.fileno())
+        _fsync_directorio()
+        estado['snapshot_lsn'] = estado['lsn']
+        estado['archivos'] = set(archivos)
+        _snapshot_meta.update(firma=_firma(SNAPSHOT_PATH), lsn=estado['lsn'], archivos=set(archivos))